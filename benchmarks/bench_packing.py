@@ -0,0 +1,37 @@
+# Throughput benchmark for the synth packing functions.
+# Prints patches per second for unpacking and packing.
+
+import os
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'synth_controller'))
+
+from synths.packing_functions import mopho_pack, mopho_unpack
+
+SYSEX_FILE = os.path.join(BENCH_DIR, '..', 'tests', 'm_test.sysex')
+BATCH = 384  # a full mopho library: 3 banks of 128 programs
+
+
+def run(repeat=5):
+    """return dict of patches per second for each direction"""
+    with open(SYSEX_FILE, "rb") as fo:
+        packed = fo.read()[6:-1]
+    unpacked = mopho_unpack(packed)
+    packed_bank = [packed] * BATCH
+    unpacked_bank = [unpacked] * BATCH
+
+    tests = {
+        'unpack': lambda: [mopho_unpack(p) for p in packed_bank],
+        'pack': lambda: [mopho_pack(p) for p in unpacked_bank],
+    }
+    results = {}
+    for name, test in tests.items():
+        best = min(timeit.repeat(test, number=1, repeat=repeat))
+        results[name] = BATCH / best
+    return results
+
+if __name__ == '__main__':
+    for name, rate in run().items():
+        print(f"{name:12} {rate:12.0f} patches/s")
@@ -0,0 +1,408 @@
+# End-to-end benchmark suite, runs headless.
+# Measures packing throughput, setting a full patch, similar patch search,
+# inbound nrpn latency, outgoing drag-to-wire message rate and app startup
+# time, and writes the results as JSON so they can be compared between
+# commits:
+#
+#   python benchmarks/run.py                    write results/<commit>.json
+#   python benchmarks/run.py -o out.json
+#   python benchmarks/run.py --compare old.json new.json
+#
+# Parts needing kivy are recorded as skipped when it is not installed.
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(BENCH_DIR, '..', 'synth_controller')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, CONTROLLER_DIR)
+
+import bench_packing
+from midi import Midi
+from midi_emulator import EmulatedMopho
+import patch_similarity
+from setup_manager import SetupManager
+from synth_manager import SynthData
+from synth_state import SynthState
+from synths.packing_functions import mopho_unpack
+
+try:
+    import kivy
+except ImportError:
+    kivy = None
+
+SYNTH = 'mopho'
+SYSEX_FILE = os.path.join(BENCH_DIR, '..', 'tests', 'm_test2.sysex')
+SYNTH_FILE = os.path.join(CONTROLLER_DIR, 'synths', 'mopho.json')
+KNOB_TURNS = 200
+LIBRARY_PATCHES = 20000
+DRAG_TIME = 1.0
+FRAME_RATE = 60
+# seconds between polls of midi input when timing its latency, short so
+# the wait adds little but the midi input thread is not starved
+POLL_INTERVAL = 0.0001
+
+
+class HeadlessUi(object):
+    """Enough of the ui for SetupManager to read the bundled setup"""
+    def bind(self, **kwargs):
+        pass
+
+    def channel_selection_popup(self, channels):
+        pass
+
+
+def setup_channel(synth):
+    """return synth's zero based channel in the bundled setup, assigned
+    the way main.py does"""
+    cwd = os.getcwd()
+    os.chdir(CONTROLLER_DIR)
+    try:
+        setup_manager = SetupManager(HeadlessUi())
+    finally:
+        os.chdir(cwd)
+    setup_manager.assign_channels([synth])
+    return setup_manager.channels[synth]
+
+
+CHANNEL = setup_channel(SYNTH)
+
+
+class CountingMopho(EmulatedMopho):
+    """Emulated mopho noting when each nrpn arrives"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.arrivals = []
+
+    def send_nrpn(self, channel, nrpn, value):
+        super().send_nrpn(channel, nrpn, value)
+        self.arrivals.append((time.monotonic(), nrpn, value))
+
+
+def load_patch():
+    """return unpacked patch data and the mopho's synth data"""
+    with open(SYSEX_FILE, 'rb') as fo:
+        dump = fo.read()
+    return mopho_unpack(dump[4:-1]), SynthData(SYNTH_FILE, SYNTH)
+
+
+def build_controllers():
+    """return ControllerManager for all the bundled setup's screens,
+    initialised against the emulated mopho"""
+    from ui import MainScreen
+    from controller_manager import ControllerManager
+    from synth_manager import SynthManager
+
+    class Patches(object):
+        def note_sent(self, *args):
+            pass
+
+    ui = MainScreen()
+    setup_manager = SetupManager(ui)
+    setup_manager.build_screens()
+    controller_manager = ControllerManager(ui.screens)
+    ui.bind(on_screen_built=lambda _, name, screen:\
+            controller_manager.add_screen(name, screen))
+    for name in ui.screen_files:
+        ui.get_screen(name)
+    synth_manager = SynthManager(controller_manager.synths)
+    midi = Midi(backend=CountingMopho(channel=CHANNEL))
+    controller_manager.initialise_controllers(
+        synth_manager.options_lists,
+        midi,
+        Patches()
+    )
+    setup_manager.assign_channels(controller_manager.synths)
+    controller_manager.set_channels(setup_manager.channels)
+    synth_manager.set_channels(setup_manager.channels)
+    return controller_manager, midi
+
+
+def bench_set_patch(repeat=5, number=100):
+    """seconds to set a full patch, alternating between two patches so
+    every value changes"""
+    data, synth = load_patch()
+    other = bytes((v + 1) & 0x7f for v in data)
+    results = {}
+
+    state = SynthState()
+    def set_state():
+        state.set_patch(synth.nrpn_index, data)
+        state.set_patch(synth.nrpn_index, other)
+    results['state set_patch'] = min(
+        timeit.repeat(set_state, number=number, repeat=repeat)
+    ) / (2 * number)
+
+    if kivy is None:
+        results['set_controller_values'] = 'skipped: kivy not installed'
+        return results
+    controller_manager, _ = build_controllers()
+    def set_controllers():
+        controller_manager.set_controller_values(
+            CHANNEL, synth.nrpn_order, data)
+        controller_manager.set_controller_values(
+            CHANNEL, synth.nrpn_order, other)
+    results['set_controller_values'] = min(
+        timeit.repeat(set_controllers, number=number, repeat=repeat)
+    ) / (2 * number)
+    return results
+
+
+def bench_similarity(patches=LIBRARY_PATCHES, k=10, repeat=5):
+    """seconds to index a library of random patches and to find the k
+    nearest to a patch, with and without numpy"""
+    data, synth = load_patch()
+    rng = random.Random(1)
+    library = [bytes(rng.randrange(128) for _ in data)
+               for _ in range(patches)]
+    weights = patch_similarity.range_weights(
+        synth.nrpn_index,
+        synth.n_parameters,
+        {nrpn: (0, 127) for nrpn in synth.nrpn_order[:100]}
+    )
+    results = {}
+    for name, use_numpy in (('python', False), ('numpy', True)):
+        if use_numpy and patch_similarity.numpy is None:
+            results[name] = 'skipped: numpy not installed'
+            continue
+        index = patch_similarity.SimilarityIndex(weights, use_numpy)
+        start = time.perf_counter()
+        for patch_id, patch in enumerate(library):
+            index.add(patch_id, patch)
+        results[name] = {
+            'index': time.perf_counter() - start,
+            'nearest': min(timeit.repeat(
+                lambda: index.nearest(data, k),
+                number=1,
+                repeat=repeat
+            )),
+        }
+    return results
+
+
+def _latency(midi, synth, arrived, turns=KNOB_TURNS):
+    """turn knobs on the emulated synth, polling input every
+    POLL_INTERVAL. Sleeping between polls lets the midi input thread run,
+    rather than waiting for the interpreter to switch threads.
+    return median and worst seconds from turn to arrival"""
+    latencies = []
+    for i in range(turns):
+        nrpn = i % 100
+        value = i % 128
+        arrived.clear()
+        start = time.monotonic()
+        synth.turn_knob(nrpn, value)
+        while not arrived:
+            time.sleep(POLL_INTERVAL)
+            midi.process_input()
+        latencies.append(arrived[0] - start)
+    latencies.sort()
+    return {
+        'median': latencies[len(latencies) // 2],
+        'worst': latencies[-1],
+    }
+
+
+def bench_inbound_latency():
+    """seconds from an nrpn leaving the synth to reaching its view"""
+    results = {}
+    synth = EmulatedMopho(channel=CHANNEL, echo=False)
+    midi = Midi(backend=synth)
+    state = SynthState()
+    arrived = []
+    for nrpn in range(100):
+        state.bind(nrpn, lambda value: arrived.append(time.monotonic()))
+    midi.set_callbacks(lambda channel, nrpn, value: state.set(nrpn, value))
+    results['to state'] = _latency(midi, synth, arrived)
+
+    if kivy is None:
+        results['to widget'] = 'skipped: kivy not installed'
+        return results
+    controller_manager, midi = build_controllers()
+    synth = midi.backend
+    synth.echo = False
+    arrived = []
+    state = controller_manager.get_state(SYNTH)
+    for nrpn in range(100):
+        state.bind(nrpn, lambda value: arrived.append(time.monotonic()))
+    midi.set_callbacks(controller_manager.set_controller_value)
+    results['to widget'] = _latency(midi, synth, arrived)
+    return results
+
+
+def _drag(send, nrpn, drag_time=DRAG_TIME, frame_rate=FRAME_RATE):
+    """move a parameter through its range once a frame for drag_time"""
+    frames = int(drag_time * frame_rate)
+    for frame in range(frames):
+        time.sleep(1 / frame_rate)
+        send(nrpn, frame * 127 // (frames - 1))
+    return time.monotonic()
+
+
+def _drag_results(synth, start, drag_end, nrpn):
+    """wait for the last drag value to arrive, return rate and lag"""
+    last = (nrpn, 127)
+    timeout = time.monotonic() + 2.0
+    while time.monotonic() < timeout\
+          and (not synth.arrivals or synth.arrivals[-1][1:] != last):
+        time.sleep(0.001)
+    arrivals = [a for a in synth.arrivals if a[1] == nrpn]
+    if not arrivals or arrivals[-1][1:] != last:
+        return {'error': 'last value not received'}
+    return {
+        'messages': len(arrivals),
+        'messages per second': len(arrivals) / (arrivals[-1][0] - start),
+        'last value lag': arrivals[-1][0] - drag_end,
+    }
+
+
+def bench_drag_to_wire(nrpn=20):
+    """rate nrpns reach a throttled synth while a parameter is dragged"""
+    results = {}
+    synth = CountingMopho(channel=CHANNEL, echo=False, throttle=True)
+    midi = Midi(backend=synth)
+    start = time.monotonic()
+    drag_end = _drag(
+        lambda nrpn, value: midi.send_nrpn(CHANNEL, nrpn, value), nrpn)
+    results['midi'] = _drag_results(synth, start, drag_end, nrpn)
+
+    if kivy is None:
+        results['controller'] = 'skipped: kivy not installed'
+        return results
+    controller_manager, midi = build_controllers()
+    synth = midi.backend
+    synth.echo = False
+    synth.throttle = True
+    controller = controller_manager.synth_index[SYNTH][nrpn][0]
+    def move(nrpn, value):
+        controller.midi_value = value
+    start = time.monotonic()
+    drag_end = _drag(move, nrpn)
+    results['controller'] = _drag_results(synth, start, drag_end, nrpn)
+    return results
+
+
+def bench_startup():
+    """seconds from MainApp.__init__ to the first frame, using the
+    emulated mopho in place of alsa midi"""
+    if kivy is None:
+        return 'skipped: kivy not installed'
+    from kivy.clock import Clock
+    import main
+    import midi_emulator
+
+    class EmulatedMidi(Midi):
+        def __init__(self, *args, **kwargs):
+            kwargs['backend'] = midi_emulator.EmulatedMopho(channel=CHANNEL)
+            super().__init__(*args, **kwargs)
+
+    main.Midi = EmulatedMidi
+    times = {}
+
+    class TimedApp(main.MainApp):
+        def on_start(self):
+            super().on_start()
+            Clock.schedule_once(self.first_frame, 0)
+
+        def first_frame(self, *args):
+            times['first frame'] = time.monotonic()
+            self.stop()
+
+    start = time.monotonic()
+    TimedApp().run()
+    return times['first frame'] - start
+
+
+def commit():
+    """return the current git commit, or None"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run():
+    """run every benchmark, return results dict"""
+    os.chdir(CONTROLLER_DIR)
+    return {
+        'commit': commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': {
+            'packing (patches/s)': bench_packing.run(),
+            'set patch (s)': bench_set_patch(),
+            'similar patches (s)': bench_similarity(),
+            'inbound latency (s)': bench_inbound_latency(),
+            'drag to wire': bench_drag_to_wire(),
+            'startup (s)': bench_startup(),
+        },
+    }
+
+
+def flatten(results, prefix=''):
+    """return dict of 'a/b/c' names to numbers from nested results"""
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + name + '/'))
+        elif isinstance(value, (int, float)):
+            flat[prefix + name] = value
+    return flat
+
+
+def compare(old_file, new_file):
+    """print each result from two runs with the ratio new/old"""
+    with open(old_file) as fo:
+        old = json.load(fo)
+    with open(new_file) as fo:
+        new = json.load(fo)
+    old_results = flatten(old['results'])
+    new_results = flatten(new['results'])
+    print(f"{'':50} {str(old['commit'] or '-'):>12}"
+          f" {str(new['commit'] or '-'):>12}")
+    for name, value in new_results.items():
+        if name in old_results and old_results[name]:
+            ratio = value / old_results[name]
+            print(f"{name:50} {old_results[name]:12.6g} {value:12.6g}"
+                  f" {ratio:8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument('-o', '--output', help="results file")
+    parser.add_argument(
+        '--compare',
+        nargs=2,
+        metavar=('OLD', 'NEW'),
+        help="compare two results files"
+    )
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    output = args.output and os.path.abspath(args.output)
+    results = run()
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    with open(output, 'w') as fo:
+        json.dump(results, fo, indent=4)
+    print(json.dumps(results['results'], indent=4))
+    print(f"written to {output}")
+
+if __name__ == '__main__':
+    main()
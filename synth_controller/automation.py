@@ -0,0 +1,171 @@
+import mmap
+import struct
+import threading
+import time
+
+# An automation file is a header followed by fixed width records, one per
+# nrpn: seconds since recording started, direction, channel, nrpn, value.
+HEADER = struct.Struct('<8sII')
+MAGIC = b'SCAUTO01'
+RECORD = struct.Struct('<dBBHHxx')
+IN = 0
+OUT = 1
+BUFFER_RECORDS = 4096  # records held in memory before writing
+SPIN_TIME = 0.002  # seconds before an event to stop sleeping and spin
+
+def wait_until(due, stopped, clock=time.perf_counter):
+    """Sleep until just before clock reaches due, then spin until it does.
+    Return False if the stopped event is set first"""
+    delay = due - clock() - SPIN_TIME
+    if delay > 0 and stopped.wait(delay):
+        return False
+    if stopped.is_set():
+        return False
+    while clock() < due:
+        pass
+    return True
+
+class AutomationRecorder(object):
+    """Appends timestamped nrpns to an automation file.
+
+    Records are packed into one of two preallocated buffers, so recording
+    does not allocate per event and can be called from the midi threads.
+    Full buffers are written to the file by a writer thread. If both
+    buffers are full, records are dropped and counted."""
+    def __init__(self, filename, buffer_records=BUFFER_RECORDS,
+                 clock=time.perf_counter):
+        self.clock = clock
+        self.file = open(filename, 'wb')
+        self.file.write(HEADER.pack(MAGIC, RECORD.size, 0))
+        self.buffers = [bytearray(buffer_records * RECORD.size),
+                        bytearray(buffer_records * RECORD.size)]
+        self.buffer_size = buffer_records * RECORD.size
+        self.current = 0
+        self.offset = 0
+        self.full = None
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.written = threading.Event()
+        self.written.set()
+        self.running = True
+        self.start_time = clock()
+
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+    def record(self, direction, channel, nrpn, value):
+        """record an nrpn seen now going in direction IN or OUT"""
+        with self.lock:
+            if not self.running:
+                return
+            if self.offset == self.buffer_size:
+                if not self.written.is_set():
+                    self.dropped += 1
+                    return
+                self.written.clear()
+                self.full = self.current
+                self.current = 1 - self.current
+                self.offset = 0
+                self.ready.set()
+            RECORD.pack_into(
+                self.buffers[self.current],
+                self.offset,
+                self.clock() - self.start_time,
+                direction,
+                channel,
+                nrpn,
+                value
+            )
+            self.offset += RECORD.size
+
+    def _write(self):
+        """write full buffers to the file"""
+        while True:
+            self.ready.wait()
+            self.ready.clear()
+            if self.full is not None:
+                self.file.write(self.buffers[self.full])
+                self.full = None
+                self.written.set()
+            if not self.running:
+                return
+
+    def close(self):
+        """write remaining records and close the file"""
+        with self.lock:
+            self.running = False
+            offset = self.offset
+        self.ready.set()
+        self.writer.join()
+        self.file.write(memoryview(self.buffers[self.current])[:offset])
+        self.file.close()
+
+class AutomationFile(object):
+    """Read only view of the records of an automation file, memory
+    mapped"""
+    def __init__(self, filename):
+        with open(filename, 'rb') as fo:
+            magic, record_size, _ = HEADER.unpack(fo.read(HEADER.size))
+            if magic != MAGIC or record_size != RECORD.size:
+                raise AutomationFileError(filename)
+            self.map = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self.map)
+        # a partly written last record is ignored
+        self.count = (size - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        """return (time, direction, channel, nrpn, value) of record i"""
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return RECORD.unpack_from(self.map, HEADER.size + i * RECORD.size)
+
+    def close(self):
+        self.map.close()
+
+class AutomationPlayer(object):
+    """Replays the nrpns of an automation file in time.
+
+    Sleeps until just before each event then spins until it is due, to
+    keep timing jitter low. The largest lateness is kept."""
+    def __init__(self, filename, send, directions=(IN,),
+                 clock=time.perf_counter):
+        """send - function(channel, nrpn, value) to send each nrpn.
+        directions - which recorded directions to replay"""
+        self.automation = AutomationFile(filename)
+        self.send = send
+        self.directions = directions
+        self.clock = clock
+        self.max_lateness = 0.0
+        self.stopped = threading.Event()
+        self.done = threading.Event()
+
+    def start(self):
+        """start replay on its own thread"""
+        thread = threading.Thread(target=self.play, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def play(self):
+        """replay every event, returning when finished or stopped"""
+        start = self.clock()
+        for i in range(len(self.automation)):
+            when, direction, channel, nrpn, value = self.automation[i]
+            if direction not in self.directions:
+                continue
+            due = start + when
+            if not wait_until(due, self.stopped, self.clock):
+                break
+            self.max_lateness = max(self.max_lateness, self.clock() - due)
+            self.send(channel, nrpn, value)
+        self.automation.close()
+        self.done.set()
+
+class AutomationFileError(Exception):
+    pass
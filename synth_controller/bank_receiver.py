@@ -0,0 +1,99 @@
+import time
+
+WINDOW = 4
+TIMEOUT = 2.0
+RETRIES = 3
+
+class BankReceiver(object):
+    """Receives whole banks of programs from a synth.
+
+    Program dump requests are pipelined, with up to 'window' requests
+    awaiting replies at once. Replies are matched by bank and program,
+    requests not answered within 'timeout' seconds are resent up to
+    'retries' times.
+    Call parse_sysex with incoming sysex messages and update regularly
+    to resend timed out requests."""
+    def __init__(
+            self,
+            programs,
+            request,
+            header,
+            send_sysex,
+            on_progress=None,
+            on_complete=None,
+            window=WINDOW,
+            timeout=TIMEOUT,
+            retries=RETRIES
+        ):
+        """programs - list of (bank, program) tuples to receive.
+        request - program dump request header, bank and program are added.
+        header - program dump header, followed by bank and program.
+        on_progress - function(received, total).
+        on_complete - function(programs, failed), programs is a dict of
+                      packed data with (bank, program) as key, failed is a
+                      list of (bank, program) that were not received."""
+        self.waiting = list(reversed(programs))
+        self.total = len(programs)
+        self.request = request
+        self.header = header
+        self.send_sysex = send_sysex
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.in_flight = {}
+        self.attempts = {}
+        self.programs = {}
+        self.failed = []
+        self.done = False
+
+    def start(self, now=None):
+        """send the first window of requests"""
+        self._fill_window(time.monotonic() if now is None else now)
+
+    def _send_request(self, program, now):
+        """send a program dump request, note when it was sent"""
+        self.attempts[program] = self.attempts.get(program, 0) + 1
+        self.in_flight[program] = now
+        self.send_sysex(b'\xf0' + self.request + bytes(program) + b'\xf7')
+
+    def _fill_window(self, now):
+        """send requests until window full, finish if nothing left"""
+        while self.waiting and len(self.in_flight) < self.window:
+            self._send_request(self.waiting.pop(), now)
+        if not self.waiting and not self.in_flight and not self.done:
+            self.done = True
+            if self.on_complete:
+                self.on_complete(self.programs, self.failed)
+
+    def parse_sysex(self, message, now=None):
+        """Store message if it is a reply to an outstanding request.
+        Return true if message was used."""
+        start = len(self.header) + 1
+        if len(message) < start + 3\
+           or self.header != message[1:start]:
+            return False
+        program = (message[start], message[start + 1])
+        if program not in self.in_flight:
+            return False
+
+        del self.in_flight[program]
+        self.programs[program] = bytes(message[start + 2:-1])
+        if self.on_progress:
+            self.on_progress(len(self.programs), self.total)
+        self._fill_window(time.monotonic() if now is None else now)
+        return True
+
+    def update(self, now=None):
+        """resend or give up on timed out requests"""
+        if now is None:
+            now = time.monotonic()
+        for program, sent in list(self.in_flight.items()):
+            if now - sent > self.timeout:
+                if self.attempts[program] <= self.retries:
+                    self._send_request(program, now)
+                else:
+                    del self.in_flight[program]
+                    self.failed.append(program)
+        self._fill_window(now)
@@ -0,0 +1,239 @@
+# Command line tools for patch files, runs without kivy or a display.
+#
+#   python cli.py decode PATH... [--format json|csv] [-o OUTPUT]
+#   python cli.py encode JSON_FILE [-o OUTPUT]
+#   python cli.py validate PATH...
+#
+# Directories given as paths are searched for patch files, which are
+# processed in parallel.
+
+from synth_manager import SynthManager, IncorrectSynthError
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import json
+import os
+import sys
+
+SYNTHS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'synths')
+PATCH_EXTENSION = '.sysex'
+CHUNK_SIZE = 16
+
+_synth_manager = None
+
+def get_synth_manager():
+    """Return a SynthManager for every synth definition, one per process"""
+    global _synth_manager
+    if _synth_manager is None:
+        synths = [f[:-5] for f in os.listdir(SYNTHS_DIR) if f[-5:] == '.json']
+        _synth_manager = SynthManager(synths, SYNTHS_DIR)
+    return _synth_manager
+
+def find_files(paths):
+    """Return list of patch files in paths, searching directories"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, filenames in sorted(os.walk(path)):
+                files.extend(os.path.join(directory, f)
+                             for f in sorted(filenames)
+                             if f.endswith(PATCH_EXTENSION))
+        else:
+            files.append(path)
+    return files
+
+def decode_message(message):
+    """Return synth and unpacked data of a patch or program dump message.
+    Raises IncorrectSynthError if no synth definition matches"""
+    synth_manager = get_synth_manager()
+    for synth, synth_data in synth_manager.synths.items():
+        if synth_data and synth_data.patchable:
+            for unpack in (synth_manager.unpack, synth_manager.unpack_program):
+                try:
+                    return synth, unpack(synth, message[1:-1])
+                except IncorrectSynthError:
+                    pass
+    raise IncorrectSynthError
+
+def decode_file(filename):
+    """Return dict of synth, name, parameter values by nrpn and option names
+    by nrpn of patch file"""
+    synth_manager = get_synth_manager()
+    with open(filename, "rb") as fo:
+        synth, data = decode_message(fo.read())
+
+    parameters = {}
+    options = {}
+    for nrpn, i in sorted(synth_manager.get_index(synth).items()):
+        parameters[nrpn] = data[i]
+        option = synth_manager.get_option(synth, nrpn, data[i])
+        if option is not None:
+            options[nrpn] = option
+
+    return {
+        'file': filename,
+        'synth': synth,
+        'name': synth_manager.get_patch_name(synth, data),
+        'parameters': parameters,
+        'options': options,
+    }
+
+def encode_patch(patch):
+    """Return patch sysex message from a dict as returned by decode_file.
+    Parameters not given are 0"""
+    synth_manager = get_synth_manager()
+    synth = patch['synth']
+    index = synth_manager.get_index(synth)
+    data = bytearray(len(synth_manager.get_order(synth)))
+    for nrpn, value in patch['parameters'].items():
+        data[index[int(nrpn)]] = value
+    return b'\xf0' + synth_manager.get_header(synth)\
+           + synth_manager.pack(synth, data) + b'\xf7'
+
+def validate_file(filename):
+    """Return list of problems found with patch file"""
+    with open(filename, "rb") as fo:
+        message = fo.read()
+    if len(message) < 2 or message[0] != 0xf0 or message[-1] != 0xf7:
+        return ["not a sysex message"]
+    if any(byte & 0x80 for byte in message[1:-1]):
+        return ["data byte with top bit set"]
+    try:
+        synth, data = decode_message(message)
+    except IncorrectSynthError:
+        return ["not a patch for a known synth"]
+
+    synth_manager = get_synth_manager()
+    problems = []
+    expected = len(synth_manager.get_order(synth))
+    if len(data) != expected:
+        problems.append(f"{len(data)} parameters, expected {expected}")
+    packed = synth_manager.pack(synth, data)
+    if not message[1:-1].endswith(packed):
+        problems.append("does not re-encode to the same data")
+    return problems
+
+def _run(function, filename):
+    """call function with filename, return (result, error)"""
+    try:
+        return function(filename), None
+    except (OSError, ValueError, IndexError, IncorrectSynthError) as error:
+        return None, f"{filename}: {error or type(error).__name__}"
+
+def _decode(filename):
+    return _run(decode_file, filename)
+
+def _validate(filename):
+    return _run(validate_file, filename)
+
+def process(function, files, jobs):
+    """Return list of function(file) for files, in a process pool if
+    more than one job"""
+    if jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(function, files, chunksize=CHUNK_SIZE))
+    return [function(f) for f in files]
+
+def _open_output(output):
+    return open(output, "w", newline='') if output else sys.stdout
+
+def decode(args):
+    files = find_files(args.paths)
+    patches = []
+    failed = False
+    for patch, error in process(_decode, files, args.jobs):
+        if error:
+            print(error, file=sys.stderr)
+            failed = True
+        else:
+            patches.append(patch)
+
+    fo = _open_output(args.output)
+    if args.format == 'csv':
+        nrpns = sorted(set(n for p in patches for n in p['parameters']))
+        writer = csv.writer(fo)
+        writer.writerow(['file', 'synth', 'name'] + nrpns)
+        for patch in patches:
+            writer.writerow(
+                [patch['file'], patch['synth'], patch['name']]
+                + [patch['parameters'].get(n, '') for n in nrpns]
+            )
+    else:
+        json.dump(patches[0] if len(files) == 1 and patches else patches,
+                  fo, indent=4)
+        fo.write('\n')
+    if fo is not sys.stdout:
+        fo.close()
+    return 1 if failed else 0
+
+def encode(args):
+    with open(args.json_file) as fo:
+        patches = json.load(fo)
+
+    if isinstance(patches, dict):
+        message = encode_patch(patches)
+        if args.output:
+            with open(args.output, "wb") as fo:
+                fo.write(message)
+        else:
+            sys.stdout.buffer.write(message)
+        return 0
+
+    if not args.output:
+        print("a directory must be given to encode a list", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+    for i, patch in enumerate(patches):
+        name = os.path.basename(patch.get('file', '')) or f"{i:04}.sysex"
+        with open(os.path.join(args.output, name), "wb") as fo:
+            fo.write(encode_patch(patch))
+    return 0
+
+def validate(args):
+    files = find_files(args.paths)
+    failed = False
+    for filename, (problems, error) in zip(
+            files,
+            process(_validate, files, args.jobs)
+        ):
+        if error:
+            problems = [error]
+        if problems:
+            failed = True
+            print(f"{filename}: {'; '.join(problems)}")
+        elif not args.quiet:
+            print(f"{filename}: ok")
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synth patch file tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    decoder = commands.add_parser('decode', help="patch files to json or csv")
+    decoder.add_argument('paths', nargs='+')
+    decoder.add_argument('--format', choices=('json', 'csv'), default='json')
+    decoder.add_argument('-o', '--output')
+    decoder.set_defaults(function=decode)
+
+    encoder = commands.add_parser('encode', help="json to patch files")
+    encoder.add_argument('json_file')
+    encoder.add_argument('-o', '--output',
+                         help="file, or directory when encoding a list")
+    encoder.set_defaults(function=encode)
+
+    validator = commands.add_parser('validate', help="check patch files")
+    validator.add_argument('paths', nargs='+')
+    validator.add_argument('-q', '--quiet', action='store_true',
+                           help="only list files with problems")
+    validator.set_defaults(function=validate)
+
+    for command in (decoder, validator):
+        command.add_argument('-j', '--jobs', type=int,
+                             default=os.cpu_count() or 1)
+
+    args = parser.parse_args(argv)
+    return args.function(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,45 +1,65 @@
 
 from controllers import BaseController, RadioController,\
                         RadioButton, DropDownController,\
-                        UtilityController
+                        ToggleController, UtilityController,\
+                        LibraryController
+from synth_state import SynthState
+from undo_journal import UndoJournal
 
 
 class ControllerManager(object):
     """Manages controllers"""
 
     def __init__(self, screens):
-        """walk screens widget trees and keep reference of all controllers.""" 
-        self.screens = screens
+        """walk screens widget trees and keep reference of all controllers.
+        screens built later are added with add_screen.""" 
+        self.screens = {}
         self.controllers = []
-        for screen in self.screens.values():
-            self._walk_tree(screen, self._collect_controllers)
-        self._propigate_properties()      
+        # controllers added since initialise_controllers was last called
+        self.new_controllers = []
+        self.channel_index = {}
+        self.synth_index = {}
+        self.channel_synths = {}
+        self.states = {}
+        self.journals = {}
+        for name, screen in screens.items():
+            self.add_screen(name, screen)
 
-    def _propigate_properties(self):
+    def add_screen(self, name, screen):
+        """walk a newly built screen's widget tree and keep reference of its
+        controllers. they are set up on the next call to
+        initialise_controllers."""
+        self.screens[name] = screen
+        found = []
+        self._walk_tree(screen, self._collect_controllers, None, found)
+        self.controllers += found
+        self.new_controllers += found
+        self._propigate_properties(screen)
+
+    def _propigate_properties(self, screen):
         """propigate synth and nrpn properties to all widget's children
         who do not have property set"""
-        for screen in self.screens.values():
-            self._walk_tree(
-                        screen,
-                        self._propigate_property_if_type,
-                        'default',
-                        'synth',
-                        BaseController
-                    )
-            self._walk_tree(
-                        screen,
-                        self._propigate_property_if_type,
-                        'default',
-                        'synth',
-                        UtilityController
-                    )
-            self._walk_tree(
-                        screen,
-                        self._propigate_property_if_type,
-                        None,
-                        'nrpn',
-                        BaseController
-                    )
+        self._walk_tree(
+                    screen,
+                    self._propigate_property_if_type,
+                    'default',
+                    'synth',
+                    BaseController
+                )
+        self._walk_tree(
+                    screen,
+                    self._propigate_property_if_type,
+                    'default',
+                    'synth',
+                    UtilityController
+                )
+        self._walk_tree(
+                    screen,
+                    self._propigate_property_if_type,
+                    None,
+                    'nrpn',
+                    BaseController
+                )
 
     @property
     def synths(self):
@@ -48,9 +68,13 @@ class ControllerManager(object):
 
     def set_channels(self, channels):
         """set channel for each controller according to its synth as set in
-        'channels' dict"""
+        'channels' dict. controllers of synths not in channels keep their
+        channel"""
         for controller in self.controllers:
-            controller.channel = channels[controller.synth]
+            if channels.get(controller.synth) is not None:
+                controller.channel = channels[controller.synth]
+        self._build_index()
+        self._link_controllers()
     
     def initialise_controllers(
             self,
@@ -58,25 +82,36 @@ class ControllerManager(object):
             midi,
             patch_manager
         ):
-        """for midi controllers:
+        """for midi controllers added since last called:
         link controllers with same nrpn,
         bind with midi send function,
         connect radio controller groups,
         add options to dropdown controllers,
-        display selected option for each controller.
-        return list of synths found.
+        display selected option for each controller,
+        show the value held in each controller's synth state.
 
         for utility controllers:
         bind to utility functions"""
         #print(len(self.controllers))
-        
-        for controller in self.controllers:
+        new_controllers = self.new_controllers
+        self.new_controllers = []
+        self._build_index()
+        self._link_controllers()
+
+        for controller in new_controllers:
             if isinstance(controller, BaseController):
-                self._link_controllers(controller)
+                controller.bind(
+                    on_send=lambda controller, _, nrpn, value:\
+                        self._store_sent_value(controller.synth, nrpn, value)
+                )
                 controller.bind(
                     on_send=lambda _, channel, nrpn, value:\
                                 midi.send_nrpn(channel, nrpn, value)
                 )
+                controller.bind(
+                    on_send=lambda controller, channel, nrpn, value:\
+                        patch_manager.note_sent(controller.synth, nrpn, value)
+                )
                 
                 if isinstance(controller, RadioController):
                     self._walk_tree(
@@ -98,6 +133,11 @@ class ControllerManager(object):
                         
                 controller.setup()
                 controller.display_selected()
+                if controller.nrpn is not None:
+                    value = self.get_state(controller.synth)\
+                                .get(controller.nrpn)
+                    if value != controller.midi_value:
+                        controller.set_without_sending_midi(value)
 
             else: # UtilityController
                 controller.bind(
@@ -112,6 +152,43 @@ class ControllerManager(object):
                 controller.bind(
                     on_receive=lambda _, synth: patch_manager.on_receive(synth)
                 )
+                controller.bind(
+                    on_receive_bank=lambda _, synth:\
+                                    patch_manager.on_receive_bank(synth)
+                )
+                controller.bind(
+                    on_undo=lambda _, synth: patch_manager.undo(synth)
+                )
+                controller.bind(
+                    on_redo=lambda _, synth: patch_manager.redo(synth)
+                )
+                controller.bind(
+                    on_pattern=lambda _, synth, operation, track:\
+                        patch_manager.edit_track(synth, operation, track)
+                )
+                if isinstance(controller, LibraryController):
+                    controller.bind(
+                        on_refresh=lambda controller, synth:\
+                            controller.set_patches(
+                                patch_manager.library_patches(synth)
+                            )
+                    )
+                    controller.bind(
+                        on_morph_start=lambda _, synth, patch_id:\
+                            patch_manager.morph(synth, patch_id)
+                    )
+                    controller.bind(
+                        on_morph=lambda _, synth, position:\
+                            patch_manager.set_morph_position(synth, position)
+                    )
+                    controller.bind(
+                        on_paste_track=lambda _, synth, track, patch_id:\
+                            patch_manager.paste_library_track(
+                                synth,
+                                track,
+                                patch_id
+                            )
+                    )
 
 
     def _walk_tree(self, widget, func, value=None, *args):
@@ -121,11 +198,11 @@ class ControllerManager(object):
         for child in widget.children:
             self._walk_tree(child, func, value, *args)
 
-    def _collect_controllers(self, widget, _):
-        """add controller to list if is one"""
+    def _collect_controllers(self, widget, _, found):
+        """add controller to found list if is one"""
         if isinstance(widget, BaseController)\
            or isinstance(widget, UtilityController):
-            self.controllers.append(widget)
+            found.append(widget)
 
     def _set_property_if_type(self, widget, value, prop, w_type):
         """set widgets property 'prop' to 'value' if widget is of type 'w_type'
@@ -149,37 +226,100 @@ class ControllerManager(object):
         #print(widget, value, new_value)
         return new_value
     
-    def _link_controllers(self, con_i):
+    def _build_index(self):
+        """index midi controllers by channel then nrpn, and by synth then
+        nrpn. bind controllers as views of their synth's state.
+        rebuilt whenever channels change."""
+        self.channel_index = {}
+        self.synth_index = {}
+        self.channel_synths = {}
+        for state in self.states.values():
+            state.unbind_all()
+        for controller in self.controllers:
+            if isinstance(controller, BaseController)\
+               and controller.nrpn is not None:
+                self.channel_index.setdefault(controller.channel, {})\
+                                  .setdefault(controller.nrpn, [])\
+                                  .append(controller)
+                self.synth_index.setdefault(controller.synth, {})\
+                                .setdefault(controller.nrpn, [])\
+                                .append(controller)
+                self.channel_synths.setdefault(controller.channel, set())\
+                                   .add(controller.synth)
+                self.get_state(controller.synth).bind(
+                    controller.nrpn,
+                    controller.set_without_sending_midi
+                )
+
+    def get_state(self, synth):
+        """return the SynthState holding synth's parameter values"""
+        try:
+            return self.states[synth]
+        except KeyError:
+            self.states[synth] = SynthState()
+            return self.states[synth]
+
+    def get_journal(self, synth):
+        """return the UndoJournal of changes to synth's state"""
+        try:
+            return self.journals[synth]
+        except KeyError:
+            self.journals[synth] = UndoJournal()
+            return self.journals[synth]
+
+    def _store_sent_value(self, synth, nrpn, value):
+        """set value changed by a controller in synth's state, recording
+        the change in synth's journal"""
+        state = self.get_state(synth)
+        self.get_journal(synth).record(nrpn, state.get(nrpn), value)
+        state.set(nrpn, value, False)
+
+    def _link_controllers(self):
         """link controllers with the same channel and nrpn"""
-        for con_j in self.controllers:
-            if con_i is not con_j and con_i.channel == con_j.channel\
-                and con_i.nrpn == con_j.nrpn:
-                    con_i.linked.append(con_j)
+        for nrpns in self.channel_index.values():
+            for controllers in nrpns.values():
+                for controller in controllers:
+                    controller.linked = [c for c in controllers\
+                                         if c is not controller]
         
     def set_controller_value(self, channel, nrpn, value):
-        """sets value on given controller"""
+        """sets value of nrpn in state of synths on channel, updating
+        controllers"""
         #print(f"incoming: {channel} {nrpn} {value}")
-        for controller in self.controllers:
-            if isinstance(controller, BaseController)\
-               and controller.channel == channel\
-               and controller.nrpn == nrpn:
-                controller.set_without_sending_midi(value)
+        for synth in self.channel_synths.get(channel, ()):
+            self.states[synth].set(nrpn, value)
 
-    def set_controller_values(self, synth, nrpn_order, data):
-        """set each byte in data to corresponding nrpn in nrpn_order if it
-        is of given synth"""
-        for i, byte in enumerate(data):
-            self.set_controller_value(synth, nrpn_order[i], byte)
+    def set_controller_values(self, channel, nrpn_order, data):
+        """set each byte in data to corresponding nrpn in nrpn_order in state
+        of synths on channel, updating controllers"""
+        nrpn_index = {}
+        for i, nrpn in enumerate(nrpn_order):
+            nrpn_index.setdefault(nrpn, i)
+        for synth in self.channel_synths.get(channel, ()):
+            self.states[synth].set_patch(nrpn_index, data)
 
     def get_controller_values(self, synth, nrpn_order):
-        """return all controller values for synth in order given
-           as a tuple of ints"""
-        output = []
-        for nrpn in nrpn_order:
-            for controller in [c for c in self.controllers\
-                                if c.synth == synth and c.nrpn == nrpn]:
-                output.append(controller.get_value())
-        return tuple(output)
+        """return list of values of synth's nrpns in order given"""
+        return self.get_state(synth).get_patch(nrpn_order)
+
+    def get_discrete_nrpns(self, synth):
+        """return set of nrpns for synth that have a controller choosing
+        between distinct options"""
+        discrete_types = (DropDownController, RadioController, ToggleController)
+        return set(nrpn for nrpn, controllers\
+                   in self.synth_index.get(synth, {}).items()\
+                   if any(isinstance(c, discrete_types) for c in controllers))
+
+    def get_parameter_ranges(self, synth):
+        """return dict of nrpn to (minimum, maximum) midi value of the
+        controllers for synth"""
+        ranges = {}
+        for nrpn, controllers in self.synth_index.get(synth, {}).items():
+            ranges[nrpn] = (
+                min(c.minimum + c.offset for c in controllers),
+                max(c.maximum + c.offset for c in controllers)
+            )
+        return ranges
 
     def send_all(self, synth):
         """send midi for every controller for given synth"""
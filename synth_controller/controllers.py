@@ -244,21 +244,32 @@ class DropDownController(BaseController):
     grey_on_zero = BooleanProperty(False)
     
     def sub_setup(self):
-        """Creates the drop down list for the controller."""
-        self.dropdown = DropDown()
+        """Sets up the controller's button, the drop down list is created
+        when first opened."""
+        self.dropdown = None
         self.extra_options = []
         self._add_options_from_kivy()
         self.main_button = [widget for widget in self.children 
                        if isinstance(widget, Button)][0]
+        self.main_button.bind(on_release=self.open_dropdown)
 
+    def open_dropdown(self, button):
+        """Opens the drop down list, creating it if not yet created."""
+        if self.dropdown is None:
+            self.dropdown = self._create_dropdown()
+        self.dropdown.open(button)
+
+    def _create_dropdown(self):
+        """Creates the drop down list of the controller's options."""
+        dropdown = DropDown()
         for option in self.options:
             btn = Button(text=option, size_hint_y=None, height=30)
-            btn.bind(on_release=lambda btn: self.dropdown.select(btn.text))
-            self.dropdown.add_widget(btn)
+            btn.bind(on_release=lambda btn: dropdown.select(btn.text))
+            dropdown.add_widget(btn)
             
-        self.main_button.bind(on_release=self.dropdown.open)
-        self.dropdown.bind(on_select=self._select_option)
-        self.dropdown.bind(on_dismiss=self._on_dismiss)
+        dropdown.bind(on_select=self._select_option)
+        dropdown.bind(on_dismiss=self._on_dismiss)
+        return dropdown
 
     def _on_dismiss(self, button):
         """display selected option if dropdown is dismissed"""
@@ -282,6 +293,7 @@ class DropDownController(BaseController):
     def add_options(self, options):
         """sets list of options on the dropdown"""
         self.options = options
+        self.dropdown = None
 
     def _add_options_from_kivy(self):
         """adds any extra options from kivy file"""
@@ -333,6 +345,10 @@ class UtilityController(BoxLayout):
         self.register_event_type('on_save')
         self.register_event_type('on_send')
         self.register_event_type('on_receive')
+        self.register_event_type('on_receive_bank')
+        self.register_event_type('on_undo')
+        self.register_event_type('on_redo')
+        self.register_event_type('on_pattern')
         
     def load_patch(self):
         """Dispatch load event."""
@@ -350,6 +366,22 @@ class UtilityController(BoxLayout):
         """Dispatch save event."""
         self.dispatch('on_receive', self.synth)
 
+    def receive_bank(self):
+        """Dispatch receive bank event."""
+        self.dispatch('on_receive_bank', self.synth)
+
+    def undo(self):
+        """Dispatch undo event."""
+        self.dispatch('on_undo', self.synth)
+
+    def redo(self):
+        """Dispatch redo event."""
+        self.dispatch('on_redo', self.synth)
+
+    def pattern(self, operation, track):
+        """Dispatch sequencer pattern event."""
+        self.dispatch('on_pattern', self.synth, operation, track)
+
     def load_and_send_patch(self):
         pass
 
@@ -361,6 +393,67 @@ class UtilityController(BoxLayout):
         pass
     def on_receive(self, _):
         pass
+    def on_receive_bank(self, _):
+        pass
+    def on_undo(self, _):
+        pass
+    def on_redo(self, _):
+        pass
+    def on_pattern(self, *_):
+        pass
+
+class LibraryController(UtilityController):
+    """Utility controller acting on a patch chosen from the patch library"""
+    patch_names = ListProperty([])
+
+    def __init__(self, **kwargs):
+        """Register events"""
+        super(LibraryController, self).__init__(**kwargs)
+        self.register_event_type('on_refresh')
+        self.register_event_type('on_morph_start')
+        self.register_event_type('on_morph')
+        self.register_event_type('on_paste_track')
+        self.patches = []
+        self.patch_id = None
+
+    def refresh(self):
+        """Dispatch refresh event to update the patches to choose from."""
+        self.dispatch('on_refresh', self.synth)
+
+    def set_patches(self, patches):
+        """Set list of (patch id, name) to choose from."""
+        self.patches = patches
+        self.patch_names = [f"{patch_id}: {name}"
+                            for patch_id, name in patches]
+
+    def choose(self, text):
+        """Choose the patch shown as text."""
+        if text in self.patch_names:
+            self.patch_id = self.patches[self.patch_names.index(text)][0]
+
+    def start_morph(self):
+        """Dispatch morph start event for the chosen patch."""
+        if self.patch_id is not None:
+            self.dispatch('on_morph_start', self.synth, self.patch_id)
+
+    def morph(self, position):
+        """Dispatch morph event."""
+        self.dispatch('on_morph', self.synth, position)
+
+    def paste_track(self, track):
+        """Dispatch paste track event to set a sequencer track from the
+        same track of the chosen patch."""
+        if self.patch_id is not None:
+            self.dispatch('on_paste_track', self.synth, track, self.patch_id)
+
+    def on_refresh(self, _):
+        pass
+    def on_morph_start(self, *_):
+        pass
+    def on_morph(self, *_):
+        pass
+    def on_paste_track(self, *_):
+        pass
     
         
         
@@ -7,7 +7,30 @@ error_message = {
                                 + "but not registered in kv file.",
     'NO_PATCH_DETAILS' : lambda synth: f"{synth} settings does not have "\
                                     + "patch details.",
-    'INCORRECT_SYNTH' : lambda synth: f"Patch data is not for a {synth}."
+    'INCORRECT_SYNTH' : lambda synth: f"Patch data is not for a {synth}.",
+    'NO_BANK_DETAILS' : lambda synth: f"{synth} settings does not have "\
+                                    + "program dump details.",
+    'PROGRAMS_NOT_RECEIVED' : lambda data: f"{data[0]} did not send "\
+                                    + f"programs: {data[1]}",
+    'PATCH_NOT_RECEIVED' : lambda synth: f"{synth} did not send its patch.",
+    'NO_LIBRARY' : lambda synth: f"No patch library open for {synth}.",
+    'VALUE_OUT_OF_RANGE' : lambda synth: f"{synth} patch has a parameter "\
+                                    + "value too large for a patch dump.",
+    'NO_SEQUENCER' : lambda synth: f"{synth} settings does not have "\
+                                    + "sequencer details.",
+    'NOTHING_COPIED' : lambda synth: f"No {synth} sequencer track copied.",
+    'INVALID_SYNTH_DEFINITION' : lambda message: "Synth definition is not "\
+                                    + f"valid, {message}."
+}
+
+info_message = {
+    'BANK_PROGRESS' : lambda data: f"{data[0]}: received {data[1]} of "\
+                                    + f"{data[2]} programs.",
+    'BANK_SAVED' : lambda data: f"{data[0]} programs saved to {data[1]}.",
+    'SEND_REPORT' : lambda data: f"{data[0]}: sent as {data[1]}, {data[2]} "\
+                                    + f"bytes, {data[3] - data[2]} bytes saved.",
+    'ALL_RECEIVED' : lambda data: f"received patches from {data[0]} of "\
+                                    + f"{data[1]} synths."
 }
 
 class ErrorHandler(object):
@@ -15,3 +38,7 @@ class ErrorHandler(object):
     def error(self, name, data):
         """print error message to screen. change to log ???"""        
         print(error_message[name](data))
+
+    def info(self, name, data):
+        """print information message to screen."""
+        print(info_message[name](data))
@@ -3,17 +3,27 @@ from ui import MainScreen
 from setup_manager import SetupManager, NoSetupException
 from controller_manager import ControllerManager
 from synth_manager import SynthManager
-#from midi_test import Midi
+#from midi_manual_check import Midi
 from midi import Midi
+from midi_stats import MidiStats
 from error_handler import ErrorHandler
 from patch_manager import PatchManager
+from patch_library import PatchLibrary
 from strings import *
 
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.core.window import Window
 
+import os
 import sys
 
+# set to a filename to record midi statistics, dumped there on exit.
+# F12 shows the statistics overlay.
+STATS_VARIABLE = 'MIDI_STATS'
+KEY_F12 = 293
+PREBUILD_INTERVAL = 0.5
+
 class MainApp(App):
     """Controls manager objects"""
     def __init__(self, **kwargs):
@@ -33,7 +43,7 @@ class MainApp(App):
             print("no setup")
             sys.exit(1)
 
-        # build screens
+        # build initial screen, others are built when first shown
         self.setup_manager.build_screens()
 
         # init controller manager
@@ -43,45 +53,105 @@ class MainApp(App):
         self.synth_manager = SynthManager(self.controller_manager.synths)
 
         # init midi interface
-        self.midi = Midi()
+        self.stats_file = os.environ.get(STATS_VARIABLE)
+        if self.stats_file:
+            self.midi_stats = MidiStats()
+            Clock.schedule_interval(self.midi_stats.frame, 0)
+            Window.bind(on_key_down=self._on_key_down)
+        else:
+            self.midi_stats = None
+        self.midi = Midi(stats=self.midi_stats)
 
         # init error handler
         self.error_handler = ErrorHandler()
 
+        # report every synth definition that is not valid now, synths
+        # are loaded as screens using them are built
+        for message in self.synth_manager.check_definitions().values():
+            self.error_handler.error('INVALID_SYNTH_DEFINITION', message)
+
+        # init patch library
+        self.patch_library = PatchLibrary(self.synth_manager)
+
         # init patch manager
         self.patch_manager = PatchManager(
                                 self.midi,
                                 self.ui,
                                 self.controller_manager,
                                 self.synth_manager,
-                                self.error_handler
+                                self.error_handler,
+                                self.patch_library
                             )
 
         # set midi callbacks
         self.midi.set_callbacks(
-            self.controller_manager.set_controller_value,
+            self._receive_nrpn,
             self.patch_manager.parse_sysex
         )
+        Clock.schedule_interval(self.midi.process_input, 0)
+        Clock.schedule_interval(self.patch_manager.update, 0)
+
+        self.ui.bind(on_screen_built=self._on_screen_built)
+        self.ui.bind(
+            on_receive_all=lambda *args: self.patch_manager.receive_all()
+        )
+        self.ui.bind(
+            on_channel_selection=lambda *args:\
+                Clock.schedule_once(self._set_channels)
+        )
 
     def build(self):
         """build the kivy app"""
         return self.ui
 
     def on_start(self):
-        """Initialise controllers with synth options lists and midi and patch
-        objects for callbacks to bind to controller events.
-        Assign and set midi channels.""" 
+        """Set up controllers of the initial screen, prebuild the other
+        screens when idle"""
+        self._setup_controllers()
+        Clock.schedule_interval(self.ui.prebuild_next, PREBUILD_INTERVAL)
+
+        #self.ui.simple_popup(WELCOME_TITLE, WELCOME_MESSAGE)
+
+    def _on_screen_built(self, _, name, screen):
+        """Set up controllers of a screen built after start"""
+        self.controller_manager.add_screen(name, screen)
+        self._setup_controllers()
+
+    def _setup_controllers(self):
+        """Load any new synths, initialise new controllers with synth
+        options lists and midi and patch objects for callbacks to bind to
+        controller events. Assign and set midi channels."""
+        synths = self.controller_manager.synths
+        self.synth_manager.add_synths(synths)
         self.controller_manager.initialise_controllers(
             self.synth_manager.options_lists,
             self.midi,
             self.patch_manager
         )
         
-        self.setup_manager.assign_channels(self.controller_manager.synths)
+        self.setup_manager.assign_channels(synths)
+        self._set_channels()
+
+    def _set_channels(self, *args):
+        """Set assigned midi channels in controllers and synths"""
         self.controller_manager.set_channels(self.setup_manager.channels)
         self.synth_manager.set_channels(self.setup_manager.channels)
 
-        #self.ui.simple_popup(WELCOME_TITLE, WELCOME_MESSAGE)
+    def _receive_nrpn(self, channel, nrpn, value):
+        """Show a received nrpn in the controllers and note it as held by
+        the synth"""
+        self.controller_manager.set_controller_value(channel, nrpn, value)
+        self.patch_manager.note_received(channel, nrpn, value)
+
+    def on_stop(self):
+        """dump midi statistics if recorded"""
+        if self.midi_stats:
+            self.midi_stats.dump(self.stats_file)
+
+    def _on_key_down(self, window, key, *args):
+        """toggle midi statistics overlay on F12"""
+        if key == KEY_F12:
+            self.ui.toggle_stats_overlay(self.midi_stats)
 
 
 def main():
@@ -1,23 +1,71 @@
 
-from alsa_midi import SequencerClient, EventType, ControlChangeEvent,\
-                      NonRegisteredParameterChangeEvent, SysExEvent
+from midi_queues import NrpnScheduler, InputQueue, FLUSH_RATE,\
+                        NRPN_BUDGET
+from midi_parsers import NrpnParser, SysexParser, CC_BYTES, NRPN_BYTES
+from automation import AutomationRecorder, AutomationPlayer, IN, OUT
+from smf import SmfPlayer
 
 import threading
 
-MSG_SYSEX_END = 0xf7
-MSG_PARAM_MSB = 0x63
-MSG_PARAM_LSB = 0x62
-MSG_VALUE_MSB = 0x06
-MSG_VALUE_LSB = 0x26
-MSG_MSB_MASK = 0x3f80
-MSG_LSB_MASK = 0x7f
-
 
 class Midi(object):
-    def __init__(self, connection=None):
-        """Set up midi interface"""
-        self._setup(connection)
-        self._create_data_array()
+    def __init__(
+            self,
+            connection=None,
+            backend=None,
+            flush_rate=FLUSH_RATE,
+            nrpn_budget=NRPN_BUDGET,
+            high_res_ccs=(),
+            stats=None
+        ):
+        """Set up midi interface.
+        backend - MidiBackend to use, alsa midi if None.
+        Out-going nrpns are coalesced and sent at most 'flush_rate' times
+        a second, limited to 'nrpn_budget' messages a second.
+        Output is locked, so messages can be sent from any thread.
+        Incoming messages are queued until process_input is called.
+        Controllers 0-31 in 'high_res_ccs' are received as 14 bit pairs.
+        stats - MidiStats to record latencies and counts in, if any."""
+        self.cc_callback = None
+        self.sysex_callback = None
+        if backend is None:
+            from midi_backends import AlsaBackend
+            backend = AlsaBackend(connection)
+        self.backend = backend
+        self.stats = stats
+        self.recorder = None
+        self.input_queue = InputQueue()
+        put_nrpn = self.input_queue.put_nrpn
+        put_cc = self.input_queue.put_cc
+        put_sysex = self.input_queue.put_sysex
+        send_nrpn = backend.send_nrpn
+        drain = backend.drain
+        if stats is not None:
+            put_nrpn = self._timed(put_nrpn)
+            put_cc = self._timed(put_cc)
+            put_sysex = self._timed(put_sysex)
+            send_nrpn = self._send_nrpn_timed
+            drain = self._drain_timed
+            # time of the first unsent change to each channel and nrpn
+            self.change_times = {}
+            self.batch_times = []
+        self._put_nrpn = put_nrpn
+        self._send_nrpn = send_nrpn
+        self._drain = drain
+        # held while writing to the backend
+        self.output_lock = threading.Lock()
+        self.nrpn_parser = NrpnParser(
+            self._receive_nrpn,
+            put_cc,
+            high_res_ccs
+        )
+        self.sysex_parser = SysexParser(put_sysex)
+        self.nrpn_scheduler = NrpnScheduler(
+            self._output_nrpn,
+            self._drain_output,
+            flush_rate,
+            nrpn_budget
+        )
         
         input_thread = threading.Thread(
             target=self._poll, 
@@ -29,105 +77,156 @@ class Midi(object):
         """Set the midi in callbacks"""
         self.cc_callback = cc_callback
         self.sysex_callback = sysex_callback
+
+    def process_input(self, *args):
+        """Pass queued incoming messages to the callbacks.
+        Call from the ui thread, once per frame."""
+        stats = self.stats
+        for message in self.input_queue.take():
+            if stats is not None:
+                stats.hop('callback', message[-1])
+            if message[0] == 'sysex':
+                if self.sysex_callback:
+                    self.sysex_callback(message[1])
+            elif self.cc_callback:
+                self.cc_callback(*message[1:4])
+            if stats is not None:
+                stats.hop('controller', message[-1])
+                stats.delivered(message[-1])
+
+    @property
+    def input_stats(self):
+        """return incoming queue depth, coalesced and dropped counts and
+        count of abandoned sysex messages"""
+        stats = self.input_queue.stats
+        stats['sysex abandoned'] = self.sysex_parser.abandoned
+        return stats
     
-    def _setup(self, connection):
-        """setup alsa midi"""
-        self.client = SequencerClient("Synth Controller")
-        self.port = self.client.create_port("main")
-        if connection:
-            # connect to port
-            pass
-
-    def _create_data_array(self):
-        """create empty received message data arrays"""
-        self.sysex_data = b''
-        self.nrpn_data = [i for i in range(16)]
-        for i in range(16):
-            self._clear_channel_data(i)      
-
-    def _clear_channel_data(self, channel):
-        """clear data for given channel"""
-        self.nrpn_data[channel] = {
-                "param_msb": None,
-                "param_lsb": None,
-                "value_msb": None,
-                "value_lsb": None
-            }   
-        
     def _poll(self):
         """poll midi for input"""
-        print ("thread started")
         while True:
-            event = self.client.event_input()
-            if event.type == EventType.CONTROLLER:
-                print(repr(event))
-                self._parse_cc(event)
-            elif event.type == EventType.SYSEX:
-                print(repr(event))
-                self._parse_sysex(event)
-     
-    def _parse_cc(self, event):
-        """parse a control change midi message"""
-        if event.param == MSG_PARAM_MSB:
-            self.nrpn_data[event.channel]['param_msb'] = event.value
-            self._check_nrpn(event.channel)
-        elif event.param == MSG_PARAM_LSB:
-            self.nrpn_data[event.channel]['param_lsb'] = event.value
-            self._check_nrpn(event.channel)
-        elif event.param == MSG_VALUE_MSB:
-            self.nrpn_data[event.channel]['value_msb'] = event.value
-            self._check_nrpn(event.channel)
-        elif event.param == MSG_VALUE_LSB:
-            self.nrpn_data[event.channel]['value_lsb'] = event.value
-            self._check_nrpn(event.channel)
-
-        else: # standard cc
-            if self.cc_callback:
-                self.cc_callback(event.channel, event.param, event.value) 
-        
-    def _check_nrpn(self, channel):
-        """check if all parts of nrpn message have arrived"""
-        if all(map(
-                lambda x: x is not None, 
-                self.nrpn_data[channel].values()
-            )):
-            param = (self.nrpn_data[channel]['param_msb'] << 7) \
-                    + self.nrpn_data[channel]['param_lsb']
-                    
-            value = (self.nrpn_data[channel]['value_msb'] << 7) \
-                    + self.nrpn_data[channel]['value_lsb']
-            
-            if self.cc_callback:
-                self.cc_callback(channel, param, value)
-                
-            self._clear_channel_data(channel)       
-        
-    def _parse_sysex(self, event):
-        """parse midi sysex message"""
-        if event.data[-1] != MSG_SYSEX_END:
-            self.sysex_data = event.data
-        else:
-            self.sysex_data += event.data
-            if self.sysex_callback:
-                self.sysex_callback(self.sysex_data)
-            self.sysex_data = b''
+            message = self.backend.receive()
+            if self.stats is not None:
+                self.stats.received(message)
+            if message[0] == 'cc':
+                self.nrpn_parser.feed(*message[1:])
+            else:
+                self.sysex_parser.feed(message[1])
 
     def send_cc(self, channel, controller, value):
         """send standard control change midi message for given values"""
-        self.client.event_output(
-            ControlChangeEvent(channel, controller, value)
-        )
-        self.client.drain_output()
+        with self.output_lock:
+            self.backend.send_cc(channel, controller, value)
+            self.backend.drain()
+        if self.stats is not None:
+            self.stats.sent(channel, CC_BYTES)
         
     def send_nrpn(self, channel, controller, value):
-        """send a nrpn control change midi message for given values"""            
-        self.client.event_output(
-            NonRegisteredParameterChangeEvent(channel, controller, value)
-        )
-        self.client.drain_output()
-        
+        """queue a nrpn control change midi message for given values.
+        Only the latest value for each nrpn is sent."""
+        self._note_sending(channel, controller, value)
+        self.nrpn_scheduler.put(channel, controller, value)
+
+    def send_nrpn_now(self, channel, controller, value):
+        """send a nrpn control change midi message for given values
+        straight away, without coalescing, for players that keep time"""
+        self._note_sending(channel, controller, value)
+        with self.output_lock:
+            self._send_nrpn(channel, controller, value)
+            self._drain()
+
     def send_sysex(self, data):
         """send a system exclusive messsage with given data."""
-        self.client.event_output(SysExEvent(data))
-        self.client.drain_output()
-        
+        with self.output_lock:
+            self.backend.send_sysex(data)
+            self.backend.drain()
+        if self.stats is not None:
+            self.stats.sent('sysex', len(data))
+
+    def start_recording(self, filename):
+        """record every nrpn in and out to automation file filename"""
+        self.stop_recording()
+        self.recorder = AutomationRecorder(filename)
+
+    def stop_recording(self):
+        """finish recording, return number of nrpns dropped, or None if
+        not recording"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+            return recorder.dropped
+        return None
+
+    def play_automation(self, filename, directions=(IN,)):
+        """replay nrpns recorded going in directions, by default those
+        received, from automation file filename.
+        return the running AutomationPlayer"""
+        return AutomationPlayer(
+            filename,
+            self.send_nrpn_now,
+            directions
+        ).start()
+
+    def play_smf(self, filename, channels=None):
+        """play the nrpns and control changes of standard midi file
+        filename, streamed from disk.
+        channels - dict of synth to midi channel, such as
+                   SetupManager.channels, for tracks named after synths.
+        return the running SmfPlayer"""
+        return SmfPlayer(
+            filename,
+            self.send_nrpn_now,
+            self.send_cc,
+            channels
+        ).start()
+
+    def _receive_nrpn(self, channel, nrpn, value):
+        """record and queue a received nrpn"""
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record(IN, channel, nrpn, value)
+        self._put_nrpn(channel, nrpn, value)
+
+    def _note_sending(self, channel, nrpn, value):
+        """record an out-going nrpn as it is sent, before any coalescing,
+        and note the time it changed"""
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record(OUT, channel, nrpn, value)
+        if self.stats is not None:
+            self.change_times.setdefault((channel, nrpn), self.stats.clock())
+
+    def _output_nrpn(self, channel, nrpn, value):
+        """output a coalesced nrpn"""
+        with self.output_lock:
+            self._send_nrpn(channel, nrpn, value)
+
+    def _drain_output(self):
+        """drain output after a batch of coalesced nrpns"""
+        with self.output_lock:
+            self._drain()
+
+    def _timed(self, put):
+        """return put, adding the receive time of the message being
+        parsed to each message queued"""
+        def timed_put(*message):
+            self.stats.hop('queue', self.stats.receive_time)
+            put(*message, self.stats.receive_time)
+        return timed_put
+
+    def _send_nrpn_timed(self, channel, nrpn, value):
+        """output a nrpn, recording time since it was changed"""
+        self.backend.send_nrpn(channel, nrpn, value)
+        self.stats.sent(channel, NRPN_BYTES)
+        changed = self.change_times.pop((channel, nrpn), None)
+        if changed is not None:
+            self.stats.hop('wire', changed)
+            self.batch_times.append(changed)
+
+    def _drain_timed(self):
+        """drain output, recording time since each nrpn in the batch
+        was changed"""
+        self.backend.drain()
+        for changed in self.batch_times:
+            self.stats.hop('drain', changed)
+        self.batch_times = []
@@ -0,0 +1,62 @@
+class MidiBackend(object):
+    """Interface between Midi and a midi connection.
+
+    receive blocks until a message arrives and returns it as
+    ('cc', channel, controller, value) or ('sysex', data), where data may
+    be one chunk of a longer sysex message.
+    Messages sent may be buffered until drain is called."""
+    def receive(self):
+        raise NotImplementedError
+
+    def send_cc(self, channel, controller, value):
+        raise NotImplementedError
+
+    def send_nrpn(self, channel, nrpn, value):
+        raise NotImplementedError
+
+    def send_sysex(self, data):
+        raise NotImplementedError
+
+    def drain(self):
+        pass
+
+class AlsaBackend(MidiBackend):
+    """Midi through an alsa sequencer client"""
+    def __init__(self, connection=None):
+        """setup alsa midi"""
+        import alsa_midi
+        self.alsa_midi = alsa_midi
+        self.client = alsa_midi.SequencerClient("Synth Controller")
+        self.port = self.client.create_port("main")
+        if connection:
+            # connect to port
+            pass
+
+    def receive(self):
+        """wait for a control change or sysex event"""
+        while True:
+            event = self.client.event_input()
+            if event.type == self.alsa_midi.EventType.CONTROLLER:
+                return ('cc', event.channel, event.param, event.value)
+            elif event.type == self.alsa_midi.EventType.SYSEX:
+                return ('sysex', event.data)
+
+    def send_cc(self, channel, controller, value):
+        self.client.event_output(
+            self.alsa_midi.ControlChangeEvent(channel, controller, value)
+        )
+
+    def send_nrpn(self, channel, nrpn, value):
+        self.client.event_output(
+            self.alsa_midi.NonRegisteredParameterChangeEvent(
+                channel,
+                nrpn,
+                value
+            )
+        )
+
+    def send_sysex(self, data):
+        self.client.event_output(self.alsa_midi.SysExEvent(data))
+
+    def drain(self):
+        self.client.drain_output()
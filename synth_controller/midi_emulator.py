@@ -0,0 +1,166 @@
+from midi_backends import MidiBackend
+from midi_parsers import NrpnParser, MSG_PARAM_MSB, MSG_PARAM_LSB,\
+                         MSG_VALUE_MSB, MSG_VALUE_LSB, CC_BYTES, NRPN_BYTES
+from synth_manager import SynthData
+from sysex_dispatcher import IDENTITY_REQUEST
+
+import os
+import queue
+import time
+import threading
+
+MOPHO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'synths', 'mopho.json')
+BAUD_RATE = 31250
+BITS_PER_BYTE = 10  # start bit, 8 data bits and stop bit
+# dsi, mopho family 25 00, member 00 00, version 1.0
+IDENTITY_REPLY = b'\xf0\x7e\x00\x06\x02\x01\x25\x00\x00\x00'\
+                 b'\x00\x01\x00\x00\xf7'
+
+class EmulatedMopho(MidiBackend):
+    """In-process loopback standing in for a Mopho on the end of a cable.
+    Keeps the synth's parameter memory, answers edit buffer and program
+    dump requests from it and identity requests, stores dumps sent to it
+    and echoes nrpns.
+    With throttle, messages take as long as they would on a din cable,
+    latency seconds are added before each reply."""
+    def __init__(
+            self,
+            channel=None,
+            edit_buffer=None,
+            echo=True,
+            throttle=False,
+            latency=0.0,
+            filename=MOPHO_FILE
+        ):
+        """channel - midi channel to respond on, all channels if None.
+        edit_buffer - unpacked parameter values to start with."""
+        self.synth = SynthData(filename, 'mopho')
+        self.channel = channel
+        self.echo = echo
+        self.throttle = throttle
+        self.latency = latency
+        if edit_buffer is None:
+            self.edit_buffer = bytearray(self.synth.n_parameters)
+        else:
+            self.edit_buffer = bytearray(edit_buffer)
+        # (bank, program) to unpacked parameter values
+        self.programs = {}
+        self.received = []
+        self.output = queue.Queue()
+        self.lock = threading.Lock()
+        self.wire_in = 0.0
+        self.wire_out = 0.0
+        self.nrpn_parser = NrpnParser(self._receive_nrpn, self._receive_cc)
+
+    def get(self, nrpn):
+        """Return value of parameter nrpn from the edit buffer"""
+        return self.edit_buffer[self.synth.nrpn_index[nrpn]]
+
+    def turn_knob(self, nrpn, value):
+        """Change a parameter from the front panel, sending it as an nrpn"""
+        self._set(nrpn, value)
+        self._transmit_nrpn(self.channel or 0, nrpn, value)
+
+    def receive(self):
+        """Wait for the next message from the synth"""
+        ready, message = self.output.get()
+        delay = ready - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return message
+
+    def send_cc(self, channel, controller, value):
+        self._occupy_wire(CC_BYTES)
+        self.nrpn_parser.feed(channel, controller, value)
+
+    def send_nrpn(self, channel, nrpn, value):
+        self._occupy_wire(NRPN_BYTES)
+        self._receive_nrpn(channel, nrpn, value)
+
+    def send_sysex(self, data):
+        self._occupy_wire(len(data))
+        data = bytes(data)
+        self.received.append(data)
+        body = data[1:-1]
+        synth = self.synth
+        if data == IDENTITY_REQUEST:
+            self._transmit(IDENTITY_REPLY)
+        elif body == synth.patch_request:
+            self._transmit(b'\xf0' + synth.header
+                           + synth.pack(self.edit_buffer) + b'\xf7')
+        elif body[:len(synth.program_request)] == synth.program_request:
+            bank, program = body[len(synth.program_request):][:2]
+            self._transmit(b'\xf0' + synth.program_header
+                           + bytes((bank, program))
+                           + synth.pack(self._program(bank, program))
+                           + b'\xf7')
+        elif body[:len(synth.header)] == synth.header:
+            self.edit_buffer = bytearray(
+                synth.unpack(body[len(synth.header):])
+            )
+        elif body[:len(synth.program_header)] == synth.program_header:
+            bank, program = body[len(synth.program_header):][:2]
+            self.programs[(bank, program)] = bytearray(
+                synth.unpack(body[len(synth.program_header) + 2:])
+            )
+
+    def drain(self):
+        """With throttle, wait until sent messages are on the wire"""
+        if self.throttle:
+            delay = self.wire_in - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _program(self, bank, program):
+        """Return a stored program, new programs are copies of the
+        edit buffer"""
+        return self.programs.setdefault(
+            (bank, program),
+            bytearray(self.edit_buffer)
+        )
+
+    def _set(self, nrpn, value):
+        if nrpn in self.synth.nrpn_index:
+            self.edit_buffer[self.synth.nrpn_index[nrpn]] = value & 0xff
+
+    def _receive_nrpn(self, channel, nrpn, value):
+        if self.channel is None or channel == self.channel:
+            self._set(nrpn, value)
+            if self.echo:
+                self._transmit_nrpn(channel, nrpn, value)
+
+    def _receive_cc(self, channel, controller, value):
+        pass
+
+    def _transmit_nrpn(self, channel, nrpn, value):
+        for controller, data in (
+                (MSG_PARAM_MSB, nrpn >> 7),
+                (MSG_PARAM_LSB, nrpn & 0x7f),
+                (MSG_VALUE_MSB, value >> 7),
+                (MSG_VALUE_LSB, value & 0x7f)
+            ):
+            self._transmit(('cc', channel, controller, data), CC_BYTES)
+
+    def _transmit(self, message, size=None):
+        """Queue message from the synth, ready when it would have
+        finished arriving"""
+        if size is None:
+            size = len(message)
+            message = ('sysex', message)
+        now = time.monotonic()
+        with self.lock:
+            if self.throttle:
+                start = max(now + self.latency, self.wire_out)
+                self.wire_out = start + size * BITS_PER_BYTE / BAUD_RATE
+                ready = self.wire_out
+            else:
+                ready = now
+        self.output.put((ready, message))
+
+    def _occupy_wire(self, size):
+        """Account for size bytes sent to the synth"""
+        if self.throttle:
+            with self.lock:
+                start = max(time.monotonic(), self.wire_in)
+                self.wire_in = start + size * BITS_PER_BYTE / BAUD_RATE
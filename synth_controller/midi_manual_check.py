@@ -0,0 +1,26 @@
+import midi
+from midi_emulator import EmulatedMopho
+from synths.packing_functions import mopho_unpack
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+TEST_DUMP = b'\xf0\x01%\x03\x00\x0c4\x017\x01\x00\x18\x000\x01\x16\x01\x00\x00\x03\x00\x02\x07\x04\x00\x00\x00R\x108\x00*\x01\x1d0\x00\x00\x04P\x00\x0b\x00\x7f\x00\x00\x00\x02\x1c\x7f\x11ZC\x00\x00\x00\x03\x00F\x00\x00\x00\x00\x00F\x00\x00\r\x00\x00F\x00\x00\x00\x00\x0bK\x00\x00\x00\x00R\x00\x00\x00\x00\x14\x7f\x01\tH\x00\x00 \x7f\x00\x00\x7f\x00~\x15\x01\x0c(\x7f\x00\x7f\x00\x7f\x00\x007d\x00x\x06\x02\x00\x00\x00\x00\x03\x00\x00\x00\x00\x05\x0bb_\x00\x00\x00\x00\x00\x00\x00\x00\x00\n\x00\x00\x00\x00\x00\x00\x00\x07\x00\x00\x00\x00\x00\x00\x06\x00\x18\x00\x00\x00\x00\x00\x00\x00\x06\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\n\x00\x00\x08\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x0030H3 \x00       \x00    \x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xf7'
+
+class Midi(midi.Midi):
+    """Allow testing without a synth, using an emulated mopho"""
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault(
+            'backend',
+            EmulatedMopho(edit_buffer=mopho_unpack(TEST_DUMP[4:-1]))
+        )
+        super().__init__(*args, **kwargs)
+
+    def send_nrpn(self, channel, nrpn, value):
+        logger.debug("channel:%s nrpn:%s value:%s", channel, nrpn, value)
+        super().send_nrpn(channel, nrpn, value)
+
+    def send_sysex(self, message):
+        logger.debug("sysex: %s", bytes(message).hex(' '))
+        super().send_sysex(message)
@@ -0,0 +1,206 @@
+import time
+
+MSG_SYSEX_START = 0xf0
+MSG_SYSEX_END = 0xf7
+MSG_PARAM_MSB = 0x63
+MSG_PARAM_LSB = 0x62
+MSG_VALUE_MSB = 0x06
+MSG_VALUE_LSB = 0x26
+MSG_INCREMENT = 0x60
+MSG_DECREMENT = 0x61
+MSG_RPN_LSB = 0x64
+MSG_RPN_MSB = 0x65
+MSG_NULL = 0x7f
+MSG_MSB_MASK = 0x3f80
+MSG_LSB_MASK = 0x7f
+MSG_MAX_VALUE = 0x3fff
+
+SYSEX_BUFFER_SIZE = 1024
+MAX_SYSEX_SIZE = 65536
+SYSEX_TIMEOUT = 1.0
+
+CHANNELS = 16
+CC_BYTES = 3
+NRPN_BYTES = 4 * CC_BYTES  # parameter msb and lsb, value msb and lsb
+HIGH_RES_CCS = 32  # controllers 0-31 may be paired with 32-63 as lsb
+
+class NrpnParser(object):
+    """Per channel state machine assembling nrpns from control changes.
+
+    State is held in preallocated lists, -1 marking unset values.
+    The parameter msb and lsb are held independently and may arrive in
+    either order.
+    Once a parameter is selected its value may be sent repeatedly,
+    or stepped with data increment / decrement, without resending the
+    parameter number (running status).
+    Controllers listed in 'high_res_ccs' are treated as 14 bit: their msb
+    is held until the matching lsb (controller + 32) arrives.
+    All other control changes are passed straight on."""
+    def __init__(self, nrpn_callback, cc_callback, high_res_ccs=()):
+        """create empty state for every channel.
+        callbacks are called with channel, parameter and value."""
+        self.nrpn_callback = nrpn_callback
+        self.cc_callback = cc_callback
+        self.high_res = [c in high_res_ccs for c in range(HIGH_RES_CCS)]
+        self.param_msb = [-1] * CHANNELS
+        self.param_lsb = [-1] * CHANNELS
+        self.param = [-1] * CHANNELS
+        self.value_msb = [-1] * CHANNELS
+        self.value = [-1] * CHANNELS
+        self.cc_msb = [-1] * (CHANNELS * HIGH_RES_CCS)
+
+    def feed(self, channel, control, value):
+        """parse one control change message"""
+        if control == MSG_VALUE_LSB:
+            param = self.param[channel]
+            msb = self.value_msb[channel]
+            if param >= 0 and msb >= 0:
+                self._set_value(channel, param, (msb << 7) | value)
+
+        elif control == MSG_VALUE_MSB:
+            self.value_msb[channel] = value
+
+        elif control == MSG_PARAM_LSB:
+            self.param_lsb[channel] = value
+            self._select_param(channel)
+
+        elif control == MSG_PARAM_MSB:
+            self.param_msb[channel] = value
+            self._select_param(channel)
+
+        elif control == MSG_INCREMENT or control == MSG_DECREMENT:
+            param = self.param[channel]
+            current = self.value[channel]
+            if param >= 0 and current >= 0:
+                step = 1 if control == MSG_INCREMENT else -1
+                self._set_value(
+                    channel,
+                    param,
+                    min(max(current + step, 0), MSG_MAX_VALUE)
+                )
+
+        elif control == MSG_RPN_LSB or control == MSG_RPN_MSB:
+            # a registered parameter is selected, ignore data entry
+            self.param_msb[channel] = -1
+            self.param_lsb[channel] = -1
+            self.param[channel] = -1
+
+        elif control < HIGH_RES_CCS and self.high_res[control]:
+            self.cc_msb[channel * HIGH_RES_CCS + control] = value
+
+        elif HIGH_RES_CCS <= control < 2 * HIGH_RES_CCS\
+             and self.high_res[control - HIGH_RES_CCS]:
+            msb = self.cc_msb[channel * HIGH_RES_CCS + control - HIGH_RES_CCS]
+            if msb >= 0:
+                self.cc_callback(
+                    channel,
+                    control - HIGH_RES_CCS,
+                    (msb << 7) | value
+                )
+
+        else: # standard cc
+            self.cc_callback(channel, control, value)
+
+    def _select_param(self, channel):
+        """select the parameter once both its bytes have arrived, the null
+        parameter deselects. clears the value being entered"""
+        msb = self.param_msb[channel]
+        lsb = self.param_lsb[channel]
+        if msb >= 0 and lsb >= 0\
+           and not (msb == MSG_NULL and lsb == MSG_NULL):
+            self.param[channel] = (msb << 7) | lsb
+        else:
+            self.param[channel] = -1
+        self.value_msb[channel] = -1
+        self.value[channel] = -1
+
+    def _set_value(self, channel, param, value):
+        """store value as the current value and pass on the nrpn"""
+        self.value[channel] = value
+        self.nrpn_callback(channel, param, value)
+
+
+class SysexParser(object):
+    """Reassembles sysex messages from the chunks delivered by midi input.
+
+    Chunks are copied into a preallocated buffer, so a message costs linear
+    time however it is split. Each complete message is passed to the
+    callback as a memoryview of its own buffer, which is not reused.
+    Chunks may hold several messages back to back. Partial messages are
+    abandoned when they grow beyond 'max_size', are interrupted by a new
+    message, or are not continued within 'timeout' seconds."""
+    def __init__(
+            self,
+            callback,
+            max_size=MAX_SYSEX_SIZE,
+            timeout=SYSEX_TIMEOUT,
+            buffer_size=SYSEX_BUFFER_SIZE
+        ):
+        """create empty buffer"""
+        self.callback = callback
+        self.max_size = max_size
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(buffer_size)
+        self.length = 0
+        self.in_message = False
+        self.last_time = 0
+        self.abandoned = 0
+
+    def _abandon(self):
+        """drop the partial message"""
+        self.in_message = False
+        self.length = 0
+        self.abandoned += 1
+
+    def feed(self, data, now=None):
+        """parse a chunk of sysex data"""
+        if now is None:
+            now = time.monotonic()
+        if self.in_message and now - self.last_time > self.timeout:
+            self._abandon()
+        self.last_time = now
+
+        if not isinstance(data, (bytes, bytearray)):
+            data = bytes(data)
+        position = 0
+        while position < len(data):
+            if not self.in_message:
+                position = data.find(MSG_SYSEX_START, position)
+                if position == -1:
+                    return
+                self.in_message = True
+                self.length = 0
+                # past the message's own start
+                search = position + 1
+            else:
+                # a continued message may be cut off by the chunk's first
+                # byte when its end was lost
+                search = position
+            start = position
+
+            end = data.find(MSG_SYSEX_END, start)
+            next_start = data.find(MSG_SYSEX_START, search)
+            if next_start != -1 and (end == -1 or next_start < end):
+                # message interrupted by the start of another
+                self._abandon()
+                position = next_start
+                continue
+
+            stop = len(data) if end == -1 else end + 1
+            if self.length + stop - start > self.max_size:
+                self._abandon()
+                position = stop
+                continue
+
+            self.buffer[self.length: self.length + stop - start] =\
+                data[start: stop]
+            self.length += stop - start
+            position = stop
+
+            if end != -1:
+                message = memoryview(self.buffer)[:self.length]
+                self.buffer = bytearray(self.buffer_size)
+                self.in_message = False
+                self.length = 0
+                self.callback(message)
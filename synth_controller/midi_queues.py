@@ -0,0 +1,142 @@
+import threading
+import time
+from itertools import islice
+
+# A DIN midi link runs at 31250 baud, 10 bits per byte, and an nrpn is four
+# 3 byte control changes: roughly 260 nrpns per second at most.
+NRPN_BUDGET = 250
+FLUSH_RATE = 50
+
+class NrpnScheduler(object):
+    """Coalesces out-going nrpn messages.
+
+    Only the latest value for each channel and nrpn is held. Pending
+    messages are sent at most 'rate' times a second, with no more than
+    'budget' messages per second, and the output drained once per batch.
+    The last value put for any nrpn is always sent."""
+    def __init__(self, send, drain, rate=FLUSH_RATE, budget=NRPN_BUDGET):
+        """start the flushing thread.
+        send - function(channel, nrpn, value) to output a message.
+        drain - function to drain output after each batch."""
+        self.send = send
+        self.drain = drain
+        self.interval = 1 / rate
+        self.batch_size = max(1, int(budget / rate))
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+        flush_thread = threading.Thread(
+            target=self._run,
+            daemon=True
+        )
+        flush_thread.start()
+
+    def put(self, channel, nrpn, value):
+        """queue a message, replacing any pending value for the same nrpn"""
+        with self.lock:
+            self.pending[(channel, nrpn)] = value
+        self.ready.set()
+
+    def _take_batch(self, size=None):
+        """remove and return up to 'size' pending messages"""
+        with self.lock:
+            batch = list(islice(self.pending.items(), size))
+            for key, _ in batch:
+                del self.pending[key]
+            if not self.pending:
+                self.ready.clear()
+        return batch
+
+    def _send_batch(self, batch):
+        """send batch of messages and drain output"""
+        for (channel, nrpn), value in batch:
+            self.send(channel, nrpn, value)
+        if batch:
+            self.drain()
+
+    def flush(self):
+        """send all pending messages now"""
+        self._send_batch(self._take_batch())
+
+    def _run(self):
+        """send pending messages at the flush rate"""
+        last_flush = 0
+        while True:
+            self.ready.wait()
+            delay = last_flush + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            last_flush = time.monotonic()
+            self._send_batch(self._take_batch(self.batch_size))
+
+INPUT_QUEUE_SIZE = 1024
+
+class InputQueue(object):
+    """Bounded, coalescing queue of incoming midi messages.
+
+    Filled by the midi input thread and emptied once per frame on the ui
+    thread. Only the latest value for each channel and parameter is kept;
+    sysex messages are kept in full. Messages arriving while the queue is
+    full are dropped and counted.
+    Any extra arguments to the put methods, such as a receive time, are
+    appended to the queued message."""
+    def __init__(self, size=INPUT_QUEUE_SIZE):
+        """create empty queue holding at most 'size' messages"""
+        self.size = size
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.sysex_count = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def _put(self, key, message):
+        """add message under key, replacing any pending message with the
+        same key and moving it to the back of the queue"""
+        with self.lock:
+            if key in self.pending:
+                del self.pending[key]
+                self.coalesced += 1
+            elif len(self.pending) >= self.size:
+                self.dropped += 1
+                return
+            self.pending[key] = message
+
+    def put_cc(self, channel, param, value, *extra):
+        """queue a control change"""
+        self._put(
+            ('cc', channel, param),
+            ('cc', channel, param, value) + extra
+        )
+
+    def put_nrpn(self, channel, param, value, *extra):
+        """queue a complete nrpn"""
+        self._put(
+            ('nrpn', channel, param),
+            ('nrpn', channel, param, value) + extra
+        )
+
+    def put_sysex(self, data, *extra):
+        """queue a complete sysex message"""
+        self.sysex_count += 1
+        self._put(('sysex', self.sysex_count), ('sysex', data) + extra)
+
+    def take(self):
+        """remove and return all queued messages in order of arrival"""
+        with self.lock:
+            messages = self.pending
+            self.pending = {}
+        return messages.values()
+
+    @property
+    def depth(self):
+        return len(self.pending)
+
+    @property
+    def stats(self):
+        """return dict of queue depth and coalesced and dropped counts"""
+        return {
+            'depth': self.depth,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+        }
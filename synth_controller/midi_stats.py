@@ -0,0 +1,139 @@
+from midi_parsers import CC_BYTES
+
+from array import array
+from bisect import bisect_left
+import json
+import threading
+import time
+
+# Latencies are measured from the first hop of each path:
+# in from midi receive, out from the widget change sending the nrpn.
+IN_HOPS = ('queue', 'callback', 'controller', 'display')
+OUT_HOPS = ('wire', 'drain')
+HISTORY = 1024  # samples kept per hop
+BUCKETS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+           0.1, 0.2, 0.5, 1.0)  # upper bounds, in seconds
+
+class LatencyHistogram(object):
+    """Latencies of the last 'size' samples, in a ring buffer"""
+    def __init__(self, size=HISTORY):
+        self.samples = array('d', bytes(8 * size))
+        self.size = size
+        self.count = 0
+
+    def add(self, latency):
+        """record a latency in seconds"""
+        self.samples[self.count % self.size] = latency
+        self.count += 1
+
+    @property
+    def recent(self):
+        """return sorted list of the samples held"""
+        return sorted(self.samples[:min(self.count, self.size)])
+
+    def histogram(self, buckets=BUCKETS):
+        """return counts of held samples in each bucket, the last count is
+        samples over the largest bound"""
+        counts = [0] * (len(buckets) + 1)
+        for latency in self.recent:
+            counts[bisect_left(buckets, latency)] += 1
+        return counts
+
+    def percentile(self, percent):
+        """return latency below which percent of held samples fall"""
+        recent = self.recent
+        if not recent:
+            return None
+        return recent[min(len(recent) - 1, len(recent) * percent // 100)]
+
+class MidiStats(object):
+    """Optional instrumentation of the midi pipeline.
+
+    Keeps rolling latency histograms for each hop of incoming and
+    out-going messages, and message and byte counts per channel.
+    Pass to Midi to enable; when not given nothing is recorded."""
+    def __init__(self, history=HISTORY, clock=time.monotonic):
+        self.clock = clock
+        self.hops = {hop: LatencyHistogram(history)
+                     for hop in IN_HOPS + OUT_HOPS}
+        self.channels = {}
+        self.receive_time = None
+        self.awaiting_display = []
+        self.lock = threading.Lock()
+        self.started = clock()
+
+    def hop(self, name, start):
+        """record latency from start to now for hop"""
+        self.hops[name].add(self.clock() - start)
+
+    def received(self, message):
+        """count a message from the midi input, note its receive time"""
+        self.receive_time = self.clock()
+        if message[0] == 'sysex':
+            self._count(message[0], 'in', len(message[1]))
+        else:
+            self._count(message[1], 'in', CC_BYTES)
+
+    def sent(self, channel, size):
+        """count a message of size bytes put on the wire"""
+        self._count(channel, 'out', size)
+
+    def delivered(self, received):
+        """note a message passed to the ui, to be timed at the next frame"""
+        self.awaiting_display.append(received)
+
+    def frame(self, *args):
+        """record display latency of messages delivered since last frame.
+        schedule once per frame on the ui thread."""
+        awaiting, self.awaiting_display = self.awaiting_display, []
+        for received in awaiting:
+            self.hop('display', received)
+
+    def _count(self, channel, direction, size):
+        with self.lock:
+            counts = self.channels.setdefault(channel, {
+                'in messages': 0,
+                'in bytes': 0,
+                'out messages': 0,
+                'out bytes': 0,
+            })
+            counts[direction + ' messages'] += 1
+            counts[direction + ' bytes'] += size
+
+    def as_dict(self):
+        """return all statistics as a json serialisable dict"""
+        return {
+            'seconds': self.clock() - self.started,
+            'buckets': BUCKETS,
+            'hops': {name: {
+                'count': histogram.count,
+                'median': histogram.percentile(50),
+                '99th percentile': histogram.percentile(99),
+                'histogram': histogram.histogram(),
+            } for name, histogram in self.hops.items()},
+            'channels': {str(channel): dict(counts)
+                         for channel, counts in self.channels.items()},
+        }
+
+    def report(self):
+        """return statistics as lines of text"""
+        lines = []
+        for name, histogram in self.hops.items():
+            median = histogram.percentile(50)
+            if median is None:
+                continue
+            lines.append(f"{name:10} median {median * 1000:7.2f}ms"
+                         f"  99% {histogram.percentile(99) * 1000:7.2f}ms"
+                         f"  ({histogram.count})")
+        for channel, counts in sorted(self.channels.items(), key=str):
+            lines.append(
+                f"channel {channel}: in {counts['in messages']} msgs"
+                f" {counts['in bytes']} bytes, out {counts['out messages']}"
+                f" msgs {counts['out bytes']} bytes"
+            )
+        return '\n'.join(lines)
+
+    def dump(self, filename):
+        """write statistics to filename as json"""
+        with open(filename, 'w') as fo:
+            json.dump(self.as_dict(), fo, indent=4)
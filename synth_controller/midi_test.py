@@ -1,20 +0,0 @@
-
-class Midi(object):
-    """Allow testing without sending midi"""
-    def set_callbacks(self, cc_in, sysex_in):
-        self.cc_in = cc_in
-        self.sysex_in = sysex_in
-
-    def send_nrpn(self, channel, nrpn, value):
-        print(f"channel:{channel} nrpn:{nrpn} value:{value}")
-        #if nrpn == 15:
-        #    self.cc_in(channel, 16, value)
-
-    def send_sysex(self, message):
-        print(message)
-        if message == b'\xf0\x01\x25\x06\xf7':
-            self.sysex_in(b'\xf0\x01%\x03\x00\x0c4\x017\x01\x00\x18\x000\x01\x16\x01\x00\x00\x03\x00\x02\x07\x04\x00\x00\x00R\x108\x00*\x01\x1d0\x00\x00\x04P\x00\x0b\x00\x7f\x00\x00\x00\x02\x1c\x7f\x11ZC\x00\x00\x00\x03\x00F\x00\x00\x00\x00\x00F\x00\x00\r\x00\x00F\x00\x00\x00\x00\x0bK\x00\x00\x00\x00R\x00\x00\x00\x00\x14\x7f\x01\tH\x00\x00 \x7f\x00\x00\x7f\x00~\x15\x01\x0c(\x7f\x00\x7f\x00\x7f\x00\x007d\x00x\x06\x02\x00\x00\x00\x00\x03\x00\x00\x00\x00\x05\x0bb_\x00\x00\x00\x00\x00\x00\x00\x00\x00\n\x00\x00\x00\x00\x00\x00\x00\x07\x00\x00\x00\x00\x00\x00\x06\x00\x18\x00\x00\x00\x00\x00\x00\x00\x06\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\n\x00\x00\x08\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x0030H3 \x00       \x00    \x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xf7')
-
-    
-        
-
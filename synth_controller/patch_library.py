@@ -0,0 +1,164 @@
+from synth_manager import IncorrectSynthError
+
+import hashlib
+import os
+import sqlite3
+
+LIBRARY_FILE = 'library.db'
+PATCH_EXTENSION = '.sysex'
+OPERATORS = ('<', '<=', '=', '>=', '>', '!=')
+
+class PatchLibrary(object):
+    """Library of patches held in a sqlite database.
+
+    Patch files are decoded once on import. The unpacked data, patch name
+    and a hash of the data are stored, along with each parameter value
+    indexed by nrpn so patches can be filtered by parameter.
+    Identical patches are only stored once per synth."""
+    def __init__(self, synth_manager, filename=LIBRARY_FILE):
+        """open or create library database"""
+        self.synth_manager = synth_manager
+        self.db = sqlite3.connect(filename)
+        self._create_tables()
+        self.added_callbacks = []
+
+    def bind_added(self, callback):
+        """Call callback with synth, patch id and unpacked data whenever a
+        patch is added"""
+        self.added_callbacks.append(callback)
+
+    def _create_tables(self):
+        """create tables and indexes if not already in database"""
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS patches (
+                id INTEGER PRIMARY KEY,
+                synth TEXT NOT NULL,
+                name TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                source TEXT,
+                data BLOB NOT NULL,
+                UNIQUE (synth, hash)
+            );
+            CREATE TABLE IF NOT EXISTS parameters (
+                patch INTEGER NOT NULL REFERENCES patches(id)
+                                       ON DELETE CASCADE,
+                nrpn INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (patch, nrpn)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS parameter_values
+                ON parameters (nrpn, value);
+            CREATE INDEX IF NOT EXISTS patch_names ON patches (synth, name);
+        """)
+        self.db.execute("PRAGMA foreign_keys = ON")
+
+    def _decode(self, synth, message):
+        """unpack a patch or program dump message, without the sysex start
+        and end bytes"""
+        try:
+            return self.synth_manager.unpack(synth, message)
+        except IncorrectSynthError:
+            return self.synth_manager.unpack_program(synth, message)
+
+    def add(self, synth, data, source=None):
+        """Add unpacked patch data to the library.
+        Return the patch id, or None if patch is already in library"""
+        data = bytes(data)
+        digest = hashlib.sha1(data).hexdigest()
+        index = self.synth_manager.get_index(synth)
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO patches (synth, name, hash, source, data)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    synth,
+                    self.synth_manager.get_patch_name(synth, data),
+                    digest,
+                    source,
+                    data
+                )
+            )
+            if not cursor.rowcount:
+                return None
+            patch_id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT INTO parameters (patch, nrpn, value) VALUES (?, ?, ?)",
+                [(patch_id, nrpn, data[i]) for nrpn, i in index.items()
+                 if i < len(data)]
+            )
+        for callback in self.added_callbacks:
+            callback(synth, patch_id, data)
+        return patch_id
+
+    def import_file(self, synth, filename):
+        """Decode a patch file and add it to the library.
+        Return the patch id, or None if patch is already in library.
+        Raises IncorrectSynthError if file is not a patch for synth"""
+        with open(filename, "rb") as fo:
+            message = fo.read()
+        data = self._decode(synth, message[1:-1])
+        return self.add(synth, data, os.path.abspath(filename))
+
+    def import_directory(self, synth, directory):
+        """Import every patch file in directory and its sub-directories.
+        Return number of patches added"""
+        added = 0
+        for path, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.endswith(PATCH_EXTENSION):
+                    try:
+                        if self.import_file(
+                                synth,
+                                os.path.join(path, filename)
+                            ) is not None:
+                            added += 1
+                    except IncorrectSynthError:
+                        pass
+        return added
+
+    def get(self, patch_id):
+        """Return synth, name and unpacked data of patch"""
+        return self.db.execute(
+            "SELECT synth, name, data FROM patches WHERE id = ?",
+            (patch_id,)
+        ).fetchone()
+
+    def patch_data(self, synth):
+        """Iterate over (id, unpacked data) of every patch for synth"""
+        return self.db.execute(
+            "SELECT id, data FROM patches WHERE synth = ? ORDER BY id",
+            (synth,)
+        )
+
+    def remove(self, patch_id):
+        """Remove patch from library"""
+        with self.db:
+            self.db.execute("DELETE FROM patches WHERE id = ?", (patch_id,))
+
+    def find(self, synth, conditions=(), name=None, limit=None):
+        """Return list of (id, name) of patches for synth matching every
+        condition, ordered by name.
+        conditions - sequence of (nrpn, operator, value),
+                     e.g. ((15, '<', 40), (2, '=', 1)).
+        name - only patches whose name contains this text."""
+        query = ["SELECT id, name FROM patches WHERE synth = ?"]
+        args = [synth]
+        for nrpn, operator, value in conditions:
+            if operator not in OPERATORS:
+                raise ValueError(f"unknown operator: {operator}")
+            query.append(
+                "AND id IN (SELECT patch FROM parameters"
+                f" WHERE nrpn = ? AND value {operator} ?)"
+            )
+            args.extend((nrpn, value))
+        if name:
+            query.append("AND name LIKE ?")
+            args.append(f"%{name}%")
+        query.append("ORDER BY name, id")
+        if limit:
+            query.append("LIMIT ?")
+            args.append(limit)
+        return self.db.execute(" ".join(query), args).fetchall()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM patches").fetchone()[0]
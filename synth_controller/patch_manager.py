@@ -1,7 +1,18 @@
 
 from synth_manager import IncorrectSynthError
+from bank_receiver import BankReceiver
+from patch_similarity import SimilarityIndex, range_weights
+from patch_morph import PatchMorph
+from sysex_dispatcher import IDENTITY_REQUEST, parse_identity_reply
+from patch_transactions import Transactions, gather
+from sequencer_patterns import OPERATIONS
+from midi_parsers import NRPN_BYTES
 
+from concurrent.futures import Future
 import os
+import time
+
+BACKUP_DIR = 'backups'
 
 class PatchManager(object):
     """Loads, saves, sends and receives patches (full synth patches).
@@ -13,15 +24,38 @@ class PatchManager(object):
             ui,
             controller_manager,
             synth_manager,
-            error_handler
+            error_handler,
+            library=None
         ):
-        """Store references to objects or relevent functions from objects"""
+        """Store references to objects or relevent functions from objects.
+        library - optional PatchLibrary that received programs are added to"""
         self.send_sysex = midi.send_sysex
+        self.send_nrpn = midi.send_nrpn
         self.ui = ui
-        self.get_controller_values = controller_manager.get_controller_values
-        self.set_controller_values = controller_manager.set_controller_values
+        self.get_state = controller_manager.get_state
+        self.get_discrete_nrpns = controller_manager.get_discrete_nrpns
+        self.get_journal = controller_manager.get_journal
         self.synth_manager = synth_manager
         self.error_handler = error_handler
+        self.library = library
+        self.get_parameter_ranges = controller_manager.get_parameter_ranges
+        self.similarity_indexes = {}
+        self.bank_receivers = []
+        self.morphs = {}
+        self.synth_states = {}
+        self.last_send = None
+        # synth to copied sequencer track steps
+        self.copied_tracks = {}
+        self.transactions = Transactions(self.send_sysex)
+        # device id to details from identity replies
+        self.identities = {}
+        self.sysex_handlers = {
+            'patch': self._on_patch_dump,
+            'program': self._on_program_dump,
+            'identity': self._on_identity_reply,
+        }
+        if library:
+            library.bind_added(self._on_library_added)
 
         self.ui.bind(on_load_unconfirmed=self.on_load_unconfirmed)
         self.ui.bind(on_load_confirmed=self.on_load_confirmed)
@@ -53,18 +87,203 @@ class PatchManager(object):
         self._apply_patch(synth, patch_data)
 
     def _apply_patch(self, synth, data):
-        """Parse, unpack and apply parameter values to controllers"""
+        """Parse, unpack and apply parameter values to controllers.
+        Return unpacked data, or None if data is not for synth"""
         try:
             unpacked_data = self.synth_manager.unpack(synth, data[1:-1])
-            self.set_controller_values(
-                            self.synth_manager.get_channel(synth),
-                            self.synth_manager.get_order(synth),
-                            unpacked_data
-                        )
+            self._set_values(synth, unpacked_data)
+            return unpacked_data
         except IncorrectSynthError:
             self.error_handler.error('INCORRECT_SYNTH', synth)    
+
+    def _set_values(self, synth, unpacked_data):
+        """Apply unpacked parameter values to synth's state, as one undo
+        entry"""
+        changes = self.get_state(synth).set_patch(
+                        self.synth_manager.get_index(synth),
+                        unpacked_data
+                    )
+        self.get_journal(synth).record_entry(changes)
+
+    def undo(self, synth):
+        """Undo the last change to synth's parameters"""
+        self._replay(synth, self.get_journal(synth).undo())
+
+    def redo(self, synth):
+        """Redo the last undone change to synth's parameters"""
+        self._replay(synth, self.get_journal(synth).redo())
+
+    def _replay(self, synth, changes):
+        """Set (nrpn, value) changes in synth's state and send only them,
+        leaving other unsent edits alone. If the state on the synth is
+        known and a full patch is fewer bytes, the changes are sent as the
+        known patch with them applied"""
+        if not changes:
+            return
+        state = self.get_state(synth)
+        for nrpn, value in changes:
+            state.set(nrpn, value)
+        known = self.synth_states.get(synth)
+        if known is not None:
+            patch_data = list(known)
+            index = self.synth_manager.get_index(synth)
+            for nrpn, value in changes:
+                if nrpn in index:
+                    patch_data[index[nrpn]] = value
+            try:
+                message = self._patch_message(synth, patch_data)
+            except ValueError:
+                message = None # values over a byte can still be nrpns
+            if message is not None\
+               and len(message) < len(changes) * NRPN_BYTES:
+                self.send_sysex(message)
+                self.synth_states[synth] = bytearray(patch_data)
+                return
+        channel = self.synth_manager.get_channel(synth)
+        for nrpn, value in changes:
+            self.send_nrpn(channel, nrpn, value)
+            self.note_sent(synth, nrpn, value)
+
+    def edit_track(self, synth, operation, track):
+        """Apply a pattern operation to the steps of one of synth's
+        sequencer tracks: 'rotate left', 'rotate right', 'reverse' and
+        'randomise' from sequencer_patterns, or 'copy' and 'paste'"""
+        tracks = self.synth_manager.get_sequencer_tracks(synth)
+        if not 0 <= track < len(tracks):
+            self.error_handler.error('NO_SEQUENCER', synth)
+            return
+        steps = self.get_state(synth).get_values(tracks[track])
+        if operation == 'copy':
+            self.copied_tracks[synth] = steps
+        elif operation == 'paste':
+            if synth in self.copied_tracks:
+                self.set_track(synth, track, self.copied_tracks[synth])
+            else:
+                self.error_handler.error('NOTHING_COPIED', synth)
+        else:
+            self.set_track(
+                synth,
+                track,
+                OPERATIONS[operation](
+                    steps,
+                    self.synth_manager.get_step_range(synth)
+                )
+            )
+
+    def paste_library_track(self, synth, track, patch_id, from_track=None):
+        """Set the steps of one of synth's sequencer tracks from a track
+        of a library patch, by default the same track"""
+        if self.library is None:
+            self.error_handler.error('NO_LIBRARY', synth)
+            return
+        tracks = self.synth_manager.get_sequencer_tracks(synth)
+        if from_track is None:
+            from_track = track
+        if not (0 <= track < len(tracks) and 0 <= from_track < len(tracks)):
+            self.error_handler.error('NO_SEQUENCER', synth)
+            return
+        index = self.synth_manager.get_index(synth)
+        data = self.library.get(patch_id)[2]
+        self.set_track(
+            synth,
+            track,
+            [data[index[nrpn]] for nrpn in tracks[from_track]]
+        )
+
+    def set_track(self, synth, track, steps):
+        """Set the steps of one of synth's sequencer tracks as one undo
+        entry. Only the steps that change are sent, together, as nrpns or
+        as a full patch if that is cheaper, see _replay"""
+        nrpns = self.synth_manager.get_sequencer_tracks(synth)[track]
+        state = self.get_state(synth)
+        changes = [(nrpn, state.get(nrpn), value)
+                   for nrpn, value in zip(nrpns, steps)
+                   if state.get(nrpn) != value]
+        self.get_journal(synth).record_entry(changes)
+        self._replay(synth, [(nrpn, new) for nrpn, _, new in changes])
+
+    def load_library_patch(self, patch_id):
+        """Apply a patch from the library to its synth's controllers"""
+        synth, _, data = self.library.get(patch_id)
+        self._set_values(synth, data)
         
 
+    def _on_library_added(self, synth, patch_id, data):
+        """Add new library patch to synth's similarity index"""
+        if synth in self.similarity_indexes:
+            self.similarity_indexes[synth].add(patch_id, data)
+
+    def find_similar(self, synth, k=10, weights=None):
+        """Return list of (patch id, distance) of the k library patches
+        closest to the current controller values for synth.
+        weights - optional dict of nrpn to weight for each parameter,
+                  the synth's index is rebuilt if given"""
+        if self.library is None:
+            self.error_handler.error('NO_LIBRARY', synth)
+            return []
+        order = self.synth_manager.get_order(synth)
+        if synth not in self.similarity_indexes or weights:
+            self.similarity_indexes[synth] = SimilarityIndex.from_library(
+                self.library,
+                synth,
+                range_weights(
+                    self.synth_manager.get_index(synth),
+                    len(order),
+                    self.get_parameter_ranges(synth),
+                    weights
+                )
+            )
+        values = self.get_state(synth).get_patch(order)
+        return self.similarity_indexes[synth].nearest(values, k)
+
+    def morph(self, synth, end_id, start_id=None):
+        """Start morphing synth from a library patch, or the current
+        controller values if start_id is None, to library patch end_id.
+        Return the PatchMorph, or None if there is no library. Move it
+        with set_morph_position, it replaces any morph already started"""
+        if self.library is None:
+            self.error_handler.error('NO_LIBRARY', synth)
+            return None
+        order = self.synth_manager.get_order(synth)
+        if start_id is None:
+            start = self.get_state(synth).get_patch(order)
+        else:
+            start = self.library.get(start_id)[2]
+        end = self.library.get(end_id)[2]
+        # nrpns without controllers are not known to be continuous
+        discrete = set(order) - set(self.get_parameter_ranges(synth))\
+                   | self.get_discrete_nrpns(synth)
+        self.morphs[synth] = PatchMorph(
+                                start,
+                                end,
+                                order,
+                                discrete,
+                                lambda nrpn, value:\
+                                    self._send_morph_value(synth, nrpn, value)
+                            )
+        return self.morphs[synth]
+
+    def set_morph_position(self, synth, position):
+        """Move synth's morph to position between 0 (start) and 1 (end).
+        The morph is kept until another is started, so it can be swept
+        back and forth"""
+        morph = self.morphs.get(synth)
+        if morph is not None:
+            morph.set_position(position)
+
+    def _send_morph_value(self, synth, nrpn, value):
+        """Send a morphed parameter and set it in synth's state and the
+        state known on the synth"""
+        self.send_nrpn(self.synth_manager.get_channel(synth), nrpn, value)
+        self.get_state(synth).set(nrpn, value)
+        self.note_sent(synth, nrpn, value)
+
+    def library_patches(self, synth):
+        """Return list of (patch id, name) of synth's library patches"""
+        if self.library is None:
+            return []
+        return self.library.find(synth)
+
     def on_save(self, synth):
         """Open a load dialogue in the ui"""
         # check here for controllers (incl. dummies) for every parameter
@@ -83,46 +302,226 @@ class PatchManager(object):
     def on_save_confirmed(self, synth, data):
         """Save patch to hard disk"""
         synth, filename = data
-        patch_data = self.get_controller_values(
-                                    synth,
-                                    self.synth_manager.get_order(synth),
+        patch_data = self.get_state(synth).get_patch(
+                                    self.synth_manager.get_order(synth)
                                 )
-
-        packed_data = self.synth_manager.pack(synth, patch_data)
+        try:
+            packed_data = self.synth_manager.pack(synth, patch_data)
+        except ValueError:
+            self.error_handler.error('VALUE_OUT_OF_RANGE', synth)
+            return
         
-        with open(filename, "rb") as fo:
-            fo.write(0xf0)
+        with open(filename, "wb") as fo:
+            fo.write(b'\xf0')
+            fo.write(self.synth_manager.get_header(synth))
             fo.write(packed_data)
-            fo.write(0xf7)
+            fo.write(b'\xf7')
 
 
     def on_send(self, synth):
-        """Get and pack controller values, create and send sysex message"""
-        patch_data = self.get_controller_values(
-                                    synth,
-                                    self.synth_manager.get_order(synth),
+        """Send synth's state to the synth.
+        If the synth's state is known, only changed parameters are sent as
+        nrpns when that is fewer bytes than a full sysex patch message"""
+        patch_data = self.get_state(synth).get_patch(
+                                    self.synth_manager.get_order(synth)
                                 )
-        packed_data = self.synth_manager.pack(synth, patch_data)
+        try:
+            message = self._patch_message(synth, patch_data)
+        except ValueError:
+            self.error_handler.error('VALUE_OUT_OF_RANGE', synth)
+            return
 
+        changed = self._changed_parameters(synth, patch_data)
+        if changed is not None and len(changed) * NRPN_BYTES < len(message):
+            channel = self.synth_manager.get_channel(synth)
+            for nrpn, value in changed:
+                self.send_nrpn(channel, nrpn, value)
+            self.last_send = ('nrpn', len(changed) * NRPN_BYTES, len(message))
+        else:
+            self.send_sysex(message)
+            self.last_send = ('sysex', len(message), len(message))
+
+        self.synth_states[synth] = bytearray(patch_data)
+        self.error_handler.info('SEND_REPORT', (synth,) + self.last_send)
+
+    def _patch_message(self, synth, patch_data):
+        """Return sysex message setting synth's edit buffer to patch_data.
+        Raise ValueError if a value does not fit in the patch"""
         message = b'\xf0'
         message += self.synth_manager.get_header(synth)
-        message += packed_data
+        message += self.synth_manager.pack(synth, patch_data)
         message += b'\xf7'
-        self.send_sysex(message)
+        return message
+
+    def _changed_parameters(self, synth, patch_data):
+        """Return list of (nrpn, value) that differ from the state known on
+        the synth, or None if the state is not known"""
+        known = self.synth_states.get(synth)
+        if known is None:
+            return None
+        return [(nrpn, patch_data[i]) for nrpn, i\
+                in self.synth_manager.get_index(synth).items()\
+                if patch_data[i] != known[i]]
+
+    def note_sent(self, synth, nrpn, value):
+        """Record a parameter value sent to the synth outside of patches"""
+        known = self.synth_states.get(synth)
+        if known is not None:
+            position = self.synth_manager.get_index(synth).get(nrpn)
+            if position is not None and 0 <= value < 256:
+                known[position] = value
+
+    def note_received(self, channel, nrpn, value):
+        """Record a parameter value received from the synths on channel,
+        such as a front panel edit, as they now hold it"""
+        for synth in self.synth_states:
+            if self.synth_manager.get_channel(synth) == channel:
+                self.note_sent(synth, nrpn, value)
 
     def on_receive(self, synth):
-        """Send request patch sysex message to synth"""
+        """Send request patch sysex message to synth.
+        Return Future completed with the patch dump, or None"""
         if self.synth_manager.is_patchable(synth):
             message = self.synth_manager.get_request(synth)
-            self.send_sysex(b'\xf0' + message + b'\xf7')
+            future = self.transactions.request(
+                ('patch', synth),
+                b'\xf0' + message + b'\xf7'
+            )
+            future.add_done_callback(
+                lambda future: self._on_received(synth, future)
+            )
+            return future
         else:
             self.error_handler.error('NO_PATCH_DETAILS', synth)
+            return None
+
+    def _on_received(self, synth, future):
+        """report a requested patch that did not arrive"""
+        if not future.cancelled() and future.exception():
+            self.error_handler.error('PATCH_NOT_RECEIVED', synth)
+
+    def receive_all(self):
+        """Request the patch of every patchable synth at once.
+        Return Future completed with dict of synth to patch dump for
+        synths that replied"""
+        synths = self.synth_manager.patchable_synths
+        futures = [self.on_receive(synth) for synth in synths]
+        result = Future()
+
+        def on_complete(futures):
+            received = {synth: future.result()
+                        for synth, future in zip(synths, futures)
+                        if not future.cancelled() and not future.exception()}
+            self.error_handler.info(
+                'ALL_RECEIVED',
+                (len(received), len(synths))
+            )
+            result.set_result(received)
+
+        gather(futures, on_complete)
+        return result
+
+    def on_receive_bank(self, synth):
+        """Receive every program in every bank of synth, save them to the
+        backup directory"""
+        if self.synth_manager.is_bank_receivable(synth):
+            banks, programs = self.synth_manager.get_banks(synth)
+            self.receive_programs(
+                synth,
+                [(b, p) for b in range(banks) for p in range(programs)],
+                on_complete=lambda programs, failed:\
+                            self._save_backup(synth, programs, failed)
+            )
+        else:
+            self.error_handler.error('NO_BANK_DETAILS', synth)
+
+    def receive_programs(
+            self,
+            synth,
+            programs,
+            on_progress=None,
+            on_complete=None
+        ):
+        """Request given list of (bank, program) from synth.
+        Return the BankReceiver, see it for callback details"""
+        if not on_progress:
+            on_progress = lambda received, total:\
+                self.error_handler.info(
+                    'BANK_PROGRESS',
+                    (synth, received, total)
+                )
+        receiver = BankReceiver(
+                        programs,
+                        self.synth_manager.get_program_request(synth),
+                        self.synth_manager.get_program_header(synth),
+                        self.send_sysex,
+                        on_progress,
+                        on_complete
+                    )
+        self.bank_receivers.append(receiver)
+        receiver.start()
+        return receiver
+
+    def _save_backup(self, synth, programs, failed):
+        """Save received programs as patch files in a new backup directory"""
+        directory = os.path.join(
+                        BACKUP_DIR,
+                        synth,
+                        time.strftime('%Y-%m-%d_%H-%M-%S')
+                    )
+        os.makedirs(directory, exist_ok=True)
+        header = self.synth_manager.get_header(synth)
+        for (bank, program), data in sorted(programs.items()):
+            filename = os.path.join(
+                            directory,
+                            f"{synth}_{bank}_{program:03}.sysex"
+                        )
+            with open(filename, "wb") as fo:
+                fo.write(b'\xf0' + header + data + b'\xf7')
+            if self.library:
+                self.library.import_file(synth, filename)
+
+        if failed:
+            self.error_handler.error('PROGRAMS_NOT_RECEIVED', (synth, failed))
+        self.error_handler.info('BANK_SAVED', (len(programs), directory))
+
+    def update(self, *args):
+        """Resend timed out program requests, fail late patch requests.
+        Call regularly"""
+        for receiver in self.bank_receivers:
+            receiver.update()
+        self.transactions.update()
+        self.bank_receivers = [r for r in self.bank_receivers if not r.done]
 
     def parse_sysex(self, message):
-        """Find out which synth incoming sysex message is for.
-        apply patch if possible"""
-        synth = self.synth_manager.find_synth(message[1:-1])
-        if synth:
-            self._apply_patch(synth, message)
+        """Find out which synth and type incoming sysex message is for and
+        pass it to the handler for that type"""
+        route = self.synth_manager.route(message[1:-1])
+        if route:
+            message_type, synth = route
+            self.sysex_handlers[message_type](synth, message)
+
+    def _on_patch_dump(self, synth, message):
+        """apply patch if possible"""
+        unpacked_data = self._apply_patch(synth, message)
+        if unpacked_data is not None:
+            # patch received from synth, so its state is now known
+            self.synth_states[synth] = bytearray(unpacked_data)
+        self.transactions.parse_sysex(('patch', synth), message)
+
+    def _on_program_dump(self, synth, message):
+        """pass program dump to the bank receiver waiting for it"""
+        for receiver in self.bank_receivers:
+            if receiver.parse_sysex(message):
+                return
+
+    def request_identity(self):
+        """Ask all connected devices to identify themselves"""
+        self.send_sysex(IDENTITY_REQUEST)
+
+    def _on_identity_reply(self, _, message):
+        """note the identity of a connected device"""
+        identity = parse_identity_reply(message)
+        self.identities[identity['device']] = identity
             
         
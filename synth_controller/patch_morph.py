@@ -0,0 +1,100 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class PatchMorph(object):
+    """Morphs between two patches.
+
+    Only parameters that differ between the patches take part. Their start
+    values and differences are precomputed as arrays; continuous
+    parameters are interpolated, discrete ones switch half way.
+    Each change of position sends only the nrpns whose value changed.
+    Rate limiting is left to the send function, such as Midi.send_nrpn,
+    whose scheduler keeps the latest value of each nrpn within its budget.
+    The morph is done once it reaches the end patch."""
+    def __init__(
+            self,
+            start,
+            end,
+            nrpn_order,
+            discrete_nrpns,
+            send,
+            use_numpy=True
+        ):
+        """start, end - unpacked patch data.
+        nrpn_order - nrpn of each patch position.
+        discrete_nrpns - set of nrpns that are not interpolated.
+        send - function(nrpn, value) to send a parameter value.
+        use_numpy - False to interpolate in pure python even if numpy is
+                    available"""
+        self.send = send
+        self.numpy = numpy if use_numpy else None
+        self.position = 0.0
+
+        nrpns, starts, ends, discrete = [], [], [], []
+        seen = set()
+        for i, nrpn in enumerate(nrpn_order):
+            if nrpn not in seen and start[i] != end[i]:
+                nrpns.append(nrpn)
+                starts.append(start[i])
+                ends.append(end[i])
+                discrete.append(nrpn in discrete_nrpns)
+            seen.add(nrpn)
+
+        self.nrpns = nrpns
+        if self.numpy:
+            self.starts = numpy.array(starts, dtype=numpy.float64)
+            self.ends = numpy.array(ends, dtype=numpy.int64)
+            self.deltas = self.ends - self.starts
+            self.discrete = numpy.array(discrete, dtype=bool)
+            self.current = self.starts.astype(numpy.int64)
+        else:
+            self.starts = array('d', starts)
+            self.ends = array('l', ends)
+            self.deltas = array('d', (e - s for s, e in zip(starts, ends)))
+            self.discrete = array('b', discrete)
+            self.current = array('l', starts)
+
+    def _targets(self, position):
+        """return list of (index, value) of parameters whose value at
+        position differs from the current value, and update current"""
+        if self.numpy:
+            targets = numpy.floor(self.starts + self.deltas * position + 0.5)\
+                           .astype(numpy.int64)
+            targets[self.discrete] = self.ends[self.discrete]\
+                if position >= 0.5\
+                else self.starts[self.discrete].astype(numpy.int64)
+            changed = numpy.flatnonzero(targets != self.current)
+            self.current[changed] = targets[changed]
+            return zip(changed.tolist(), targets[changed].tolist())
+
+        changed = []
+        half_way = position >= 0.5
+        for i, (start, delta, discrete) in enumerate(
+                zip(self.starts, self.deltas, self.discrete)):
+            if discrete:
+                target = self.ends[i] if half_way else int(start)
+            else:
+                target = int(start + delta * position + 0.5)
+            if target != self.current[i]:
+                self.current[i] = target
+                changed.append((i, target))
+        return changed
+
+    def set_position(self, position):
+        """Move morph to position between 0 (start) and 1 (end), send
+        changed parameters"""
+        self.position = min(max(position, 0.0), 1.0)
+        for i, value in self._targets(self.position):
+            self.send(self.nrpns[i], value)
+
+    @property
+    def done(self):
+        """True once the morph has reached the end patch"""
+        return self.position == 1.0
+
+    def __len__(self):
+        return len(self.nrpns)
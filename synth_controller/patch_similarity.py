@@ -0,0 +1,106 @@
+import heapq
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INITIAL_CAPACITY = 1024
+
+def range_weights(nrpn_index, n_parameters, ranges, weights=None):
+    """Return a weight for each position in a patch.
+    Each parameter's weight is divided by the square of its range so every
+    parameter counts equally, parameters with no range get no weight.
+    nrpn_index - dict of nrpn to patch position.
+    ranges - dict of nrpn to (minimum, maximum) midi values.
+    weights - optional dict of nrpn to extra weight."""
+    output = [0.0] * n_parameters
+    for nrpn, (minimum, maximum) in ranges.items():
+        if nrpn in nrpn_index and maximum > minimum:
+            weight = weights.get(nrpn, 1.0) if weights else 1.0
+            output[nrpn_index[nrpn]] = weight / (maximum - minimum) ** 2
+    return output
+
+class SimilarityIndex(object):
+    """Nearest neighbour search over unpacked patch data.
+
+    Distance is the square root of the weighted sum of squared parameter
+    differences. Only parameters with a weight are stored, in one
+    contiguous matrix that grows as patches are added, so adding a patch
+    never rebuilds the index. Uses numpy if available."""
+    def __init__(self, weights, use_numpy=True):
+        """weights - weight for each position in a patch, see range_weights.
+        use_numpy - False to search in pure python even if numpy is
+                    available"""
+        self.columns = [i for i, w in enumerate(weights) if w]
+        self.ids = []
+        self.numpy = numpy if use_numpy else None
+        if self.numpy:
+            self.weights = numpy.array(
+                [weights[i] for i in self.columns],
+                dtype=numpy.float64
+            )
+            self.matrix = numpy.zeros(
+                (INITIAL_CAPACITY, len(self.columns)),
+                dtype=numpy.float32
+            )
+        else:
+            self.weights = [weights[i] for i in self.columns]
+            self.rows = []
+
+    @classmethod
+    def from_library(cls, library, synth, weights, use_numpy=True):
+        """Create index of every patch for synth in library"""
+        index = cls(weights, use_numpy)
+        for patch_id, data in library.patch_data(synth):
+            index.add(patch_id, data)
+        return index
+
+    def _select(self, data):
+        """return the weighted parameters of unpacked data"""
+        return [data[i] for i in self.columns]
+
+    def add(self, patch_id, data):
+        """Add unpacked patch data to the index"""
+        row = self._select(data)
+        if self.numpy:
+            count = len(self.ids)
+            if count == len(self.matrix):
+                self.matrix = numpy.concatenate(
+                    (self.matrix, numpy.zeros_like(self.matrix))
+                )
+            self.matrix[count] = row
+        else:
+            self.rows.append(row)
+        self.ids.append(patch_id)
+
+    def nearest(self, data, k=10):
+        """Return list of (patch id, distance) of the k patches closest to
+        the unpacked data, closest first"""
+        count = len(self.ids)
+        k = min(k, count)
+        if not k:
+            return []
+        target = self._select(data)
+
+        if self.numpy:
+            difference = self.matrix[:count] - numpy.array(
+                                                    target,
+                                                    dtype=numpy.float32
+                                                )
+            distances = (difference * difference) @ self.weights
+            closest = numpy.argpartition(distances, k - 1)[:k]
+            closest = closest[numpy.argsort(distances[closest])]
+            return [(self.ids[i], math.sqrt(distances[i])) for i in closest]
+
+        weighted = list(zip(self.weights, target))
+        distances = (
+            (sum(w * (a - b) ** 2 for (w, a), b in zip(weighted, row)), i)
+            for i, row in enumerate(self.rows)
+        )
+        return [(self.ids[i], math.sqrt(distance))
+                for distance, i in heapq.nsmallest(k, distances)]
+
+    def __len__(self):
+        return len(self.ids)
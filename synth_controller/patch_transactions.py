@@ -0,0 +1,85 @@
+from concurrent.futures import Future
+import time
+
+TIMEOUT = 2.0  # seconds to wait for a reply
+
+class Transactions(object):
+    """Outstanding requests to synths, each waiting for its reply.
+
+    A request is correlated with its reply by the reply's route, message
+    type and synth, from the sysex dispatcher. Mopho dumps carry no channel
+    or device id, so there is nothing finer to match on and replies with
+    the same route complete requests oldest first.
+    Each request has a deadline and a Future, completed with the reply
+    message, or with TransactionTimeout if the deadline passes first.
+    Requests to different synths are outstanding at the same time.
+    Call parse_sysex with routed incoming messages and update regularly,
+    both from the ui thread, so done callbacks run on the ui thread."""
+    def __init__(self, send_sysex, timeout=TIMEOUT):
+        self.send_sysex = send_sysex
+        self.timeout = timeout
+        self.pending = []
+
+    def request(self, route, message, timeout=None, now=None):
+        """send message and return a Future for the reply with route"""
+        if now is None:
+            now = time.monotonic()
+        future = Future()
+        self.pending.append(_Transaction(
+            route,
+            now + (self.timeout if timeout is None else timeout),
+            future
+        ))
+        self.send_sysex(message)
+        return future
+
+    def parse_sysex(self, route, message):
+        """complete the oldest request waiting for message.
+        Return true if message was a reply"""
+        for transaction in self.pending:
+            if transaction.route == route:
+                self.pending.remove(transaction)
+                transaction.future.set_result(message)
+                return True
+        return False
+
+    def update(self, now=None):
+        """fail requests past their deadline"""
+        if now is None:
+            now = time.monotonic()
+        expired = [t for t in self.pending if now > t.deadline]
+        for transaction in expired:
+            self.pending.remove(transaction)
+            transaction.future.set_exception(
+                TransactionTimeout(transaction.route)
+            )
+
+    def cancel_all(self):
+        """cancel every outstanding request"""
+        pending, self.pending = self.pending, []
+        for transaction in pending:
+            transaction.future.cancel()
+
+def gather(futures, on_complete):
+    """call on_complete with list of futures once all are done"""
+    futures = list(futures)
+    remaining = [len(futures)]
+    def done(_):
+        remaining[0] -= 1
+        if not remaining[0]:
+            on_complete(futures)
+    if not futures:
+        on_complete(futures)
+    for future in futures:
+        future.add_done_callback(done)
+
+class _Transaction(object):
+    __slots__ = ('route', 'deadline', 'future')
+
+    def __init__(self, route, deadline, future):
+        self.route = route
+        self.deadline = deadline
+        self.future = future
+
+class TransactionTimeout(Exception):
+    pass
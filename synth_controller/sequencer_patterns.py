@@ -0,0 +1,33 @@
+from array import array
+import random
+
+# Operations on a sequencer track's step values, held in an array.
+# Each returns a new array of the same type.
+
+def rotate(steps, amount=1):
+    """return steps moved amount steps later, wrapping the end round to
+    the start. Negative amounts move earlier"""
+    if not steps:
+        return array(steps.typecode)
+    amount %= len(steps)
+    return steps[len(steps) - amount:] + steps[:len(steps) - amount]
+
+def reverse(steps):
+    """return steps in reverse order"""
+    result = array(steps.typecode, steps)
+    result.reverse()
+    return result
+
+def randomise(steps, minimum, maximum, rng=random):
+    """return random steps between minimum and maximum inclusive"""
+    return array(
+        steps.typecode,
+        [rng.randint(minimum, maximum) for _ in range(len(steps))]
+    )
+
+OPERATIONS = {
+    'rotate left': lambda steps, _: rotate(steps, -1),
+    'rotate right': lambda steps, _: rotate(steps, 1),
+    'reverse': lambda steps, _: reverse(steps),
+    'randomise': lambda steps, step_range: randomise(steps, *step_range),
+}
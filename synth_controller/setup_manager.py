@@ -12,6 +12,8 @@ class SetupManager(object):
         self._load_main_settings()
         self._confirm_setup()
         self._load_setup_settings()
+        # zero based channel of each synth assigned so far
+        self.assigned_channels = {}
 
         self.ui.bind(on_channel_selection=self.on_channel_selection)
 
@@ -72,30 +74,39 @@ class SetupManager(object):
     def assign_channels(self, synths):
         """Check if all controlled synths have a midi channel assigned in
         settings.
-        Run midi channel selction if not."""
+        Run midi channel selction if not.
+        Synths already assigned are skipped, so can be called again as
+        screens with new synths are built."""
         synth_missing = False
         channels = {}
         for synth in synths:
+            if synth in self.assigned_channels:
+                continue
             if synth not in self.setup_settings['synth channels']:
                 channels[synth] = None
                 synth_missing = True
             else:
                 channels[synth] = self.setup_settings['synth channels'][synth] - 1
 
+        self.assigned_channels.update(channels)
         if synth_missing:
             self.ui.channel_selection_popup(channels)
-        else:
-            self.setup_settings['synth channels'] = channels
 
     def on_channel_selection(self, _, channels): 
         """Set the channels dict as requested in the channel selection popup.
         Assign channels in controllers"""
-        self.setup_settings['synth channels'] = channels
+        self.setup_settings['synth channels'].update(channels)
         self._save_setup_settings()
+        for synth, channel in channels.items():
+            self.assigned_channels[synth] = channel - 1
 
     @property
     def channels(self):
-        return self.setup_settings['synth channels']
+        """return dict of zero based channel of each assigned synth.
+        synths still waiting for a channel from the selection popup are
+        left out"""
+        return {synth: channel for synth, channel\
+                in self.assigned_channels.items() if channel is not None}
 
     @property
     def initial_screen(self):
@@ -0,0 +1,297 @@
+from automation import AutomationFile, IN, OUT, wait_until
+from midi_parsers import NrpnParser, MSG_PARAM_MSB, MSG_PARAM_LSB,\
+                         MSG_VALUE_MSB, MSG_VALUE_LSB, CHANNELS
+
+import heapq
+import struct
+import threading
+import time
+
+PPQ = 960  # ticks per quarter note
+TEMPO = 500000  # microseconds per quarter note, 120 bpm
+READ_SIZE = 65536  # bytes read from a track at a time
+CONTROL_CHANGE = 0xb0
+META = 0xff
+META_TRACK_NAME = 0x03
+META_TEMPO = 0x51
+META_END_OF_TRACK = 0x2f
+SYSEX = 0xf0
+SYSEX_ESCAPE = 0xf7
+
+def export_automation(automation_filename, filename, channels=None,
+                      file_type=1, directions=(IN, OUT), ppq=PPQ):
+    """Write the nrpns recorded in an automation file to a standard midi
+    file of type 0 or 1, as control changes.
+    channels - dict of synth to midi channel, such as SetupManager.channels;
+               only nrpns on these channels are written. Type 1 files have
+               a track named after each synth. If None every channel used
+               is written, on tracks named by channel number.
+    Records are streamed from the memory mapped automation file, so any
+    length of recording is written in constant memory."""
+    automation = AutomationFile(automation_filename)
+    try:
+        if channels is None:
+            used = set(automation[i][2] for i in range(len(automation)))
+            channels = {f"channel {c + 1}": c for c in sorted(used)}
+        ticks_per_second = ppq * 1000000 / TEMPO
+        with open(filename, 'wb') as fo:
+            if file_type == 0:
+                fo.write(_header(0, 1, ppq))
+                _write_track(fo, _tempo_event(), _automation_events(
+                    automation,
+                    set(channels.values()),
+                    directions,
+                    ticks_per_second
+                ))
+            else:
+                fo.write(_header(1, len(channels) + 1, ppq))
+                _write_track(fo, _tempo_event())
+                for synth, channel in channels.items():
+                    _write_track(
+                        fo,
+                        [(0, bytes((META, META_TRACK_NAME))
+                          + _vlq(len(synth.encode())) + synth.encode())],
+                        _automation_events(
+                            automation,
+                            {channel},
+                            directions,
+                            ticks_per_second
+                        )
+                    )
+    finally:
+        automation.close()
+
+def _header(file_type, tracks, ppq):
+    return b'MThd' + struct.pack('>IHHH', 6, file_type, tracks, ppq)
+
+def _tempo_event():
+    return [(0, bytes((META, META_TEMPO, 3)) + TEMPO.to_bytes(3, 'big'))]
+
+def _automation_events(automation, channels, directions, ticks_per_second):
+    """yield (tick, message) of control changes for the recorded nrpns on
+    channels going in directions"""
+    for i in range(len(automation)):
+        when, direction, channel, nrpn, value = automation[i]
+        if direction in directions and channel in channels:
+            tick = round(when * ticks_per_second)
+            status = CONTROL_CHANGE | channel
+            for control, data in (
+                    (MSG_PARAM_MSB, nrpn >> 7),
+                    (MSG_PARAM_LSB, nrpn & 0x7f),
+                    (MSG_VALUE_MSB, value >> 7),
+                    (MSG_VALUE_LSB, value & 0x7f)
+                ):
+                yield tick, bytes((status, control, data))
+
+def _write_track(fo, *event_lists):
+    """write a track chunk of (tick, message) events, then fill in its
+    length"""
+    start = fo.tell()
+    fo.write(b'MTrk\x00\x00\x00\x00')
+    last = 0
+    for events in event_lists:
+        for tick, message in events:
+            fo.write(_vlq(tick - last) + message)
+            last = tick
+    fo.write(b'\x00' + bytes((META, META_END_OF_TRACK, 0)))
+    end = fo.tell()
+    fo.seek(start + 4)
+    fo.write(struct.pack('>I', end - start - 8))
+    fo.seek(end)
+
+def _vlq(number):
+    """return number as a midi variable length quantity"""
+    data = [number & 0x7f]
+    number >>= 7
+    while number:
+        data.append(0x80 | (number & 0x7f))
+        number >>= 7
+    return bytes(reversed(data))
+
+class SmfReader(object):
+    """Streams the control changes of a standard midi file in time order.
+
+    Tracks are read a block at a time and merged, and nrpns are
+    reassembled from their control changes, so files of any length are
+    read in constant memory."""
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        chunk, length = struct.unpack('>4sI', self.file.read(8))
+        if chunk != b'MThd' or length < 6:
+            raise SmfError(f"{filename} is not a standard midi file")
+        self.file_type, tracks, self.ppq = struct.unpack(
+            '>HHH', self.file.read(6))
+        if self.ppq & 0x8000:
+            raise SmfError(f"{filename} uses smpte time")
+        # find the tracks without reading them
+        self.tracks = []
+        position = 8 + length
+        while len(self.tracks) < tracks:
+            self.file.seek(position)
+            header = self.file.read(8)
+            if len(header) < 8:
+                break
+            chunk, length = struct.unpack('>4sI', header)
+            if chunk == b'MTrk':
+                self.tracks.append((position + 8, length))
+            position += 8 + length
+
+    def events(self):
+        """yield (seconds, track name, kind, channel, number, value) for
+        every 'nrpn' and plain 'cc' control change in time order.
+        track name is None if the track is not named"""
+        merged = heapq.merge(
+            *[_track_events(track, _TrackReader(self.file, *chunk))
+              for track, chunk in enumerate(self.tracks)],
+            key=lambda event: event[0]
+        )
+        names = {}
+        parsers = {}
+        parsed = []
+        tempo = TEMPO
+        last_tick = 0
+        seconds = 0.0
+        for tick, track, kind, *data in merged:
+            seconds += (tick - last_tick) * tempo / (1000000 * self.ppq)
+            last_tick = tick
+            if kind == 'tempo':
+                tempo = data[0]
+            elif kind == 'name':
+                names[track] = data[0]
+            else:
+                if track not in parsers:
+                    parsers[track] = NrpnParser(
+                        lambda *nrpn: parsed.append(('nrpn',) + nrpn),
+                        lambda *cc: parsed.append(('cc',) + cc)
+                    )
+                parsers[track].feed(*data)
+                for event in parsed:
+                    yield (seconds, names.get(track)) + event
+                parsed.clear()
+
+    def close(self):
+        self.file.close()
+
+def _track_events(track, reader):
+    """yield (tick, track, kind, data...) for tempo changes, track names
+    and control changes in a track"""
+    tick = 0
+    status = 0
+    while not reader.done:
+        tick += reader.vlq()
+        byte = reader.byte()
+        if byte == META:
+            meta_type = reader.byte()
+            data = reader.read(reader.vlq())
+            if meta_type == META_TEMPO:
+                yield tick, track, 'tempo', int.from_bytes(data, 'big')
+            elif meta_type == META_TRACK_NAME:
+                yield tick, track, 'name', data.decode('latin-1')
+            elif meta_type == META_END_OF_TRACK:
+                return
+            continue
+        if byte == SYSEX or byte == SYSEX_ESCAPE:
+            reader.skip(reader.vlq())
+            continue
+        if byte & 0x80:
+            status = byte
+            data1 = reader.byte()
+        else: # running status
+            data1 = byte
+        kind = status & 0xf0
+        if kind in (0xc0, 0xd0):
+            continue
+        data2 = reader.byte()
+        if kind == CONTROL_CHANGE:
+            yield tick, track, 'cc', status & 0x0f, data1, data2
+
+class _TrackReader(object):
+    """Reads bytes of a track chunk a block at a time"""
+    def __init__(self, file, offset, length):
+        self.file = file
+        self.position = offset
+        self.end = offset + length
+        self.buffer = b''
+        self.index = 0
+
+    @property
+    def done(self):
+        return self.index == len(self.buffer) and self.position >= self.end
+
+    def byte(self):
+        if self.index == len(self.buffer):
+            self._fill()
+        self.index += 1
+        return self.buffer[self.index - 1]
+
+    def read(self, length):
+        return bytes(self.byte() for _ in range(length))
+
+    def skip(self, length):
+        remaining = len(self.buffer) - self.index
+        if length <= remaining:
+            self.index += length
+        else:
+            self.position += length - remaining
+            self.buffer = b''
+            self.index = 0
+
+    def vlq(self):
+        number = 0
+        while True:
+            byte = self.byte()
+            number = (number << 7) | (byte & 0x7f)
+            if not byte & 0x80:
+                return number
+
+    def _fill(self):
+        self.file.seek(self.position)
+        self.buffer = self.file.read(min(READ_SIZE, self.end - self.position))
+        if not self.buffer:
+            raise SmfError("track ends unexpectedly")
+        self.position += len(self.buffer)
+        self.index = 0
+
+class SmfPlayer(object):
+    """Plays the nrpns and control changes of a standard midi file in
+    time, streaming it from disk.
+    Tracks named after a synth in channels are sent on that synth's
+    channel, other tracks on the channels in the file."""
+    def __init__(self, filename, send_nrpn, send_cc, channels=None,
+                 clock=time.perf_counter):
+        """send_nrpn, send_cc - functions(channel, number, value).
+        channels - dict of synth to midi channel"""
+        self.reader = SmfReader(filename)
+        self.send = {'nrpn': send_nrpn, 'cc': send_cc}
+        self.channels = channels or {}
+        self.clock = clock
+        self.stopped = threading.Event()
+        self.done = threading.Event()
+
+    def start(self):
+        """start playing on its own thread"""
+        thread = threading.Thread(target=self.play, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def play(self):
+        """play every event, returning when finished or stopped"""
+        start = self.clock()
+        try:
+            for seconds, name, kind, channel, number, value\
+                in self.reader.events():
+                channel = self.channels.get(name, channel)
+                if channel is None or not 0 <= channel < CHANNELS:
+                    continue
+                if not wait_until(start + seconds, self.stopped, self.clock):
+                    break
+                self.send[kind](channel, number, value)
+        finally:
+            self.reader.close()
+            self.done.set()
+
+class SmfError(Exception):
+    pass
@@ -1,56 +1,125 @@
 
 import os
 import json
+import hashlib
 import synths.packing_functions as functions
+from sysex_dispatcher import SysexDispatcher, IDENTITY_REPLY_ROUTE
 
 SYNTHS_DIR = 'synths'
+CACHE_DIR = '__pycache__'  # in the synths directory
+CACHE_VERSION = 4
+# compiled definition values stored in the cache as hex strings
+CACHE_BYTES = ('header', 'patch_request', 'program_header', 'program_request')
+MAX_NRPN = 0x3fff
 
 class SynthManager(object):
     """Manages data and unique functions of synths"""
-    def __init__(self, synths):
-        """get list of available synths"""
-        self.synths_dir = os.path.join(os.getcwd(), SYNTHS_DIR)
+    def __init__(self, synths, synths_dir=None):
+        """get list of available synths.
+        synths_dir - directory of synth settings files, defaults to
+                     'synths' in the current directory"""
+        self.synths_dir = synths_dir or os.path.join(os.getcwd(), SYNTHS_DIR)
         self.settings_files = [f[:-5] for f in os.listdir(self.synths_dir)\
                                if f[-5:] == '.json']
-        print(self.settings_files)
-        self._load_synths(synths)
-
-    def _load_synths(self, synths):
-        """load data for each synth in 'synths' directory, put in a dict
-        with None as value if no data found."""
         self.synths = {}
+        # routes incoming sysex to (message type, synth)
+        self.dispatcher = SysexDispatcher()
+        self.dispatcher.add(IDENTITY_REPLY_ROUTE, ('identity', None))
+        self.add_synths(synths)
+
+    def add_synths(self, synths):
+        """load data for each synth in 'synths' not already loaded from
+        'synths' directory, put in a dict with None as value if no data
+        found or its definition is not valid, see check_definitions."""
         for synth in synths:
+            if synth in self.synths:
+                continue
             if synth in self.settings_files:
-                self.synths[synth] = SynthData(
-                            os.path.join(self.synths_dir, synth + '.json'),
-                            synth
-                        ) 
+                try:
+                    self.synths[synth] = SynthData(
+                                os.path.join(self.synths_dir, synth + '.json'),
+                                synth
+                            )
+                except SynthDefinitionError:
+                    self.synths[synth] = None
+                    continue
+                self._add_routes(synth)
             else:
                 self.synths[synth] = None
-        print(self.synths)
+
+    def check_definitions(self):
+        """Compile every synth definition in the synths directory, so
+        errors are found at startup rather than when a screen using the
+        synth is built. Return dict of synth to error message for each
+        definition that is not valid"""
+        errors = {}
+        for synth in self.settings_files:
+            try:
+                load_definition(
+                    os.path.join(self.synths_dir, synth + '.json'),
+                    synth
+                )
+            except SynthDefinitionError as error:
+                errors[synth] = str(error)
+        return errors
 
     def set_channels(self, channels):
-        """Set synth's channel form given dict"""
+        """Set channel of each loaded synth from given dict"""
         for synth in channels:
-            self.synths[synth].channel = channels[synth]
+            if self.synths.get(synth) and channels[synth] is not None:
+                self.synths[synth].channel = channels[synth]
 
     def is_patchable(self, synth):
         """Return true if given synth has the required details to allow
         patching"""
         return self.synths[synth].patchable
 
+    @property
+    def patchable_synths(self):
+        """Return list of loaded synths with patch details"""
+        return [synth for synth, synth_data in self.synths.items()
+                if synth_data and synth_data.patchable]
+
+    def is_bank_receivable(self, synth):
+        """Return true if given synth has the required details to allow
+        receiving whole banks of programs"""
+        synth_data = self.synths[synth]
+        return synth_data.patchable and synth_data.bank_receivable
+
+    def _add_routes(self, synth):
+        """register synth's sysex headers with the dispatcher"""
+        synth_data = self.synths[synth]
+        if synth_data.patchable:
+            self.dispatcher.add(synth_data.header_pattern, ('patch', synth))
+        if synth_data.bank_receivable:
+            self.dispatcher.add(synth_data.program_header, ('program', synth))
+
+    def route(self, message):
+        """Return (message type, synth) for a sysex message without its f0
+        and f7: type 'patch' or 'program' for a synth's dumps, 'identity'
+        for an identity reply, with synth None. Return None if unknown."""
+        return self.dispatcher.find(message)
+
     def find_synth(self, message):
-        """Return the synth that the message is for."""
-        for synth in self.synths:
-            header = self.synths[synth].header
-            if header == message[:len(header)]:
-                return synth
+        """Return the synth that the patch dump message is for."""
+        route = self.dispatcher.find(message)
+        if route and route[0] == 'patch':
+            return route[1]
         return None
 
     def unpack(self, synth, data):
         """Unpack the received data according to the given synth's unpack function"""
         return self.synths[synth].check_and_unpack(data)
 
+    def unpack_program(self, synth, data):
+        """Unpack a program dump according to the given synth's unpack
+        function"""
+        return self.synths[synth].check_and_unpack_program(data)
+
+    def get_patch_name(self, synth, data):
+        """Return the patch name in the given synth's unpacked data"""
+        return self.synths[synth].patch_name(data)
+
     def pack(self, synth, data):
         """Pack the data according to the given synth's pack function"""
         return self.synths[synth].pack(data)
@@ -59,6 +128,19 @@ class SynthManager(object):
         """Return the given synth's nrpn order"""
         return self.synths[synth].nrpn_order
 
+    def get_index(self, synth):
+        """Return dict of the given synth's nrpns to patch positions"""
+        return self.synths[synth].nrpn_index
+
+    def get_option(self, synth, nrpn, value):
+        """Return the option name for nrpn's value, or None if nrpn does
+        not have an options list"""
+        synth_data = self.synths[synth]
+        try:
+            return synth_data.options[synth_data.option_nrpns[nrpn]][value]
+        except (KeyError, IndexError, TypeError):
+            return None
+
     def get_header(self, synth):
         """Return the patch header for given synth"""
         return self.synths[synth].header
@@ -67,6 +149,29 @@ class SynthManager(object):
         """Return the patch request header for given synth"""
         return self.synths[synth].patch_request
 
+    def get_program_header(self, synth):
+        """Return the program dump header for given synth"""
+        return self.synths[synth].program_header
+
+    def get_program_request(self, synth):
+        """Return the program dump request header for given synth"""
+        return self.synths[synth].program_request
+
+    def get_banks(self, synth):
+        """Return the number of banks and programs per bank for given synth"""
+        return self.synths[synth].banks, self.synths[synth].programs
+
+    def get_sequencer_tracks(self, synth):
+        """Return list of the nrpns of each of the given synth's sequencer
+        tracks, empty if it has no sequencer"""
+        synth_data = self.synths.get(synth)
+        return synth_data.sequencer_tracks if synth_data else []
+
+    def get_step_range(self, synth):
+        """Return the minimum and maximum sequencer step values for given
+        synth"""
+        return self.synths[synth].step_range
+
     def get_channel(self, synth):
         """Return the channel for given synth"""
         return self.synths[synth].channel
@@ -74,64 +179,290 @@ class SynthManager(object):
     @property
     def options_lists(self):
         output = {}
-        for synth in self.synths:
-            output[synth] = self.synths[synth].options
+        for synth, synth_data in self.synths.items():
+            output[synth] = synth_data.options if synth_data else {}
         return output
         
 class SynthData(object):
     """Object representing each synth"""
     def __init__(self, filename, synth):
-        """load the json data"""
+        """load the compiled definition, from the cache if up to date"""
         self.synth = synth
-        with open(filename) as fo:
-            data = json.load(fo)
-
-        try:
-            self.options = data['options']
-        except KeyError:
-            self.options = None
-        
-        if all((
-            'unpack function' in data,
-            'pack function' in data,
-            'receive header' in data,
-            'parameters' in data,
-            'patch request' in data
-        )):
-            self.patchable = True
-            self._load_patching_details(data)
-        else:
-            self.patchable = False        
-
-    def _load_patching_details(self, data):
-        """load patching details from settings file"""
-        self.header = bytes.fromhex(data['receive header'])
-        self.unpack = functions.FUNCTIONS[data['unpack function']]
-        self.pack = functions.FUNCTIONS[data['pack function']]
-        self.patch_request = bytes.fromhex(data['patch request'])
-        self.n_parameters = data['parameters']
-
-        if 'nrpn order' not in data:
-            self.nrpn_order = list(range(0, self.n_parameters))
-        elif self.n_parameters > len(data['nrpn order']):
-            self.nrpn_order = data['nrpn order']\
-                + list(range(len(data['nrpn order']), self.n_parameters))
-        elif self.n_parameters < len(data['nrpn order']):
-            self.nrpn_order = data['nrpn order'][:self.n_parameters]
-        else:
-            self.nrpn_order = data['nrpn order']
+        self.__dict__.update(load_definition(filename, synth))
+        if self.patchable:
+            self.unpack = functions.FUNCTIONS[self.unpack_function]
+            self.pack = functions.FUNCTIONS[self.pack_function]
 
     def check_and_unpack(self, message):
         """Check receive data message is for this synth then unpack using
         unpack function"""
-        if self.header == message[:len(self.header)]:
-            return self.unpack(message[len(self.header):])
+        pattern = self.header_pattern
+        if len(message) >= len(pattern) and all(
+                byte is None or byte == message[i]
+                for i, byte in enumerate(pattern)
+            ):
+            return self.unpack(message[len(pattern):])
+        else:
+            raise IncorrectSynthError
+
+    def check_and_unpack_program(self, message):
+        """Check program dump message is for this synth then unpack using
+        unpack function, skipping bank and program numbers"""
+        if self.bank_receivable\
+           and self.program_header == message[:len(self.program_header)]:
+            return self.unpack(message[len(self.program_header) + 2:])
         else:
             raise IncorrectSynthError
 
+    def patch_name(self, data):
+        """Return the patch name held in unpacked patch data"""
+        return ''.join(chr(data[self.nrpn_index[nrpn]])
+                       for nrpn in self.name_nrpns).strip()
+
     def pack(self, data):
         """Pack the data and add its header"""
         return self.header + self.pack(data)
         
 class IncorrectSynthError(Exception):
     pass
+
+class SynthDefinitionError(Exception):
+    pass
+
+def load_definition(filename, synth):
+    """Return the compiled definition of synth from its json file.
+    Compiled definitions are cached as json beside the file, the cache is
+    used while the file's modification time and size, or its hash, match."""
+    stat = os.stat(filename)
+    cache_file = os.path.join(
+        os.path.dirname(filename),
+        CACHE_DIR,
+        os.path.basename(filename)[:-5] + '.synth.json'
+    )
+    try:
+        with open(cache_file, 'r') as fo:
+            cache = json.load(fo)
+        if cache['version'] != CACHE_VERSION:
+            raise KeyError('version')
+        cached = _from_cache(cache['definition'])
+        if (cache['mtime'], cache['size'])\
+           == (stat.st_mtime_ns, stat.st_size):
+            return cached
+    except (OSError, ValueError, KeyError, AttributeError, TypeError):
+        cache = None
+
+    with open(filename, 'rb') as fo:
+        source = fo.read()
+    digest = hashlib.sha1(source).hexdigest()
+    if cache and cache['hash'] == digest:
+        definition = cached
+    else:
+        try:
+            data = json.loads(source)
+        except ValueError as error:
+            raise SynthDefinitionError(f"{synth}: {error}")
+        definition = compile_definition(data, synth)
+
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, 'w') as fo:
+            json.dump({
+                'version': CACHE_VERSION,
+                'mtime': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'hash': digest,
+                'definition': _to_cache(definition),
+            }, fo)
+    except OSError:
+        pass # cache is optional
+    return definition
+
+def _to_cache(definition):
+    """return copy of compiled definition holding only json types"""
+    cached = dict(definition)
+    for key in CACHE_BYTES:
+        if key in cached:
+            cached[key] = cached[key].hex()
+    # json object keys are strings, so keep nrpn keys as pairs
+    cached['option_nrpns'] = list(definition['option_nrpns'].items())
+    # rebuilt from nrpn_order
+    cached.pop('nrpn_index', None)
+    return cached
+
+def _from_cache(cached):
+    """return compiled definition from its cached json types"""
+    definition = dict(cached)
+    for key in CACHE_BYTES:
+        if key in definition:
+            definition[key] = bytes.fromhex(definition[key])
+    definition['option_nrpns'] = {nrpn: option_list for nrpn, option_list
+                                  in cached['option_nrpns']}
+    definition['step_range'] = tuple(cached['step_range'])
+    if definition['patchable']:
+        definition['header_pattern'] = tuple(cached['header_pattern'])
+        definition['nrpn_index'] = {nrpn: i for i, nrpn
+                                    in enumerate(cached['nrpn_order'])}
+    return definition
+
+def compile_definition(data, synth):
+    """Validate a synth's json data and return dict of its attributes
+    ready to use. Packing functions are referenced by name.
+    Raise SynthDefinitionError if the data is not valid."""
+    def error(message):
+        raise SynthDefinitionError(f"{synth}: {message}")
+
+    definition = {'options': data.get('options')}
+
+    # nrpn to name of the options list for its values
+    option_nrpns = {}
+    for option_list, nrpns in data.get('option nrpns', {}).items():
+        if option_list not in (definition['options'] or {}):
+            error(f"option nrpns refer to unknown options '{option_list}'")
+        for nrpn in nrpns:
+            option_nrpns[nrpn] = option_list
+    definition['option_nrpns'] = option_nrpns
+    definition.update(_compile_sequencer(data, error))
+
+    definition['patchable'] = all((
+        'unpack function' in data,
+        'pack function' in data,
+        'receive header' in data,
+        'parameters' in data,
+        'patch request' in data
+    ))
+    definition['bank_receivable'] = False
+    if definition['patchable']:
+        definition.update(_compile_patching_details(data, error))
+    return definition
+
+def _compile_patching_details(data, error):
+    """return dict of patching details from settings data"""
+    for key in ('unpack function', 'pack function'):
+        if data[key] not in functions.FUNCTIONS:
+            error(f"unknown {key} '{data[key]}'")
+    n_parameters = data['parameters']
+    if not isinstance(n_parameters, int) or n_parameters < 1:
+        error("parameters must be a positive whole number")
+
+    definition = {
+        'unpack_function': data['unpack function'],
+        'pack_function': data['pack function'],
+        'header_pattern': _pattern(data, 'receive header', error),
+        'patch_request': _hex(data, 'patch request', error),
+        'n_parameters': n_parameters,
+    }
+
+    # wildcard bytes, such as device ids, are sent as 0
+    definition['header'] = bytes(byte or 0
+                                 for byte in definition['header_pattern'])
+
+    if all((
+        'program header' in data,
+        'program request' in data,
+        'banks' in data,
+        'programs' in data
+    )):
+        definition.update({
+            'bank_receivable': True,
+            'program_header': _hex(data, 'program header', error),
+            'program_request': _hex(data, 'program request', error),
+            'banks': data['banks'],
+            'programs': data['programs'],
+        })
+
+    nrpn_order = data.get('nrpn order')
+    if nrpn_order is None:
+        nrpn_order = list(range(0, n_parameters))
+    else:
+        if len(nrpn_order) > n_parameters:
+            error(f"nrpn order has {len(nrpn_order)} nrpns,"
+                  f" more than the {n_parameters} parameters")
+        seen = set()
+        for nrpn in nrpn_order:
+            if not isinstance(nrpn, int) or not 0 <= nrpn <= MAX_NRPN:
+                error(f"invalid nrpn {nrpn!r} in nrpn order")
+            if nrpn in seen:
+                error(f"nrpn {nrpn} repeated in nrpn order")
+            seen.add(nrpn)
+        nrpn_order = nrpn_order + _padding(nrpn_order, n_parameters)
+    definition['nrpn_order'] = nrpn_order
+
+    # position of each nrpn in a patch
+    definition['nrpn_index'] = {nrpn: i for i, nrpn in enumerate(nrpn_order)}
+
+    if 'name nrpns' in data:
+        start, length = data['name nrpns']
+        name_nrpns = list(range(start, start + length))
+        for nrpn in name_nrpns:
+            if nrpn not in definition['nrpn_index']:
+                error(f"name nrpn {nrpn} not in patch")
+        definition['name_nrpns'] = name_nrpns
+    else:
+        definition['name_nrpns'] = []
+    return definition
+
+def _compile_sequencer(data, error):
+    """return dict of the nrpns of each sequencer track and the range of
+    step values from settings data, no tracks if there is no sequencer"""
+    if 'sequencer' not in data:
+        return {'sequencer_tracks': [], 'step_range': (0, 0)}
+    sequencer = data['sequencer']
+    steps = sequencer.get('steps')
+    if not isinstance(steps, int) or steps < 1:
+        error("sequencer steps must be a positive whole number")
+    tracks = []
+    for start in sequencer.get('tracks', []):
+        if not isinstance(start, int)\
+           or not 0 <= start <= MAX_NRPN - steps + 1:
+            error(f"invalid sequencer track nrpn {start!r}")
+        tracks.append(list(range(start, start + steps)))
+    try:
+        minimum, maximum = sequencer.get('step range', (0, 127))
+    except (TypeError, ValueError):
+        error("sequencer step range must be a minimum and maximum")
+    if not 0 <= minimum <= maximum:
+        error("sequencer step range must be a minimum and maximum")
+    return {'sequencer_tracks': tracks, 'step_range': (minimum, maximum)}
+
+def _hex(data, key, error):
+    """return bytes of hex string data[key]"""
+    try:
+        return bytes.fromhex(data[key])
+    except (TypeError, ValueError):
+        error(f"{key} is not a hex string")
+
+def _pattern(data, key, error):
+    """return tuple of bytes of hex string data[key], with None for any
+    'xx' wildcard bytes"""
+    text = data[key]
+    if not isinstance(text, str) or len(text) % 2:
+        error(f"{key} is not a hex string")
+    pattern = []
+    for i in range(0, len(text), 2):
+        pair = text[i:i + 2]
+        if pair.lower() == 'xx':
+            pattern.append(None)
+        else:
+            try:
+                pattern.append(int(pair, 16))
+            except ValueError:
+                error(f"{key} is not a hex string")
+    return tuple(pattern)
+
+def _padding(nrpn_order, n_parameters):
+    """Return nrpns for the patch positions after those in nrpn_order.
+    Each position's nrpn is its position, unless that nrpn is already
+    used, then unused nrpns after the last parameter are used so every
+    position has its own nrpn"""
+    used = set(nrpn_order)
+    spare = n_parameters
+    padding = []
+    for position in range(len(nrpn_order), n_parameters):
+        if position in used:
+            while spare in used:
+                spare += 1
+            padding.append(spare)
+            spare += 1
+        else:
+            padding.append(position)
+    return padding
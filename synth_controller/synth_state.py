@@ -0,0 +1,63 @@
+from array import array
+
+NRPNS = 0x4000  # 14 bit nrpn numbers
+
+class SynthState(object):
+    """The parameter values of one synth.
+
+    The single source of truth for a synth's parameter values, held in an
+    array indexed by nrpn. Views, such as controllers, are bound to an
+    nrpn and told when its value is set. Does not use the ui, so can be
+    read and written headless or off the ui thread."""
+    def __init__(self, size=NRPNS):
+        """create state with every value 0"""
+        self.values = array('H', bytes(2 * size))
+        self.views = {}
+
+    def bind(self, nrpn, view):
+        """call view with the new value whenever nrpn's value is set"""
+        self.views.setdefault(nrpn, []).append(view)
+
+    def unbind_all(self):
+        """remove all views"""
+        self.views = {}
+
+    def get(self, nrpn):
+        """return value of nrpn"""
+        return self.values[nrpn]
+
+    def set(self, nrpn, value, notify=True):
+        """set value of nrpn, tell views if notify"""
+        self.values[nrpn] = value
+        if notify:
+            for view in self.views.get(nrpn, ()):
+                view(value)
+
+    def get_values(self, nrpns):
+        """return array of values of nrpns in order given"""
+        values = self.values
+        return array('H', [values[nrpn] for nrpn in nrpns])
+
+    def get_patch(self, nrpn_order):
+        """return list of values of nrpns in order given. Values may be
+        over a byte, the synth's pack function checks their range"""
+        values = self.values
+        return [values[nrpn] for nrpn in nrpn_order]
+
+    def set_patch(self, nrpn_index, data, notify=True):
+        """set values from unpacked patch data.
+        nrpn_index - dict of nrpn to position in data.
+        views are only told of values that change.
+        return list of (nrpn, old value, new value) changed"""
+        values = self.values
+        views = self.views
+        changes = []
+        for nrpn, i in nrpn_index.items():
+            value = data[i]
+            if values[nrpn] != value:
+                changes.append((nrpn, values[nrpn], value))
+                values[nrpn] = value
+                if notify:
+                    for view in views.get(nrpn, ()):
+                        view(value)
+        return changes
@@ -11,6 +11,8 @@
 # "recive data" : The initial bytes of a recieve patch message from the
 #                 synth so it can be recognised as a patch.
 #                 As a string of hex, without leading 0x.
+#                 'xx' matches any byte, such as a device id, and is
+#                 sent as 00.
 
 # "program dump request" : The sysex message required to request a program
 #                          dump from the synth
@@ -18,43 +20,65 @@
 # "nrpn order" : The order that the nrpn parameters come in a patch
 #                message. As a list of ints.
 
+# To receive whole banks, these optional key-value pairs can be added:
+
+# "program request" : The sysex header to request a program dump, the bank
+#                     and program numbers are appended.
+
+# "program header" : The initial bytes of a program dump message, followed
+#                    by the bank and program numbers.
+
+# "banks", "programs" : Number of banks and number of programs per bank.
+
+# For sequencer pattern operations, this optional key-value pair can be
+# added:
+
+# "sequencer" : {"tracks": first nrpn of each track, "steps": steps per
+#               track, "step range": [minimum, maximum] random step value}
+
 # See mopho's json file for an example.
 
-def mopho_unpack(data):
-    """Unpack midi patch dump data into tuple of parameter values as ints.
-    Packing format from page 44 of Manual"""
-    unpacked_data = []
+from itertools import product
 
-    for i in range(0, len(data), 8):
-        chunk = data[i: i+8]
-        packing_byte = chunk[0]
-        mask = 0x01
-        for byte in chunk[1:]:
-            unpacked_data.append(((packing_byte & mask) << 7) | byte)
-            mask <<= 1
+# Bulk codec tables for the DSI packed-MS-bit format (page 44 of Manual).
+# Every 7 data bytes are preceded by a packing byte holding their top bits.
 
-    return tuple(unpacked_data)
+# packing byte -> the top bit of each of the 7 following bytes, spread out
+SPREAD_TABLE = tuple(bytes(((p >> j) & 1) << 7 for j in range(7))
+                     for p in range(256))
+
+# byte -> low 7 bits, byte -> top bit, for use with bytes.translate
+LOW_BITS_TABLE = bytes(b & 0x7f for b in range(256))
+HIGH_BIT_TABLE = bytes(b >> 7 for b in range(256))
+
+# top bits of a chunk of up to 7 bytes -> packing byte
+GATHER_TABLE = {bytes(bits): bytes((sum(bit << j for j, bit in enumerate(bits)),))
+                for n in range(1, 8) for bits in product((0, 1), repeat=n)}
+
+def mopho_unpack(data):
+    """Unpack midi patch dump data into bytes of parameter values.
+    Packing format from page 44 of Manual.
+    data can be any bytes-like object, including a memoryview."""
+    data = memoryview(bytes(data) if isinstance(data, (tuple, list)) else data)
+    highs = b''.join([SPREAD_TABLE[p] for p in data[0::8]])
+    lows = b''.join([data[i+1: i+8] for i in range(0, len(data), 8)])
+    n = len(lows)
+    return (int.from_bytes(highs[:n], 'big')
+            | int.from_bytes(lows, 'big')).to_bytes(n, 'big')
 
 def mopho_pack(data):
-    """Pack midi patch dump data from tuple of parameter values as ints.
-    Packing format from page 44 of Manual"""
+    """Pack midi patch dump data from parameter values as ints.
+    Packing format from page 44 of Manual.
+    Raises ValueError if a value does not fit in a byte"""
+    data = bytes(data)
+    lows = data.translate(LOW_BITS_TABLE)
+    highs = data.translate(HIGH_BIT_TABLE)
     packed_data = []
-
     for i in range(0, len(data), 7):
-        chunk = data[i: i+7]
-        packing_byte = 0x0
-        data_bytes = []
-        shift = 0x7
-        for byte in chunk:
-            packing_byte |= ((byte & 0x80) >> shift)
-            shift -= 1
-            data_bytes.append(byte & 0x7f)
-            
-        packed_data.append(packing_byte)
-        packed_data.extend(data_bytes)
-
-    return tuple(packed_data)
-    
+        packed_data.append(GATHER_TABLE[highs[i: i+7]])
+        packed_data.append(lows[i: i+7])
+    return b''.join(packed_data)
+
 
 FUNCTIONS = {
     'mopho_unpack': mopho_unpack,
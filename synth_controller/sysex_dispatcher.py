@@ -0,0 +1,74 @@
+UNIVERSAL_NON_REALTIME = 0x7e
+IDENTITY_REQUEST = b'\xf0\x7e\x7f\x06\x01\xf7'  # to all devices
+# identity reply prefix, after the f0: 7e <device id> 06 02
+IDENTITY_REPLY_ROUTE = (UNIVERSAL_NON_REALTIME, None, 0x06, 0x02)
+
+class SysexDispatcher(object):
+    """Finds the target registered for a sysex message by its prefix.
+
+    Prefixes are held in a trie of bytes, so finding a target is a single
+    pass over the start of the message however many prefixes there are.
+    Prefixes can be of different lengths and contain None as a wildcard
+    matching any byte, such as a device id. The longest matching prefix
+    wins, with exact bytes preferred over wildcards."""
+    def __init__(self):
+        self.root = _Node()
+
+    def add(self, prefix, target):
+        """register target for messages starting with prefix, a sequence
+        of bytes and None wildcards"""
+        node = self.root
+        for byte in prefix:
+            if byte is None:
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(byte, _Node())
+        node.target = target
+
+    def find(self, message):
+        """return target for message, without its f0 and f7, or None if
+        no prefix matches"""
+        found = self.root.target
+        nodes = [self.root]
+        for byte in message:
+            next_nodes = []
+            for node in nodes:
+                child = node.children.get(byte)
+                if child is not None:
+                    next_nodes.append(child)
+                if node.wildcard is not None:
+                    next_nodes.append(node.wildcard)
+            if not next_nodes:
+                break
+            nodes = next_nodes
+            for node in nodes:
+                if node.target is not None:
+                    found = node.target
+                    break
+        return found
+
+class _Node(object):
+    __slots__ = ('children', 'wildcard', 'target')
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.target = None
+
+def parse_identity_reply(message):
+    """Return dict of device id, manufacturer, family, member and version
+    from a universal identity reply message, including its f0 and f7"""
+    body = bytes(message[5:-1])
+    if body[0] == 0:
+        manufacturer, body = body[:3], body[3:]
+    else:
+        manufacturer, body = body[:1], body[1:]
+    return {
+        'device': message[2],
+        'manufacturer': manufacturer.hex(),
+        'family': body[0:2].hex(),
+        'member': body[2:4].hex(),
+        'version': body[4:8].hex(),
+    }
@@ -7,11 +7,15 @@ from kivy.uix.label import Label
 from kivy.uix.spinner import Spinner
 from kivy.properties import ObjectProperty, StringProperty
 from kivy.lang import Builder
+from kivy.clock import Clock
+from kivy.core.window import Window
 
 from controllers import SwipeController
 
 Builder.load_file('ui_elements.kv')
 
+IDLE_TIME = 2.0  # seconds without a touch before screens are prebuilt
+
 class MainScreen(BoxLayout):
     """The main kivy screen and popups"""
     action_view = ObjectProperty()
@@ -25,22 +29,47 @@ class MainScreen(BoxLayout):
         self.register_event_type('on_save_unconfirmed')
         self.register_event_type('on_save_confirmed')
         self.register_event_type('on_channel_selection')
+        self.register_event_type('on_screen_built')
+        self.register_event_type('on_receive_all')
         
         self.screens = {'no_screens_label': Label(text='No initial screen set')}
+        self.screen_files = {}
         self.current_screen = 'no_screens_label'
+        self.last_touch = 0
         self.add_widget(self.screens['no_screens_label']) 
 
     def build_screens(self, filenames):
-        """build a dict of widget trees for the screens from the dict of given
-        kv files. fill action bar and return the dict"""
-        for screen in filenames:
-            self.screens[screen] = Builder.load_file(filenames[screen])
+        """keep the dict of given kv files to build screens from and fill
+        action bar. each screen's widget tree is built when first shown,
+        or by prebuild_next"""
+        self.screen_files = dict(filenames)
         self._fill_action_bar()
 
+    def get_screen(self, screen):
+        """return the widget tree for screen, building it if not yet built"""
+        if screen not in self.screens:
+            self.screens[screen] = Builder.load_file(self.screen_files[screen])
+            self.dispatch('on_screen_built', screen, self.screens[screen])
+        return self.screens[screen]
+
+    def prebuild_next(self, *args):
+        """build one screen not yet built if there has been no touch for
+        IDLE_TIME. return False once every screen is built, so can be
+        scheduled on an interval"""
+        unbuilt = [s for s in self.screen_files if s not in self.screens]
+        if unbuilt and Clock.get_time() - self.last_touch > IDLE_TIME:
+            self.get_screen(unbuilt[0])
+            unbuilt = unbuilt[1:]
+        return bool(unbuilt)
+
+    def on_touch_down(self, touch):
+        self.last_touch = Clock.get_time()
+        return super(MainScreen, self).on_touch_down(touch)
+
     def _fill_action_bar(self):
         """create the action_bar and add screens as tabs"""
         self.tabs = []
-        for screen in [s for s in self.screens if s != 'no_screens_label']:
+        for screen in self.screen_files:
             tab = ActionButton(text=screen)
             self.action_view.add_widget(tab, 1)
             tab.bind(on_release=self._on_tab)
@@ -50,7 +79,7 @@ class MainScreen(BoxLayout):
         """change to new screen acording to tab pressed"""
         if instance.text != self.current_screen:
             self.remove_widget(self.screens[self.current_screen])
-            self.add_widget(self.screens[instance.text])
+            self.add_widget(self.get_screen(instance.text))
             self.current_screen = instance.text
             self._set_tab_states()
 
@@ -58,7 +87,7 @@ class MainScreen(BoxLayout):
         """set the current screen"""
         if screen:
             self.remove_widget(self.screens[self.current_screen])
-            self.add_widget(self.screens[screen])
+            self.add_widget(self.get_screen(screen))
             self.current_screen = screen
             self._set_tab_states()
             
@@ -150,6 +179,19 @@ class MainScreen(BoxLayout):
 
   
 
+    def toggle_stats_overlay(self, stats):
+        """show or hide debug overlay of midi statistics"""
+        try:
+            overlay = self.stats_overlay
+        except AttributeError:
+            overlay = self.stats_overlay = StatsOverlay(stats=stats)
+        if overlay.parent:
+            overlay.stop()
+            Window.remove_widget(overlay)
+        else:
+            Window.add_widget(overlay)
+            overlay.start()
+
     def on_load_unconfirmed(self, *args):
         """called when unconfirmed load event dispatched. Dismiss popups"""
         self.popup.dismiss()
@@ -172,6 +214,31 @@ class MainScreen(BoxLayout):
         """called when midi selection event dispatched. Dismiss popups"""
         self.popup.dismiss()
 
+    def on_receive_button(self, *args):
+        """request the patch of every synth"""
+        self.dispatch('on_receive_all')
+
+    def on_receive_all(self, *args):
+        """called when receive all event dispatched"""
+        pass
+
+    def on_screen_built(self, *args):
+        """called when a screen's widget tree has been built"""
+        pass
+
+class StatsOverlay(Label):
+    """Debug overlay showing midi statistics, updated twice a second"""
+    stats = ObjectProperty()
+    def start(self):
+        self.update()
+        self.event = Clock.schedule_interval(self.update, 0.5)
+
+    def stop(self):
+        self.event.cancel()
+
+    def update(self, *args):
+        self.text = self.stats.report()
+
 class SimpleDialogue(FloatLayout):
     message = StringProperty()
     confirm = ObjectProperty()
@@ -0,0 +1,114 @@
+from array import array
+import time
+
+JOURNAL_SIZE = 4096  # parameter changes kept per synth
+GESTURE_TIME = 0.5  # seconds between changes to one nrpn in a gesture
+
+class UndoJournal(object):
+    """Undo and redo history of one synth's parameter changes.
+
+    Each change is a (nrpn, old value, new value) delta, held in a fixed
+    size ring buffer of arrays so memory stays bounded. Deltas are grouped
+    into entries, undone and redone together: changes to one nrpn less
+    than gesture_time apart, such as a drag, collapse into one entry, and
+    record_entry adds many changes, such as a patch load, as one entry.
+    When full the oldest entries are dropped. An entry larger than the
+    whole journal loses its oldest changes."""
+    def __init__(self, size=JOURNAL_SIZE, gesture_time=GESTURE_TIME,
+                 clock=time.monotonic):
+        self.size = size
+        self.gesture_time = gesture_time
+        self.clock = clock
+        self.nrpns = array('H', [0]) * size
+        self.olds = array('H', [0]) * size
+        self.news = array('H', [0]) * size
+        self.entries = array('L', [0]) * size
+        # running counts of deltas: those from start to head can be
+        # undone, those from head to end redone
+        self.start = 0
+        self.head = 0
+        self.end = 0
+        self.entry = 0
+        self.gesture_nrpn = None
+        self.last_change = 0
+
+    def record(self, nrpn, old, new):
+        """record a single parameter change"""
+        if old == new:
+            return
+        now = self.clock()
+        if self.gesture_nrpn == nrpn and self.head == self.end\
+           and now - self.last_change < self.gesture_time:
+            # continue the gesture, keeping its first old value
+            self.news[(self.end - 1) % self.size] = new
+        else:
+            self._new_entry()
+            self._append(nrpn, old, new)
+            self.gesture_nrpn = nrpn
+        self.last_change = now
+
+    def record_entry(self, changes):
+        """record list of (nrpn, old, new) changes as one entry"""
+        if not changes:
+            return
+        self._new_entry()
+        for nrpn, old, new in changes:
+            self._append(nrpn, old, new)
+
+    def undo(self):
+        """step back one entry, return list of (nrpn, value) to restore"""
+        changes = []
+        self.gesture_nrpn = None
+        if self.head > self.start:
+            entry = self.entries[(self.head - 1) % self.size]
+            while self.head > self.start\
+                  and self.entries[(self.head - 1) % self.size] == entry:
+                self.head -= 1
+                i = self.head % self.size
+                changes.append((self.nrpns[i], self.olds[i]))
+        return changes
+
+    def redo(self):
+        """step forward one entry, return list of (nrpn, value) to set"""
+        changes = []
+        self.gesture_nrpn = None
+        if self.head < self.end:
+            entry = self.entries[self.head % self.size]
+            while self.head < self.end\
+                  and self.entries[self.head % self.size] == entry:
+                i = self.head % self.size
+                changes.append((self.nrpns[i], self.news[i]))
+                self.head += 1
+        return changes
+
+    @property
+    def can_undo(self):
+        return self.head > self.start
+
+    @property
+    def can_redo(self):
+        return self.head < self.end
+
+    def _new_entry(self):
+        """start a new entry, dropping any changes that could be redone"""
+        self.end = self.head
+        self.entry = (self.entry + 1) & 0xffffffff
+        self.gesture_nrpn = None
+
+    def _append(self, nrpn, old, new):
+        """add delta to the current entry, making room if full"""
+        if self.end - self.start == self.size:
+            oldest = self.entries[self.start % self.size]
+            if oldest == self.entry:
+                self.start += 1
+            else:
+                while self.start < self.end\
+                      and self.entries[self.start % self.size] == oldest:
+                    self.start += 1
+        i = self.end % self.size
+        self.nrpns[i] = nrpn
+        self.olds[i] = old
+        self.news[i] = new
+        self.entries[i] = self.entry
+        self.end += 1
+        self.head = self.end
@@ -0,0 +1,117 @@
+# Stand-ins for the kivy parts of the app, so PatchManager can be tested
+# headless
+
+import os
+import sys
+import threading
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(TESTS_DIR, '..', 'synth_controller')
+sys.path.insert(0, CONTROLLER_DIR)
+
+from midi_backends import MidiBackend
+from patch_manager import PatchManager
+from synth_manager import SynthManager
+from synth_state import SynthState
+from undo_journal import UndoJournal
+
+
+class FakeBackend(MidiBackend):
+    """Records what is sent, receives nothing"""
+    def __init__(self):
+        self.sent = []
+
+    def receive(self):
+        threading.Event().wait()
+
+    def send_cc(self, channel, controller, value):
+        self.sent.append(('cc', channel, controller, value))
+
+    def send_nrpn(self, channel, nrpn, value):
+        self.sent.append(('nrpn', channel, nrpn, value))
+
+    def send_sysex(self, data):
+        self.sent.append(('sysex', bytes(data)))
+
+
+class FakeMidi(object):
+    """Records what is sent, passes sysex to backend if given"""
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.nrpns = []
+        self.sysex = []
+
+    def send_nrpn(self, channel, nrpn, value):
+        self.nrpns.append((channel, nrpn, value))
+
+    def send_sysex(self, data):
+        self.sysex.append(bytes(data))
+        if self.backend is not None:
+            self.backend.send_sysex(data)
+
+
+class FakeUi(object):
+    def __init__(self):
+        self.popups = []
+
+    def bind(self, **kwargs):
+        pass
+
+    def channel_selection_popup(self, channels):
+        self.popups.append(dict(channels))
+
+
+class FakeControllerManager(object):
+    def __init__(self):
+        self.states = {}
+        self.journals = {}
+        self.ranges = {}
+
+    def get_state(self, synth):
+        return self.states.setdefault(synth, SynthState())
+
+    def get_journal(self, synth):
+        return self.journals.setdefault(synth, UndoJournal())
+
+    def get_discrete_nrpns(self, synth):
+        return set()
+
+    def get_parameter_ranges(self, synth):
+        return self.ranges.get(synth, {})
+
+
+class ErrorLog(object):
+    """Keeps (kind, name, data) of every message"""
+    def __init__(self):
+        self.messages = []
+
+    def error(self, name, data):
+        self.messages.append(('error', name, data))
+
+    def info(self, name, data):
+        self.messages.append(('info', name, data))
+
+    def names(self):
+        return [name for _, name, _ in self.messages]
+
+
+def make_patch_manager(backend=None, library=None):
+    """return PatchManager for a mopho on channel 0, and its fake midi,
+    controller manager and error log"""
+    synth_manager = SynthManager(
+        ['mopho'],
+        os.path.join(CONTROLLER_DIR, 'synths')
+    )
+    synth_manager.set_channels({'mopho': 0})
+    midi = FakeMidi(backend)
+    controller_manager = FakeControllerManager()
+    errors = ErrorLog()
+    patch_manager = PatchManager(
+        midi,
+        FakeUi(),
+        controller_manager,
+        synth_manager,
+        errors,
+        library
+    )
+    return patch_manager, midi, controller_manager, errors
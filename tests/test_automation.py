@@ -0,0 +1,125 @@
+# Tests for recording and replaying nrpn automation
+
+import os
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from automation import AutomationRecorder, AutomationFile,\
+                       AutomationPlayer, IN, OUT, HEADER, RECORD
+from midi import Midi
+from midi_emulator import EmulatedMopho
+from fakes import FakeBackend
+
+STEP = 2 ** -10  # exact in binary, so due times can be compared exactly
+
+
+class StepClock(object):
+    """clock moving on a step each time it is read"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += STEP
+        return self.now
+
+
+def record(filename, events):
+    """write automation file of (time, direction, channel, nrpn, value)"""
+    clock = [0.0]
+    recorder = AutomationRecorder(filename, clock=lambda: clock[0])
+    for when, direction, channel, nrpn, value in events:
+        clock[0] = when
+        recorder.record(direction, channel, nrpn, value)
+    recorder.close()
+
+
+def test_records_across_buffers(tmp_path):
+    filename = str(tmp_path / 'knobs.auto')
+    recorder = AutomationRecorder(filename, buffer_records=4)
+    for value in range(10):
+        recorder.record(IN, 1, 20, value)
+        time.sleep(0.001)
+    recorder.record(OUT, 2, 300, 1000)
+    recorder.close()
+
+    assert os.path.getsize(filename) == HEADER.size + 11 * RECORD.size
+    automation = AutomationFile(filename)
+    records = [automation[i] for i in range(len(automation))]
+    automation.close()
+    assert [r[4] for r in records[:10]] == list(range(10))
+    assert records[10][1:] == (OUT, 2, 300, 1000)
+    times = [r[0] for r in records]
+    assert times == sorted(times)
+    assert recorder.dropped == 0
+
+
+def test_replay_timing(tmp_path):
+    filename = str(tmp_path / 'knobs.auto')
+    times = [(i + 1) * 64 * STEP for i in range(5)]
+    record(filename, [(when, IN, 1, 20, i) for i, when in enumerate(times)]
+                     + [(times[-1], OUT, 1, 21, 0)])
+
+    sent = []
+    clock = StepClock()
+    player = AutomationPlayer(
+        filename,
+        lambda *args: sent.append((clock.now,) + args),
+        clock=clock
+    )
+    player.play()
+    # started on the first reading of the clock, each spin ends on the
+    # due reading and lateness is read once before sending
+    start = STEP
+    assert sent == [(start + when + STEP, 1, 20, i)
+                    for i, when in enumerate(times)]
+    assert player.max_lateness == STEP
+
+
+def test_midi_replays_every_value(tmp_path):
+    filename = str(tmp_path / 'knobs.auto')
+    record(filename, [(i * 0.001, IN, 1, 20, i) for i in range(10)])
+    backend = FakeBackend()
+    midi = Midi(backend=backend)
+    player = midi.play_automation(filename)
+    assert player.done.wait(1)
+    # sent as played, not coalesced by the nrpn scheduler
+    assert backend.sent == [('nrpn', 1, 20, i) for i in range(10)]
+
+
+def test_midi_records_in_and_out(tmp_path):
+    filename = str(tmp_path / 'knobs.auto')
+    synth = EmulatedMopho(channel=1)
+    midi = Midi(backend=synth, flush_rate=200)
+    midi.start_recording(filename)
+    midi.send_nrpn(1, 20, 64)
+    time.sleep(0.05)
+    assert midi.stop_recording() == 0
+
+    automation = AutomationFile(filename)
+    records = [automation[i][1:] for i in range(len(automation))]
+    automation.close()
+    # sent, then echoed back by the synth
+    assert records == [(OUT, 1, 20, 64), (IN, 1, 20, 64)]
+
+
+def test_midi_records_values_before_coalescing(tmp_path):
+    filename = str(tmp_path / 'knobs.auto')
+    backend = FakeBackend()
+    midi = Midi(backend=backend, flush_rate=1)
+    midi.start_recording(filename)
+    for value in range(3):
+        midi.send_nrpn(1, 20, value)
+    midi.send_nrpn_now(1, 21, 5)
+    assert midi.stop_recording() == 0
+    midi.nrpn_scheduler.flush()
+
+    automation = AutomationFile(filename)
+    records = [automation[i][1:] for i in range(len(automation))]
+    automation.close()
+    assert records == [(OUT, 1, 20, value) for value in range(3)]\
+                      + [(OUT, 1, 21, 5)]
+    assert backend.sent[0] == ('nrpn', 1, 21, 5)
+    assert ('nrpn', 1, 20, 1) not in backend.sent
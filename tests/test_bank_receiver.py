@@ -0,0 +1,136 @@
+# Tests for receiving whole banks from the emulated mopho
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from bank_receiver import BankReceiver
+from midi_emulator import EmulatedMopho
+from fakes import make_patch_manager
+
+import time
+
+PROGRAMS = [(bank, program) for bank in range(2) for program in range(5)]
+
+
+class Link(object):
+    """Passes requests to an emulated mopho, holding its replies until
+    deliver is called. Replies to programs in drop are lost, once each
+    unless always"""
+    def __init__(self, drop=(), always=False):
+        self.synth = EmulatedMopho()
+        for bank, program in PROGRAMS:
+            self.synth.programs[(bank, program)] = bytearray([program]) * 256
+        self.drop = set(drop)
+        self.always = always
+        self.requests = []
+
+    def send_sysex(self, message):
+        self.requests.append(tuple(message[4:6]))
+        self.synth.send_sysex(message)
+
+    def deliver(self, receiver, now):
+        while not self.synth.output.empty():
+            _, (_, message) = self.synth.output.get()
+            program = tuple(message[4:6])
+            if program in self.drop:
+                if not self.always:
+                    self.drop.remove(program)
+                continue
+            receiver.parse_sysex(message, now)
+
+
+def make_receiver(link, results, window=3):
+    return BankReceiver(
+        PROGRAMS,
+        link.synth.synth.program_request,
+        link.synth.synth.program_header,
+        link.send_sysex,
+        on_progress=lambda *progress: results.append(progress),
+        on_complete=lambda programs, failed:\
+                    results.append((programs, failed)),
+        window=window,
+        timeout=1.0,
+        retries=2
+    )
+
+
+def test_receives_in_order_within_window():
+    link = Link()
+    results = []
+    receiver = make_receiver(link, results)
+    receiver.start(now=0)
+    assert link.requests == PROGRAMS[:3]
+    link.deliver(receiver, now=0)
+
+    assert receiver.done
+    assert link.requests == PROGRAMS
+    assert results[:-1] == [(i, len(PROGRAMS))
+                            for i in range(1, len(PROGRAMS) + 1)]
+    programs, failed = results[-1]
+    assert sorted(programs) == PROGRAMS and failed == []
+    unpack = link.synth.synth.unpack
+    assert unpack(programs[(1, 4)]) == bytes([4]) * 256
+
+
+def test_dropped_program_is_requested_again():
+    link = Link(drop=[(0, 1)])
+    results = []
+    receiver = make_receiver(link, results)
+    receiver.start(now=0)
+    link.deliver(receiver, now=0)
+    assert not receiver.done
+    assert list(receiver.in_flight) == [(0, 1)]
+
+    receiver.update(now=0.5)
+    assert link.requests.count((0, 1)) == 1
+    receiver.update(now=1.5)
+    assert link.requests.count((0, 1)) == 2
+    link.deliver(receiver, now=1.5)
+
+    assert receiver.done
+    programs, failed = results[-1]
+    assert sorted(programs) == PROGRAMS and failed == []
+
+
+def test_gives_up_after_retries():
+    link = Link(drop=[(1, 2)], always=True)
+    results = []
+    receiver = make_receiver(link, results)
+    receiver.start(now=0)
+    now = 0
+    while not receiver.done and now < 10:
+        link.deliver(receiver, now)
+        now += 1.5
+        receiver.update(now)
+
+    assert receiver.done
+    assert link.requests.count((1, 2)) == 3
+    programs, failed = results[-1]
+    assert failed == [(1, 2)]
+    assert len(programs) == len(PROGRAMS) - 1
+
+
+def test_patch_manager_reports_programs_not_received(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    link = Link()
+    patch_manager, _, _, errors = make_patch_manager(link)
+    patch_manager.on_receive_bank('mopho')
+    receiver = patch_manager.bank_receivers[0]
+    now = time.monotonic()
+    while patch_manager.bank_receivers:
+        while not link.synth.output.empty():
+            _, (_, message) = link.synth.output.get()
+            if tuple(message[4:6]) != (2, 127):
+                patch_manager.parse_sysex(message)
+        now += 3
+        receiver.update(now)
+        patch_manager.update()
+
+    assert ('error', 'PROGRAMS_NOT_RECEIVED', ('mopho', [(2, 127)]))\
+           in errors.messages
+    assert ('info', 'BANK_SAVED', (383, os.path.join('backups', 'mopho',
+            os.listdir(tmp_path / 'backups' / 'mopho')[0])))\
+           in errors.messages
@@ -0,0 +1,45 @@
+# Tests for the headless command line patch tools
+
+import json
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+import cli
+
+PROGRAM_DUMP = os.path.join(TESTS_DIR, "m_test.sysex")
+EDIT_BUFFER_DUMP = os.path.join(TESTS_DIR, "m_test2.sysex")
+
+
+def test_decode_encode(tmp_path):
+    decoded = tmp_path / "patch.json"
+    encoded = tmp_path / "patch.sysex"
+    assert cli.main(['decode', PROGRAM_DUMP, '-o', str(decoded)]) == 0
+    with open(decoded) as fo:
+        patch = json.load(fo)
+    assert patch['synth'] == 'mopho'
+    assert patch['name'] == '30H3'
+    assert patch['options']['38'] in ('Triangle', 'Rev. Saw.', 'Sawtooth',
+                                      'Square', 'Random')
+
+    # a program dump re-encodes as the same patch in an edit buffer dump
+    assert cli.main(['encode', str(decoded), '-o', str(encoded)]) == 0
+    with open(EDIT_BUFFER_DUMP, "rb") as fo:
+        assert encoded.read_bytes() == fo.read()
+
+def test_decode_directory_csv(tmp_path):
+    output = tmp_path / "patches.csv"
+    assert cli.main(['decode', TESTS_DIR, '--format', 'csv', '-j', '2',
+                     '-o', str(output)]) == 0
+    rows = output.read_text().splitlines()
+    assert len(rows) == 3
+    assert rows[1].split(',')[1:3] == ['mopho', '30H3']
+
+def test_validate(tmp_path, capsys):
+    bad = tmp_path / "bad.sysex"
+    bad.write_bytes(b'\xf0\x01\x25\x03\x00\xf7')
+    assert cli.main(['validate', '-q', TESTS_DIR]) == 0
+    assert cli.main(['validate', str(bad)]) == 1
+    assert str(bad) in capsys.readouterr().out
@@ -0,0 +1,68 @@
+# Tests for the midi pipeline against the emulated mopho
+
+import os
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from midi import Midi
+from midi_emulator import EmulatedMopho
+from synths.packing_functions import mopho_unpack
+
+with open(os.path.join(TESTS_DIR, 'm_test2.sysex'), 'rb') as fo:
+    EDIT_BUFFER_DUMP = fo.read()
+
+
+def make_midi(**kwargs):
+    synth = EmulatedMopho(
+        edit_buffer=mopho_unpack(EDIT_BUFFER_DUMP[4:-1]),
+        **kwargs
+    )
+    midi = Midi(backend=synth, flush_rate=200)
+    received = []
+    midi.set_callbacks(
+        lambda *args: received.append(args),
+        lambda data: received.append(bytes(data))
+    )
+    return midi, synth, received
+
+
+def wait_for(midi, received, count, timeout=2.0):
+    end = time.monotonic() + timeout
+    while len(received) < count and time.monotonic() < end:
+        time.sleep(0.01)
+        midi.process_input()
+    return received
+
+
+def test_edit_buffer_request():
+    midi, synth, received = make_midi()
+    midi.send_sysex(b'\xf0\x01\x25\x06\xf7')
+    assert wait_for(midi, received, 1) == [EDIT_BUFFER_DUMP]
+
+
+def test_program_request_and_dump():
+    midi, synth, received = make_midi()
+    program = EDIT_BUFFER_DUMP[:3] + b'\x02\x01\x05' + EDIT_BUFFER_DUMP[4:]
+    midi.send_sysex(program)
+    midi.send_sysex(b'\xf0\x01\x25\x05\x01\x05\xf7')
+    assert wait_for(midi, received, 1) == [program]
+
+
+def test_nrpn_sets_memory_and_echoes():
+    midi, synth, received = make_midi()
+    midi.send_nrpn(0, 44, 100)
+    wait_for(midi, received, 1)
+    assert synth.get(44) == 100
+    assert received == [(0, 44, 100)]
+
+
+def test_throttled_dump_takes_wire_time():
+    midi, synth, received = make_midi(throttle=True, latency=0.05)
+    start = time.monotonic()
+    midi.send_sysex(b'\xf0\x01\x25\x06\xf7')
+    wait_for(midi, received, 1)
+    # 298 bytes at 3125 bytes a second plus latency
+    assert time.monotonic() - start >= 0.14
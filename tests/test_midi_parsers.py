@@ -0,0 +1,97 @@
+# Tests for the incoming midi message parsers
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from midi_parsers import NrpnParser, SysexParser
+
+
+def make_parser(high_res_ccs=()):
+    nrpns = []
+    ccs = []
+    parser = NrpnParser(
+        lambda *args: nrpns.append(args),
+        lambda *args: ccs.append(args),
+        high_res_ccs
+    )
+    return parser, nrpns, ccs
+
+def feed(parser, channel, messages):
+    for control, value in messages:
+        parser.feed(channel, control, value)
+
+def test_full_nrpn():
+    parser, nrpns, ccs = make_parser()
+    feed(parser, 2, ((99, 1), (98, 3), (6, 1), (38, 5)))
+    assert nrpns == [(2, 131, 133)]
+    assert ccs == []
+
+def test_parameter_bytes_in_either_order():
+    parser, nrpns, _ = make_parser()
+    feed(parser, 2, ((98, 3), (99, 1), (6, 1), (38, 5)))
+    # a new lsb alone selects with the held msb
+    feed(parser, 2, ((98, 4), (6, 0), (38, 1)))
+    assert nrpns == [(2, 131, 133), (2, 132, 1)]
+
+def test_running_status():
+    parser, nrpns, _ = make_parser()
+    feed(parser, 0, ((99, 0), (98, 15), (6, 0), (38, 10), (38, 11),
+                     (6, 0), (38, 12), (96, 0), (97, 0), (97, 0)))
+    assert nrpns == [(0, 15, v) for v in (10, 11, 12, 13, 12, 11)]
+
+def test_channels_independent():
+    parser, nrpns, _ = make_parser()
+    feed(parser, 0, ((99, 0), (98, 1)))
+    feed(parser, 1, ((99, 0), (98, 2), (6, 0), (38, 7)))
+    feed(parser, 0, ((6, 0), (38, 9)))
+    assert nrpns == [(1, 2, 7), (0, 1, 9)]
+
+def test_null_and_rpn_deselect():
+    parser, nrpns, _ = make_parser()
+    feed(parser, 0, ((99, 127), (98, 127), (6, 0), (38, 1),
+                     (99, 0), (98, 1), (101, 0), (6, 0), (38, 2)))
+    assert nrpns == []
+
+def test_high_res_cc():
+    parser, _, ccs = make_parser(high_res_ccs=(1,))
+    feed(parser, 0, ((1, 2), (33, 3), (7, 100)))
+    assert ccs == [(0, 1, 259), (0, 7, 100)]
+
+def make_sysex_parser(**kwargs):
+    messages = []
+    parser = SysexParser(lambda message: messages.append(bytes(message)),
+                         **kwargs)
+    return parser, messages
+
+def test_sysex_chunks():
+    with open(os.path.join(TESTS_DIR, "m_test.sysex"), "rb") as fo:
+        dump = fo.read()
+    parser, messages = make_sysex_parser(buffer_size=16)
+    for i in range(0, len(dump), 37):
+        parser.feed(dump[i: i+37], now=0)
+    assert messages == [dump]
+
+def test_sysex_back_to_back():
+    parser, messages = make_sysex_parser()
+    parser.feed(b'\xf0\x01\xf7\xf0\x02', now=0)
+    parser.feed(b'\x03\xf7', now=0)
+    assert messages == [b'\xf0\x01\xf7', b'\xf0\x02\x03\xf7']
+
+def test_sysex_abandoned():
+    parser, messages = make_sysex_parser(max_size=4, timeout=1)
+    parser.feed(b'\xf0\x01', now=0)
+    parser.feed(b'\x02\xf7', now=2)  # timed out
+    parser.feed(b'\xf0\x03\xf0\x04\xf7', now=2)  # interrupted
+    parser.feed(b'\xf0\x01\x02\x03\x04\xf7', now=2)  # too long
+    assert messages == [b'\xf0\x04\xf7']
+    assert parser.abandoned == 3
+
+def test_sysex_lost_end_at_chunk_start():
+    parser, messages = make_sysex_parser()
+    parser.feed(b'\xf0\x01\x02', now=0)
+    parser.feed(b'\xf0\x03\xf7', now=0)
+    assert messages == [b'\xf0\x03\xf7']
+    assert parser.abandoned == 1
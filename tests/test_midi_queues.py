@@ -0,0 +1,124 @@
+# Tests for the out-going nrpn scheduler and the incoming message queue
+
+import os
+import sys
+import threading
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from midi_queues import NrpnScheduler, InputQueue, INPUT_QUEUE_SIZE
+from midi import Midi
+from fakes import FakeBackend
+
+
+class Output(object):
+    """Records sends and drains. The first send waits until opened, so
+    messages can be queued while the scheduler is busy"""
+    def __init__(self, expected_sends):
+        self.events = []
+        self.expected_sends = expected_sends
+        self.sending = threading.Event()
+        self.opened = threading.Event()
+        self.finished = threading.Event()
+
+    def send(self, *nrpn):
+        self.sending.set()
+        self.opened.wait(1)
+        self.events.append(nrpn)
+
+    def drain(self):
+        self.events.append('drain')
+        if len(self.events) - self.events.count('drain')\
+           == self.expected_sends:
+            self.finished.set()
+
+
+def test_batch_size_follows_budget():
+    assert NrpnScheduler(None, None, rate=50, budget=250).batch_size == 5
+    assert NrpnScheduler(None, None, rate=50, budget=10).batch_size == 1
+
+
+def test_coalesces_and_drains_once_per_batch():
+    output = Output(expected_sends=5)
+    scheduler = NrpnScheduler(output.send, output.drain, rate=50, budget=100)
+    assert scheduler.batch_size == 2
+    scheduler.put(0, 1, 0)
+    assert output.sending.wait(1)
+
+    # a burst while the first batch is being sent
+    for value in range(10):
+        scheduler.put(0, 2, value)
+    for nrpn in (3, 4, 5):
+        scheduler.put(0, nrpn, nrpn)
+    output.opened.set()
+    assert output.finished.wait(1)
+    assert output.events == [
+        (0, 1, 0), 'drain',
+        (0, 2, 9), (0, 3, 3), 'drain',
+        (0, 4, 4), (0, 5, 5), 'drain',
+    ]
+    assert scheduler.pending == {}
+
+
+def test_flush_sends_all_pending():
+    output = Output(expected_sends=3)
+    output.opened.set()
+    scheduler = NrpnScheduler(output.send, output.drain, rate=50, budget=50)
+    # queued without waking the flushing thread
+    for nrpn in (1, 2, 3):
+        scheduler.pending[(0, nrpn)] = nrpn
+    scheduler.flush()
+    # all in one batch, beyond the budget
+    assert output.events == [(0, 1, 1), (0, 2, 2), (0, 3, 3), 'drain']
+
+
+def test_input_queue_coalesces_in_order_of_arrival():
+    queue = InputQueue()
+    queue.put_nrpn(0, 20, 1)
+    queue.put_cc(0, 20, 5)
+    queue.put_sysex(b'\xf0\x01\xf7')
+    queue.put_nrpn(0, 20, 2)
+    queue.put_nrpn(1, 20, 3)
+    queue.put_cc(0, 20, 6, 0.5)
+    queue.put_sysex(b'\xf0\x02\xf7')
+    assert queue.stats == {'depth': 5, 'coalesced': 2, 'dropped': 0}
+    # a repeated value moves to the back, extra arguments are appended
+    assert list(queue.take()) == [
+        ('sysex', b'\xf0\x01\xf7'),
+        ('nrpn', 0, 20, 2),
+        ('nrpn', 1, 20, 3),
+        ('cc', 0, 20, 6, 0.5),
+        ('sysex', b'\xf0\x02\xf7'),
+    ]
+    assert queue.depth == 0 and list(queue.take()) == []
+
+
+def test_input_queue_bounded():
+    queue = InputQueue()
+    assert queue.size == INPUT_QUEUE_SIZE == 1024
+    for nrpn in range(INPUT_QUEUE_SIZE + 10):
+        queue.put_nrpn(0, nrpn, 0)
+    # pending values still coalesce when full
+    queue.put_nrpn(0, 0, 1)
+    queue.put_sysex(b'\xf0\x01\xf7')
+    assert queue.stats == {'depth': 1024, 'coalesced': 1, 'dropped': 11}
+    messages = list(queue.take())
+    assert messages[-1] == ('nrpn', 0, 0, 1)
+    assert ('nrpn', 0, INPUT_QUEUE_SIZE, 0) not in messages
+    assert not any(message[0] == 'sysex' for message in messages)
+
+
+def test_midi_input_stats():
+    midi = Midi(backend=FakeBackend())
+    midi.input_queue.put_nrpn(0, 20, 1)
+    midi.input_queue.put_nrpn(0, 20, 2)
+    midi.sysex_parser.feed(b'\xf0\x01', now=0)
+    # not continued in time
+    midi.sysex_parser.feed(b'\xf0\x02\xf7', now=5)
+    assert midi.input_stats == {
+        'depth': 2,
+        'coalesced': 1,
+        'dropped': 0,
+        'sysex abandoned': 1,
+    }
@@ -0,0 +1,54 @@
+# Tests for the midi pipeline instrumentation
+
+import os
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from midi import Midi
+from midi_emulator import EmulatedMopho
+from midi_stats import MidiStats, LatencyHistogram, BUCKETS
+
+
+def test_histogram_keeps_recent_samples():
+    histogram = LatencyHistogram(size=4)
+    for latency in (0.5, 0.5, 0.001, 0.001, 0.001, 0.001):
+        histogram.add(latency)
+    assert histogram.count == 6
+    assert histogram.percentile(50) == 0.001
+    counts = histogram.histogram()
+    assert sum(counts) == 4
+    assert counts[BUCKETS.index(0.001)] == 4
+
+
+def test_pipeline_hops_and_counts():
+    stats = MidiStats()
+    synth = EmulatedMopho(channel=1)
+    midi = Midi(backend=synth, flush_rate=200, stats=stats)
+    received = []
+    midi.set_callbacks(lambda *args: received.append(args))
+
+    midi.send_nrpn(1, 20, 64)
+    end = time.monotonic() + 2.0
+    while not received and time.monotonic() < end:
+        time.sleep(0.01)
+        midi.process_input()
+    stats.frame()
+
+    assert received == [(1, 20, 64)]
+    for hop in ('queue', 'callback', 'controller', 'display',
+                'wire', 'drain'):
+        assert stats.hops[hop].count > 0, hop
+    # nrpn out, echoed back as four control changes
+    assert stats.channels[1]['out messages'] == 1
+    assert stats.channels[1]['out bytes'] == 12
+    assert stats.channels[1]['in messages'] == 4
+    assert 'channel 1' in stats.report()
+
+
+def test_disabled_by_default():
+    midi = Midi(backend=EmulatedMopho())
+    assert midi.stats is None
+    midi.send_sysex(b'\xf0\x01\x25\x06\xf7')
@@ -0,0 +1,38 @@
+# Round trip tests for the synth packing functions
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from synths.packing_functions import mopho_pack, mopho_unpack
+
+PROGRAM_DUMP = "m_test.sysex"   # f0 01 25 02 bank program ... f7
+EDIT_BUFFER_DUMP = "m_test2.sysex"  # f0 01 25 03 ... f7
+
+
+def read_packed(filename, header_length):
+    with open(os.path.join(TESTS_DIR, filename), "rb") as fo:
+        return fo.read()[header_length + 1:-1]
+
+def test_unpack_program_dump():
+    data = mopho_unpack(read_packed(PROGRAM_DUMP, 5))
+    assert len(data) == 256
+    assert data[184:200] == b'30H3            '
+
+def test_round_trip():
+    for filename, header_length in ((PROGRAM_DUMP, 5),
+                                    (EDIT_BUFFER_DUMP, 3)):
+        packed = read_packed(filename, header_length)
+        assert mopho_pack(mopho_unpack(packed)) == packed
+        assert mopho_pack(mopho_unpack(memoryview(packed))) == packed
+
+def test_high_bits():
+    data = tuple(range(256))
+    assert tuple(mopho_unpack(mopho_pack(data))) == data
+
+def test_bank_round_trip():
+    packed = [read_packed(PROGRAM_DUMP, 5), read_packed(EDIT_BUFFER_DUMP, 3)]
+    unpacked = [mopho_unpack(p) for p in packed]
+    assert [mopho_pack(u) for u in unpacked] == packed
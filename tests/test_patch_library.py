@@ -0,0 +1,51 @@
+# Tests for the sqlite patch library
+
+import os
+import shutil
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(TESTS_DIR, '..', 'synth_controller')
+sys.path.insert(0, CONTROLLER_DIR)
+
+import pytest
+
+from synth_manager import SynthManager
+from patch_library import PatchLibrary
+
+SYNTH = 'mopho'
+
+
+@pytest.fixture
+def library(monkeypatch):
+    monkeypatch.chdir(CONTROLLER_DIR)
+    return PatchLibrary(SynthManager([SYNTH]), ':memory:')
+
+def test_import_and_dedupe(library, tmp_path):
+    # both test files hold the same patch, as program and edit buffer dumps
+    for filename in ("m_test.sysex", "m_test2.sysex"):
+        shutil.copy(os.path.join(TESTS_DIR, filename), tmp_path)
+    shutil.copy(os.path.join(TESTS_DIR, "m_test.sysex"),
+                tmp_path / "copy.sysex")
+
+    assert library.import_directory(SYNTH, tmp_path) == 1
+    assert len(library) == 1
+    patch_id, name = library.find(SYNTH)[0]
+    assert name == '30H3'
+    synth, _, data = library.get(patch_id)
+    assert synth == SYNTH
+    assert len(data) == 256
+
+def test_find(library):
+    patch_id = library.import_file(
+                    SYNTH,
+                    os.path.join(TESTS_DIR, "m_test2.sysex")
+                )
+    _, _, data = library.get(patch_id)
+    cutoff = data[library.synth_manager.get_index(SYNTH)[15]]
+
+    assert library.find(SYNTH, ((15, '=', cutoff),)) == [(patch_id, '30H3')]
+    assert library.find(SYNTH, ((15, '<', cutoff),)) == []
+    assert library.find(SYNTH, name='H3') == [(patch_id, '30H3')]
+    with pytest.raises(ValueError):
+        library.find(SYNTH, ((15, 'OR', 1),))
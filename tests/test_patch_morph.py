@@ -0,0 +1,81 @@
+# Tests for morphing between patches
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(TESTS_DIR, '..', 'synth_controller')
+sys.path.insert(0, CONTROLLER_DIR)
+
+import pytest
+
+import patch_morph
+from patch_morph import PatchMorph
+from patch_library import PatchLibrary
+from fakes import make_patch_manager
+
+START = bytes([0, 10, 5, 0, 7])
+END = bytes([100, 10, 5, 1, 9])
+ORDER = [20, 21, 22, 23, 24]
+
+USE_NUMPY = [False]
+if patch_morph.numpy is not None:
+    USE_NUMPY.append(True)
+
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+def test_interpolates_changed_parameters(use_numpy):
+    sent = []
+    morph = PatchMorph(START, END, ORDER, {23},
+                       lambda *change: sent.append(change), use_numpy)
+    assert len(morph) == 3
+
+    morph.set_position(0.25)
+    assert sent == [(20, 25), (24, 8)]
+    sent.clear()
+    morph.set_position(0.25)
+    assert sent == []
+    morph.set_position(0.5)
+    assert sent == [(20, 50), (23, 1)]
+    assert not morph.done
+    sent.clear()
+    morph.set_position(0.4)
+    assert sent == [(20, 40), (23, 0)]
+    sent.clear()
+    morph.set_position(2)
+    assert sent == [(20, 100), (23, 1), (24, 9)]
+    assert morph.done
+
+
+def test_patch_manager_morph(monkeypatch):
+    patch_manager, _, _, errors = make_patch_manager()
+    assert patch_manager.morph('mopho', 1) is None
+    assert errors.names() == ['NO_LIBRARY']
+
+    monkeypatch.chdir(CONTROLLER_DIR)
+    library = PatchLibrary(patch_manager.synth_manager, ':memory:')
+    patch_manager, midi, controller_manager, _ = make_patch_manager(
+        library=library)
+    controller_manager.ranges['mopho'] = {0: (0, 127)}
+    end = library.add('mopho', bytes([100]) + bytes(255))
+    patch_manager.synth_states['mopho'] = bytearray(256)
+
+    patch_manager.morph('mopho', end)
+    patch_manager.set_morph_position('mopho', 0.5)
+    assert midi.nrpns == [(0, 0, 50)]
+    assert controller_manager.get_state('mopho').get(0) == 50
+    assert patch_manager.synth_states['mopho'][0] == 50
+
+    patch_manager.set_morph_position('mopho', 1)
+    assert midi.nrpns[-1] == (0, 0, 100)
+    # swept back from the end to the original start
+    patch_manager.set_morph_position('mopho', 0.25)
+    patch_manager.set_morph_position('mopho', 0)
+    assert midi.nrpns[2:] == [(0, 0, 25), (0, 0, 0)]
+    assert controller_manager.get_state('mopho').get(0) == 0
+
+    # a new morph starts from the current values
+    other = library.add('mopho', bytes([50]) + bytes(255))
+    patch_manager.morph('mopho', other)
+    patch_manager.set_morph_position('mopho', 1)
+    assert midi.nrpns[-1] == (0, 0, 50)
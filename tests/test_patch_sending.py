@@ -0,0 +1,74 @@
+# Tests for sending only the parameters that differ from the synth
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from fakes import make_patch_manager
+from midi_parsers import NRPN_BYTES
+
+with open(os.path.join(TESTS_DIR, 'm_test2.sysex'), 'rb') as fo:
+    EDIT_BUFFER_DUMP = fo.read()
+
+
+def received_patch():
+    """return patch manager that has received the test patch"""
+    patch_manager, midi, controller_manager, errors = make_patch_manager()
+    patch_manager.parse_sysex(EDIT_BUFFER_DUMP)
+    return patch_manager, midi, controller_manager.get_state('mopho'), errors
+
+
+def test_unknown_state_sends_sysex():
+    patch_manager, midi, _, errors = make_patch_manager()
+    patch_manager.on_send('mopho')
+    assert len(midi.sysex) == 1 and midi.nrpns == []
+    assert patch_manager.last_send == ('sysex', 298, 298)
+    assert errors.names() == ['SEND_REPORT']
+
+
+def test_sends_changes_as_nrpns_until_sysex_is_cheaper():
+    patch_manager, midi, state, _ = received_patch()
+    state.set(20, state.get(20) + 1)
+    state.set(21, state.get(21) + 1)
+    patch_manager.on_send('mopho')
+    assert midi.nrpns == [(0, 20, state.get(20)), (0, 21, state.get(21))]
+    assert patch_manager.last_send == ('nrpn', 2 * NRPN_BYTES, 298)
+
+    # nothing has changed since
+    patch_manager.on_send('mopho')
+    assert len(midi.nrpns) == 2
+
+    changes = 298 // NRPN_BYTES + 1
+    for nrpn in range(changes):
+        state.set(nrpn, (state.get(nrpn) + 1) % 100)
+    patch_manager.on_send('mopho')
+    assert len(midi.nrpns) == 2 and len(midi.sysex) == 1
+    assert patch_manager.last_send == ('sysex', 298, 298)
+
+
+def test_value_over_a_byte_is_reported():
+    patch_manager, midi, state, errors = received_patch()
+    state.set(20, 1000)
+    assert patch_manager.get_state('mopho').get_patch([20, 21])[0] == 1000
+    patch_manager.on_send('mopho')
+    assert midi.nrpns == [] and midi.sysex == []
+    assert errors.names()[-1] == 'VALUE_OUT_OF_RANGE'
+
+
+def test_sent_and_received_values_update_known_state():
+    patch_manager, midi, state, _ = received_patch()
+    # a controller change, sent as it happened
+    state.set(20, 5)
+    patch_manager.note_sent('mopho', 20, 5)
+    # a front panel change on the synth's channel, and one on another
+    state.set(21, 6)
+    patch_manager.note_received(0, 21, 6)
+    patch_manager.note_received(3, 22, 7)
+    patch_manager.on_send('mopho')
+    assert midi.nrpns == []
+
+    state.set(22, 7)
+    patch_manager.on_send('mopho')
+    assert midi.nrpns == [(0, 22, 7)]
@@ -0,0 +1,107 @@
+# Tests for nearest neighbour search over patches
+
+import math
+import os
+import random
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(TESTS_DIR, '..', 'synth_controller')
+sys.path.insert(0, CONTROLLER_DIR)
+
+import pytest
+
+import patch_similarity
+from patch_similarity import SimilarityIndex, range_weights
+from patch_library import PatchLibrary
+from fakes import make_patch_manager
+
+PARAMETERS = 32
+
+
+def random_patches(count, seed=1):
+    rng = random.Random(seed)
+    return [bytes(rng.randrange(128) for _ in range(PARAMETERS))
+            for _ in range(count)]
+
+
+def make_weights():
+    ranges = {nrpn: (0, 127) for nrpn in range(0, PARAMETERS, 2)}
+    ranges[3] = (0, 1)
+    return range_weights(
+        {nrpn: nrpn for nrpn in range(PARAMETERS)},
+        PARAMETERS,
+        ranges,
+        {4: 2.0}
+    )
+
+
+def brute_force(patches, target, weights, k):
+    distances = sorted(
+        (math.sqrt(sum(w * (a - b) ** 2
+                       for w, a, b in zip(weights, patch, target))), i)
+        for i, patch in enumerate(patches)
+    )
+    return [(i, distance) for distance, i in distances[:k]]
+
+
+def build(patches, use_numpy):
+    index = SimilarityIndex(make_weights(), use_numpy)
+    for i, patch in enumerate(patches):
+        index.add(i, patch)
+    return index
+
+
+def test_range_weights():
+    weights = make_weights()
+    assert weights[0] == 1 / 127 ** 2
+    assert weights[4] == 2 / 127 ** 2
+    assert weights[3] == 1.0
+    assert weights[1] == 0
+
+
+def test_python_matches_brute_force():
+    patches = random_patches(300)
+    target = random_patches(1, seed=2)[0]
+    index = build(patches, use_numpy=False)
+    nearest = index.nearest(target, 5)
+    expected = brute_force(patches, target, make_weights(), 5)
+    assert [i for i, _ in nearest] == [i for i, _ in expected]
+    assert [d for _, d in nearest] == pytest.approx([d for _, d in expected])
+    assert index.nearest(patches[7], 1) == [(7, 0.0)]
+    assert len(SimilarityIndex(make_weights()).nearest(target)) == 0
+
+
+@pytest.mark.skipif(patch_similarity.numpy is None,
+                    reason="numpy not installed")
+def test_numpy_matches_python():
+    # more patches than the initial capacity, so the matrix grows
+    patches = random_patches(patch_similarity.INITIAL_CAPACITY + 100)
+    python_index = build(patches, use_numpy=False)
+    numpy_index = build(patches, use_numpy=True)
+    for target in random_patches(5, seed=3):
+        python_nearest = python_index.nearest(target, 10)
+        numpy_nearest = numpy_index.nearest(target, 10)
+        assert [i for i, _ in numpy_nearest] == [i for i, _ in python_nearest]
+        assert [d for _, d in numpy_nearest]\
+               == pytest.approx([d for _, d in python_nearest])
+
+
+def test_find_similar(monkeypatch):
+    patch_manager, _, _, errors = make_patch_manager()
+    assert patch_manager.find_similar('mopho') == []
+    assert errors.names() == ['NO_LIBRARY']
+
+    monkeypatch.chdir(CONTROLLER_DIR)
+    library = PatchLibrary(patch_manager.synth_manager, ':memory:')
+    patch_manager, _, controller_manager, _ = make_patch_manager(
+        library=library)
+    controller_manager.ranges['mopho'] = {0: (0, 127), 1: (0, 127)}
+    near = library.add('mopho', bytes([10, 10]) + bytes(254))
+    far = library.add('mopho', bytes([100, 100]) + bytes(254))
+    state = controller_manager.get_state('mopho')
+    state.set(0, 12)
+    state.set(1, 10)
+    nearest = patch_manager.find_similar('mopho', k=2)
+    assert [patch_id for patch_id, _ in nearest] == [near, far]
+    assert nearest[0][1] == pytest.approx(2 / 127)
@@ -0,0 +1,55 @@
+# Tests for correlating requests to synths with their replies
+
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from patch_transactions import Transactions, TransactionTimeout, gather
+
+
+def make_transactions():
+    sent = []
+    return Transactions(sent.append, timeout=1.0), sent
+
+
+def test_replies_complete_matching_requests():
+    transactions, sent = make_transactions()
+    mopho = transactions.request(('patch', 'mopho'), b'mopho', now=0)
+    tetra = transactions.request(('patch', 'tetra'), b'tetra', now=0)
+    assert sent == [b'mopho', b'tetra']
+
+    assert transactions.parse_sysex(('patch', 'tetra'), b'tetra dump')
+    assert not mopho.done()
+    assert tetra.result() == b'tetra dump'
+    assert not transactions.parse_sysex(('patch', 'tetra'), b'again')
+    assert transactions.parse_sysex(('patch', 'mopho'), b'mopho dump')
+    assert mopho.result() == b'mopho dump'
+
+
+def test_same_route_oldest_first():
+    transactions, _ = make_transactions()
+    first = transactions.request(('patch', 'mopho'), b'', now=0)
+    second = transactions.request(('patch', 'mopho'), b'', now=0)
+    assert transactions.parse_sysex(('patch', 'mopho'), b'one')
+    assert first.result() == b'one' and not second.done()
+    assert transactions.parse_sysex(('patch', 'mopho'), b'two')
+    assert second.result() == b'two'
+
+
+def test_deadline_and_gather():
+    transactions, _ = make_transactions()
+    fast = transactions.request(('patch', 'mopho'), b'', now=0)
+    slow = transactions.request(('patch', 'tetra'), b'', timeout=3, now=0)
+    completed = []
+    gather([fast, slow], completed.append)
+
+    transactions.update(now=2)
+    with pytest.raises(TransactionTimeout):
+        fast.result()
+    assert not completed
+    transactions.parse_sysex(('patch', 'tetra'), b'dump')
+    assert completed == [[fast, slow]]
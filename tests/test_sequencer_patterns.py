@@ -0,0 +1,146 @@
+# Tests for sequencer pattern operations
+
+from array import array
+import os
+import random
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(TESTS_DIR, '..', 'synth_controller')
+sys.path.insert(0, CONTROLLER_DIR)
+
+from sequencer_patterns import rotate, reverse, randomise, OPERATIONS
+from synth_manager import SynthManager
+from synth_state import SynthState
+from patch_library import PatchLibrary
+from fakes import make_patch_manager
+
+
+STEPS = array('H', range(16))
+
+
+def test_rotate():
+    assert list(rotate(STEPS, 1)) == [15] + list(range(15))
+    assert list(rotate(STEPS, -1)) == list(range(1, 16)) + [0]
+    assert rotate(STEPS, 16) == STEPS
+    assert rotate(STEPS, 0) == STEPS
+    assert rotate(array('H'), 3) == array('H')
+
+
+def test_reverse_leaves_original():
+    assert list(reverse(STEPS)) == list(range(15, -1, -1))
+    assert list(STEPS) == list(range(16))
+
+
+def test_randomise_within_range():
+    steps = randomise(STEPS, 10, 20, random.Random(1))
+    assert len(steps) == 16 and steps.typecode == 'H'
+    assert all(10 <= step <= 20 for step in steps)
+    assert set(OPERATIONS) == {'rotate left', 'rotate right', 'reverse',
+                               'randomise'}
+
+
+def test_mopho_tracks_in_patch():
+    synth_manager = SynthManager(
+        ['mopho'],
+        os.path.join(CONTROLLER_DIR, 'synths')
+    )
+    tracks = synth_manager.get_sequencer_tracks('mopho')
+    assert [track[0] for track in tracks] == [120, 136, 152, 168]
+    assert all(len(track) == 16 for track in tracks)
+    assert synth_manager.get_step_range('mopho') == (0, 125)
+    index = synth_manager.get_index('mopho')
+    assert all(nrpn in index for track in tracks for nrpn in track)
+
+    state = SynthState()
+    state.set(121, 7)
+    assert list(state.get_values(tracks[0][:3])) == [0, 7, 0]
+
+
+def known_patch_manager():
+    """return patch manager whose state, with steps on tracks 0 and 1,
+    is known to be on the synth"""
+    patch_manager, midi, controller_manager, errors = make_patch_manager()
+    synth_manager = patch_manager.synth_manager
+    state = controller_manager.get_state('mopho')
+    tracks = synth_manager.get_sequencer_tracks('mopho')
+    for track in tracks[:2]:
+        for step, nrpn in enumerate(track):
+            state.set(nrpn, step + 1)
+    patch_manager.synth_states['mopho'] = bytearray(
+        state.get_patch(synth_manager.get_order('mopho')))
+    return patch_manager, midi, controller_manager, errors, tracks
+
+
+def test_track_edit_sends_only_its_changes():
+    patch_manager, midi, controller_manager, errors, tracks\
+        = known_patch_manager()
+    state = controller_manager.get_state('mopho')
+    # an edit not yet sent
+    state.set(20, 5)
+
+    patch_manager.edit_track('mopho', 'reverse', 0)
+    assert midi.nrpns == [(0, nrpn, 16 - step)
+                          for step, nrpn in enumerate(tracks[0])]
+    assert midi.sysex == [] and errors.names() == []
+
+    midi.nrpns.clear()
+    patch_manager.undo('mopho')
+    assert midi.nrpns == [(0, nrpn, step + 1)
+                          for step, nrpn in reversed(list(
+                              enumerate(tracks[0])))]
+    assert not controller_manager.get_journal('mopho').can_undo
+
+    midi.nrpns.clear()
+    patch_manager.edit_track('mopho', 'copy', 0)
+    patch_manager.edit_track('mopho', 'paste', 2)
+    # only the steps that differ
+    patch_manager.set_track('mopho', 2, [1, 0] + [0] * 14)
+    assert midi.nrpns[:16] == [(0, nrpn, step + 1)
+                               for step, nrpn in enumerate(tracks[2])]
+    assert midi.nrpns[16:] == [(0, nrpn, 0) for nrpn in tracks[2][1:]]
+    assert (0, 20, 5) not in midi.nrpns
+
+
+def test_large_change_sent_as_known_patch():
+    patch_manager, midi, controller_manager, errors, tracks\
+        = known_patch_manager()
+    synth_manager = patch_manager.synth_manager
+    state = controller_manager.get_state('mopho')
+    order = synth_manager.get_order('mopho')
+    # two tracks cleared in one undo entry, then an edit not yet sent
+    patch_manager._set_values('mopho', [
+        0 if nrpn in tracks[0] + tracks[1] else state.get(nrpn)
+        for nrpn in order
+    ])
+    state.set(20, 5)
+
+    patch_manager.undo('mopho')
+    assert midi.nrpns == [] and len(midi.sysex) == 1
+    assert errors.names() == []
+    sent = synth_manager.unpack('mopho', midi.sysex[0][1:-1])
+    index = synth_manager.get_index('mopho')
+    assert [sent[index[nrpn]] for nrpn in tracks[1]] == list(range(1, 17))
+    assert sent[index[20]] == 0
+    assert patch_manager.synth_states['mopho'] == bytearray(sent)
+
+
+def test_track_errors(monkeypatch):
+    patch_manager, midi, _, errors = make_patch_manager()
+    patch_manager.edit_track('mopho', 'paste', 0)
+    patch_manager.edit_track('mopho', 'reverse', 4)
+    patch_manager.paste_library_track('mopho', 0, 1)
+    assert errors.names() == ['NOTHING_COPIED', 'NO_SEQUENCER', 'NO_LIBRARY']
+
+    monkeypatch.chdir(CONTROLLER_DIR)
+    library = PatchLibrary(patch_manager.synth_manager, ':memory:')
+    patch_manager, midi, _, errors = make_patch_manager(library=library)
+    index = patch_manager.synth_manager.get_index('mopho')
+    tracks = patch_manager.synth_manager.get_sequencer_tracks('mopho')
+    data = bytearray(len(index))
+    data[index[tracks[3][0]]] = 9
+    patch_id = library.add('mopho', bytes(data))
+    patch_manager.paste_library_track('mopho', 4, patch_id)
+    assert errors.names() == ['NO_SEQUENCER']
+    patch_manager.paste_library_track('mopho', 3, patch_id)
+    assert midi.nrpns == [(0, tracks[3][0], 9)]
@@ -0,0 +1,43 @@
+# Tests for assigning midi channels to synths
+
+import os
+import shutil
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(TESTS_DIR, '..', 'synth_controller')
+sys.path.insert(0, CONTROLLER_DIR)
+
+from setup_manager import SetupManager
+from synth_manager import SynthManager
+from fakes import FakeUi
+
+
+def test_unassigned_synths_left_out_of_channels(tmp_path, monkeypatch):
+    shutil.copytree(
+        os.path.join(CONTROLLER_DIR, 'setups', 'test'),
+        tmp_path / 'setups' / 'test'
+    )
+    monkeypatch.chdir(tmp_path)
+    ui = FakeUi()
+    setup_manager = SetupManager(ui)
+    setup_manager.assign_channels(['test_synth', 'new_synth'])
+    assert ui.popups == [{'test_synth': 0, 'new_synth': None}]
+    assert setup_manager.channels == {'test_synth': 0}
+
+    # not asked again while the popup is open
+    setup_manager.assign_channels(['new_synth'])
+    assert len(ui.popups) == 1
+
+    setup_manager.on_channel_selection(None, {'new_synth': 5})
+    assert setup_manager.channels == {'test_synth': 0, 'new_synth': 4}
+
+
+def test_synth_keeps_channel_when_unassigned():
+    synth_manager = SynthManager(
+        ['mopho'],
+        os.path.join(CONTROLLER_DIR, 'synths')
+    )
+    synth_manager.set_channels({'mopho': 2})
+    synth_manager.set_channels({'mopho': None})
+    assert synth_manager.get_channel('mopho') == 2
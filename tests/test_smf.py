@@ -0,0 +1,107 @@
+# Tests for standard midi file export and import of automation
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from automation import AutomationRecorder, IN, OUT
+from smf import export_automation, SmfReader, SmfPlayer, SmfError
+from midi import Midi
+from fakes import FakeBackend
+
+import pytest
+
+
+def record(filename, events):
+    """write automation file of (time, direction, channel, nrpn, value)"""
+    clock = [0.0]
+    recorder = AutomationRecorder(filename, clock=lambda: clock[0])
+    for when, direction, channel, nrpn, value in events:
+        clock[0] = when
+        recorder.record(direction, channel, nrpn, value)
+    recorder.close()
+
+
+EVENTS = [
+    (0.0, IN, 0, 20, 5),
+    (0.25, OUT, 1, 300, 1000),
+    (0.5, IN, 0, 21, 127),
+    (1.0, OUT, 1, 301, 0),
+]
+
+
+@pytest.mark.parametrize('file_type', [0, 1])
+def test_round_trip(tmp_path, file_type):
+    automation = str(tmp_path / 'knobs.auto')
+    smf = str(tmp_path / 'knobs.mid')
+    record(automation, EVENTS)
+    export_automation(automation, smf, {'mopho': 0, 'tetra': 1},
+                      file_type=file_type)
+
+    reader = SmfReader(smf)
+    events = list(reader.events())
+    reader.close()
+    assert reader.file_type == file_type
+    assert len(reader.tracks) == (1 if file_type == 0 else 3)
+    assert [e[2:] for e in events] == [
+        ('nrpn', e[2], e[3], e[4]) for e in EVENTS
+    ]
+    assert [e[0] for e in events] == pytest.approx(
+        [e[0] for e in EVENTS], abs=0.001)
+    if file_type == 1:
+        assert [e[1] for e in events] == ['mopho', 'tetra', 'mopho', 'tetra']
+
+
+def test_directions_and_default_channels(tmp_path):
+    automation = str(tmp_path / 'knobs.auto')
+    smf = str(tmp_path / 'knobs.mid')
+    record(automation, EVENTS)
+    export_automation(automation, smf, directions=(IN,))
+
+    reader = SmfReader(smf)
+    events = list(reader.events())
+    reader.close()
+    assert [e[1:] for e in events] == [
+        ('channel 1', 'nrpn', 0, 20, 5),
+        ('channel 1', 'nrpn', 0, 21, 127),
+    ]
+
+
+def test_player_maps_tracks_to_channels(tmp_path):
+    automation = str(tmp_path / 'knobs.auto')
+    smf = str(tmp_path / 'knobs.mid')
+    record(automation, [(0.0, IN, 0, 20, 5), (0.001, IN, 1, 30, 6)])
+    export_automation(automation, smf, {'mopho': 0, 'tetra': 1})
+
+    sent = []
+    player = SmfPlayer(
+        smf,
+        lambda *nrpn: sent.append(nrpn),
+        lambda *cc: sent.append(('cc',) + cc),
+        {'mopho': 4}
+    ).start()
+    assert player.done.wait(2)
+    assert sent == [(4, 20, 5), (1, 30, 6)]
+
+
+def test_midi_plays_every_value(tmp_path):
+    automation = str(tmp_path / 'knobs.auto')
+    smf = str(tmp_path / 'knobs.mid')
+    record(automation, [(i * 0.001, IN, 0, 20, i) for i in range(10)])
+    export_automation(automation, smf, {'mopho': 0})
+
+    backend = FakeBackend()
+    midi = Midi(backend=backend)
+    player = midi.play_smf(smf, {'mopho': 3})
+    assert player.done.wait(2)
+    # sent as played, not coalesced by the nrpn scheduler
+    assert backend.sent == [('nrpn', 3, 20, i) for i in range(10)]
+
+
+def test_not_midi_file(tmp_path):
+    filename = str(tmp_path / 'knobs.auto')
+    record(filename, EVENTS)
+    with pytest.raises(SmfError):
+        SmfReader(filename)
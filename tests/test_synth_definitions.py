@@ -0,0 +1,85 @@
+# Tests for compiling, validating and caching synth definitions
+
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(TESTS_DIR, '..', 'synth_controller')
+sys.path.insert(0, CONTROLLER_DIR)
+
+from synth_manager import SynthManager, SynthData, SynthDefinitionError,\
+                          compile_definition, load_definition
+
+MOPHO_FILE = os.path.join(CONTROLLER_DIR, 'synths', 'mopho.json')
+
+with open(MOPHO_FILE) as fo:
+    MOPHO = json.load(fo)
+
+
+def compile_changed(**changes):
+    data = dict(MOPHO, **changes)
+    return compile_definition(data, 'mopho')
+
+
+def test_mopho_compiles():
+    definition = compile_changed()
+    assert len(definition['nrpn_order']) == MOPHO['parameters']
+    assert len(set(definition['nrpn_order'])) == MOPHO['parameters']
+    assert definition['header'] == b'\x01\x25\x03'
+    assert definition['unpack_function'] == 'mopho_unpack'
+
+
+@pytest.mark.parametrize('changes, message', [
+    ({'nrpn order': [1, 2, 1]}, 'repeated'),
+    ({'nrpn order': list(range(300))}, 'more than'),
+    ({'unpack function': 'missing'}, 'unknown unpack function'),
+    ({'receive header': 'zz'}, 'hex'),
+    ({'name nrpns': [1000, 4]}, 'name nrpn'),
+    ({'option nrpns': {'missing': [1]}}, 'unknown options'),
+])
+def test_invalid_definitions(changes, message):
+    with pytest.raises(SynthDefinitionError, match=message):
+        compile_changed(**changes)
+
+
+def test_cache_used_until_file_changes(tmp_path):
+    filename = str(tmp_path / 'mopho.json')
+    shutil.copy(MOPHO_FILE, filename)
+    cache_file = tmp_path / '__pycache__' / 'mopho.synth.json'
+
+    synth = SynthData(filename, 'mopho')
+    assert cache_file.exists()
+    assert SynthData(filename, 'mopho').nrpn_index == synth.nrpn_index
+    # the cache holds plain json and loads back to the same definition
+    with open(cache_file) as fo:
+        json.load(fo)
+    assert load_definition(filename, 'mopho') == compile_changed()
+
+    # touched but unchanged, found by hash
+    os.utime(filename, ns=(0, 0))
+    assert load_definition(filename, 'mopho') == compile_changed()
+
+    with open(filename, 'w') as fo:
+        json.dump(dict(MOPHO, parameters=300), fo)
+    assert len(load_definition(filename, 'mopho')['nrpn_order']) == 300
+
+
+def test_invalid_definition_found_at_startup(tmp_path):
+    shutil.copy(MOPHO_FILE, str(tmp_path / 'mopho.json'))
+    with open(str(tmp_path / 'broken.json'), 'w') as fo:
+        json.dump(dict(MOPHO, **{'unpack function': 'missing'}), fo)
+
+    synth_manager = SynthManager(['mopho'], str(tmp_path))
+    errors = synth_manager.check_definitions()
+    assert list(errors) == ['broken']
+    assert 'unknown unpack function' in errors['broken']
+
+    # loading it later, as a screen using it is built, does not raise
+    synth_manager.add_synths(['broken'])
+    assert synth_manager.synths['broken'] is None
+    assert synth_manager.options_lists['broken'] == {}
+    assert synth_manager.synths['mopho'] is not None
@@ -0,0 +1,62 @@
+# Tests for routing incoming sysex messages by prefix
+
+import json
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_DIR = os.path.join(TESTS_DIR, '..', 'synth_controller')
+sys.path.insert(0, CONTROLLER_DIR)
+
+from synth_manager import SynthManager, SynthData
+from sysex_dispatcher import SysexDispatcher, parse_identity_reply
+from midi_emulator import IDENTITY_REPLY
+
+
+def test_longest_prefix_and_wildcards():
+    dispatcher = SysexDispatcher()
+    dispatcher.add(b'\x01', 'short')
+    dispatcher.add(b'\x01\x25\x03', 'edit')
+    dispatcher.add((0x41, None, 0x12), 'wild')
+    dispatcher.add((0x41, 0x10, 0x12), 'exact')
+
+    assert dispatcher.find(b'\x01\x25\x03\x00') == 'edit'
+    assert dispatcher.find(b'\x01\x25\x02\x00') == 'short'
+    assert dispatcher.find(b'\x41\x10\x12') == 'exact'
+    assert dispatcher.find(b'\x41\x11\x12') == 'wild'
+    assert dispatcher.find(b'\x42') is None
+    assert dispatcher.find(b'') is None
+
+
+def test_synth_manager_routes():
+    synth_manager = SynthManager(
+        ['mopho', 'default'],
+        os.path.join(CONTROLLER_DIR, 'synths')
+    )
+    assert synth_manager.route(b'\x01\x25\x03\x00') == ('patch', 'mopho')
+    assert synth_manager.route(b'\x01\x25\x02\x00') == ('program', 'mopho')
+    assert synth_manager.route(IDENTITY_REPLY[1:-1]) == ('identity', None)
+    # synths without patch details are never routed to
+    assert synth_manager.find_synth(b'\x7f\x00') is None
+
+
+def test_identity_reply():
+    identity = parse_identity_reply(IDENTITY_REPLY)
+    assert identity['device'] == 0
+    assert identity['manufacturer'] == '01'
+    assert identity['family'] == '2500'
+
+
+def test_wildcard_receive_header(tmp_path):
+    with open(os.path.join(CONTROLLER_DIR, 'synths', 'mopho.json')) as fo:
+        data = json.load(fo)
+    data['receive header'] = '01xx03'
+    filename = str(tmp_path / 'mopho.json')
+    with open(filename, 'w') as fo:
+        json.dump(data, fo)
+    synth = SynthData(filename, 'mopho')
+    with open(os.path.join(TESTS_DIR, 'm_test2.sysex'), 'rb') as fo:
+        dump = fo.read()[1:-1]
+    assert synth.header == b'\x01\x00\x03'
+    other_device = dump[:1] + b'\x26' + dump[2:]
+    assert synth.check_and_unpack(other_device) == synth.check_and_unpack(dump)
@@ -0,0 +1,58 @@
+# Tests for the undo and redo history of parameter changes
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'synth_controller'))
+
+from undo_journal import UndoJournal
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_journal(size=16):
+    clock = Clock()
+    return UndoJournal(size, gesture_time=0.5, clock=clock), clock
+
+
+def test_drag_collapses_into_one_entry():
+    journal, clock = make_journal()
+    for value in range(10, 20):
+        journal.record(5, value - 1, value)
+        clock.now += 0.1
+    clock.now += 1
+    journal.record(5, 19, 30)
+    assert journal.undo() == [(5, 19)]
+    assert journal.undo() == [(5, 9)]
+    assert not journal.can_undo
+    assert journal.redo() == [(5, 19)]
+
+
+def test_patch_load_is_one_entry_and_new_change_drops_redo():
+    journal, clock = make_journal()
+    journal.record(1, 0, 1)
+    journal.record_entry([(2, 0, 5), (3, 0, 6), (4, 0, 7)])
+    assert sorted(journal.undo()) == [(2, 0), (3, 0), (4, 0)]
+    assert journal.can_redo
+    journal.record(1, 1, 2)
+    assert not journal.can_redo
+    assert journal.undo() == [(1, 1)]
+    assert journal.undo() == [(1, 0)]
+
+
+def test_memory_bounded_dropping_oldest_entries():
+    journal, clock = make_journal(size=4)
+    for nrpn in range(10):
+        journal.record(nrpn, 0, 1)
+    undone = []
+    while journal.can_undo:
+        undone += journal.undo()
+    assert undone == [(9, 0), (8, 0), (7, 0), (6, 0)]
+    assert len(journal.nrpns) == 4